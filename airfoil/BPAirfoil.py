@@ -176,7 +176,10 @@ class BPAirfoil:
         (px_ur, py_ur) = air.rotatePoint((0, 0), (px_ur, py_ur), -angle)
         air.rotate(0.)
 
-        #fig, ax = air.plotAirfoil(showPlot=False, showPoints=False, ax=ax)
+        if ax is None:
+            fig, ax = air.plotAirfoil(showPlot=False, showPoints=False)
+        else:
+            fig = ax.figure
 
         ax.plot([px_ol, px_ul, px_ur, px_or, px_ol], [py_ol, py_ul, py_ur, py_or, py_ol], 'rx-', label='cabin', color='#AD031B')
         #plt.show()
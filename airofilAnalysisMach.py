@@ -6,6 +6,7 @@ from datetime import datetime
 
 from cfd.SU2 import SU2
 from cfd.CFDrun import CFDrun
+from cfd.ContinuationSweep import ContinuationSweep
 from constants import *
 
 import matplotlib.pyplot as plt
@@ -48,44 +49,36 @@ config['REYNOLDS_LENGTH'] = str(1.)
 ##################################
 ### naca Test ca, cd over mach ###
 
-su2 = SU2(SU2_BIN_PATH, used_cores=SU2_USED_CORES, mpi_exec=OS_MPI_COMMAND)
+# mesh once, then every mach number restarts from the solution of its neighbour
+sweep = ContinuationSweep('analysis_mach', parameter='MACH_NUMBER', used_cores=SU2_USED_CORES)
+cfd = sweep.meshRun
+cfd.load_airfoil_from_file(INPUT_DIR + '/vfw-va2.dat')
+#cfd.construct2d_generate_mesh(scale=REF_LENGTH)
+cfd.gmsh_generate_mesh(scale=REF_LENGTH)
+cfd.su2_fix_mesh()
 
-ouputF = open(WORKING_DIR + '/' + 'machResult_' + datetime.now().strftime('%Y-%m-%d_%H_%M_%S') + '.csv', 'w')
-ouputF.write('machNr,AOA,CL,CD,CM,E,Iterations,Time(min)\n')
-
-
-
-for mach in MACH_NR:
-    projectName = 'analysis_mach_%0.3f' % (mach)
-    projectDir = WORKING_DIR + '/' + projectName
-    #create project dir if necessary
-    if not os.path.isdir(projectDir):
-        os.mkdir(projectDir)
-
-    cfd = CFDrun(projectName, used_cores=SU2_USED_CORES)
+sweepResults = sweep.run(MACH_NR, config)
 
-    cfd.load_airfoil_from_file(INPUT_DIR + '/vfw-va2.dat')
-    #cfd.construct2d_generate_mesh(scale=REF_LENGTH)
-    cfd.gmsh_generate_mesh(scale=REF_LENGTH)
-    cfd.su2_fix_mesh()
-
-    config['MACH_NUMBER'] = str(mach)
-    cfd.su2_solve(config)
-
-    results = cfd.su2_parse_iteration_result()
-    cfd.clean_up()
-
-    print('totalCL: ' + str(results['CL']))
-    print('totalCD: ' + str(results['CD']))
-
-    ouputF.write(str(mach / 100.) + ','
-                 + str(results['AOA']) + ','
-                 + str(results['CL']) + ','
-                 + str(results['CD']) + ','
-                 + str(results['CMz']) + ','
-                 + str(results['CL/CD']) + ','
-                 + str(results['Iteration']) + ','
-                 + str(results['Time(min)']) + '\n')
-    ouputF.flush()
+timeStamp = datetime.now().strftime('%Y-%m-%d_%H_%M_%S')
+sweep.write_report(WORKING_DIR + '/' + 'machSweepReport_' + timeStamp + '.csv')
+ouputF = open(WORKING_DIR + '/' + 'machResult_' + timeStamp + '.csv', 'w')
+ouputF.write('machNr,AOA,CL,CD,CM,E,Iterations,Time(min)\n')
 
-print('done')
\ No newline at end of file
+for r in sweepResults:
+    results = r['results']
+    print('totalCL: ' + str(results.get('CL')))
+    print('totalCD: ' + str(results.get('CD')))
+
+    ouputF.write(str(r['value'] / 100.) + ','
+                 + str(results.get('AOA')) + ','
+                 + str(results.get('CL')) + ','
+                 + str(results.get('CD')) + ','
+                 + str(results.get('CMz')) + ','
+                 + str(results.get('CL/CD')) + ','
+                 + str(results.get('Iteration')) + ','
+                 + str(results.get('Time(min)')) + '\n')
+
+ouputF.close()
+# the shared mesh is not needed any more, frees the scratch dir
+cfd.clean_up()
+print('done')
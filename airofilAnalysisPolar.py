@@ -4,9 +4,11 @@ __status__ = "Development"
 
 from datetime import datetime
 import math
+import sys
 
 from cfd.SU2 import SU2
 from cfd.CFDrun import CFDrun
+from cfd.ContinuationSweep import ContinuationSweep
 from constants import *
 
 import matplotlib.pyplot as plt
@@ -76,46 +78,44 @@ config['RELAXATION_FACTOR_TURB'] = str(1.)
 ##################################
 ### naca Test ca, cd over mach ###
 
-outputF = open(WORKING_DIR + '/' + 'aoaResult_' + datetime.now().strftime('%Y-%m-%d_%H_%M_%S') + '.csv', 'w')
+# mesh once, then every AOA restarts from the solution of its neighbour
+sweep = ContinuationSweep('analysis_aoa', parameter='AOA', used_cores=SU2_USED_CORES)
+cfd = sweep.meshRun
+cfd.load_airfoil_from_file(INPUT_DIR + '/airfoil.dat')
+#cfd.load_airfoil_from_file(INPUT_DIR + '/vfw-va2.dat')
+cfd.c2d.pointsInNormalDir = 80
+cfd.c2d.pointNrAirfoilSurface = 200
+cfd.c2d.reynoldsNum = REYNOLD
+cfd.construct2d_generate_mesh(scale=SCALE, plot=False)
+#cfd.gmsh_generate_mesh(scale=REF_LENGTH)
+cfd.su2_fix_mesh()
+if not cfd.check_mesh_quality():
+    print('ERROR: mesh rejected by quality gate')
+    sys.exit(1)
+
+sweepResults = sweep.run(AOA, config)
+
+timeStamp = datetime.now().strftime('%Y-%m-%d_%H_%M_%S')
+sweep.write_report(WORKING_DIR + '/' + 'aoaSweepReport_' + timeStamp + '.csv')
+outputF = open(WORKING_DIR + '/' + 'aoaResult_' + timeStamp + '.csv', 'w')
 outputF.write('machNr,AOA,CL,CD,CM,E,Iterations,Time(min)\n')
 
-for a in AOA:
-
-    projectName = 'analysis_aoa_%0.4f' % (a)
-    projectDir = WORKING_DIR + '/' + projectName
-    #create project dir if necessary
-    if not os.path.isdir(projectDir):
-        os.mkdir(projectDir)
-
-    cfd = CFDrun(projectName, used_cores=SU2_USED_CORES)
-
-    cfd.load_airfoil_from_file(INPUT_DIR + '/airfoil.dat')
-    #cfd.load_airfoil_from_file(INPUT_DIR + '/vfw-va2.dat')
-    cfd.c2d.pointsInNormalDir = 80
-    cfd.c2d.pointNrAirfoilSurface = 200
-    cfd.c2d.reynoldsNum = REYNOLD
-    cfd.construct2d_generate_mesh(scale=SCALE, plot=False)
-    #cfd.gmsh_generate_mesh(scale=REF_LENGTH)
-    cfd.su2_fix_mesh()
-
-
-    config['AOA'] = str(a)
-    cfd.su2_solve(config)
-
-    results = cfd.su2_parse_iteration_result()
-    cfd.clean_up()
-
-    print('totalCL: ' + str(results['CL']))
-    print('totalCD: ' + str(results['CD']))
+for r in sweepResults:
+    results = r['results']
+    if not r['valid']:
+        print('WARNING: AOA ' + str(r['value']) + ' did not converge')
+    print('totalCL: ' + str(results.get('CL')))
+    print('totalCD: ' + str(results.get('CD')))
     outputF.write(str(MACH_NR) + ','
-                  + str(a) + ','
-                  + str(results['CL']) + ','
-                  + str(results['CD']) + ','
-                  + str(results['CMz']) + ','
-                  + str(results['CL/CD']) + ','
-                  + str(results['Iteration']) + ','
-                  + str(results['Time(min)']) + '\n')
-    outputF.flush()
+                  + str(r['value']) + ','
+                  + str(results.get('CL')) + ','
+                  + str(results.get('CD')) + ','
+                  + str(results.get('CMz')) + ','
+                  + str(results.get('CL/CD')) + ','
+                  + str(results.get('Iteration')) + ','
+                  + str(results.get('Time(min)')) + '\n')
 
 outputF.close()
-print('done')
\ No newline at end of file
+# the shared mesh is not needed any more, frees the scratch dir
+cfd.clean_up()
+print('done')
@@ -0,0 +1,82 @@
+__author__ = "Juri Bieler"
+__version__ = "0.0.1"
+__status__ = "Development"
+
+# ==============================================================================
+# description     :chains the surface sensitivities of an SU2 discrete adjoint
+#                  with the shape change of a parametrized airfoil, giving
+#                  d(coefficient)/d(parameter) without a flow solve per parameter
+# date            :2018-08-23
+# notes           :the shape change per parameter comes from cheap geometric
+#                  finite differences of the airfoil coordinates, every mesh
+#                  surface point moves with the normal displacement of the
+#                  nearest contour point, tangential movement does not change
+#                  the shape and is dropped.
+#                  SU2 6.x writes 'Sensitivity': dJ/dn per unit length along the
+#                  normal of the marker, which points out of the flow domain
+#                  (into the airfoil), so it is weighted with the dual edge
+#                  length and the sign flipped. SU2 7 also writes the nodal
+#                  vector dJ/dx, dJ/dy, that one is taken as it is
+# python_version  :3.6
+# ==============================================================================
+
+import numpy as np
+
+
+def contour_normals(top, buttom):
+    # top from leading to trailing edge, buttom back (like BPAirfoil writes them), returns the closed
+    # contour and its outward unit normals, the tangents are taken per side so the edges stay sharp
+    normals = []
+    for coords, side in [(top, 1.), (buttom, -1.)]:
+        coords = np.asarray(coords, dtype=float)
+        tangent = np.gradient(coords, axis=0)
+        normal = np.column_stack((-tangent[:, 1], tangent[:, 0]))
+        normal /= np.maximum(np.linalg.norm(normal, axis=1), 1e-14).reshape(-1, 1)
+        # the top side looks up, the buttom side down
+        if side * np.sum(normal[:, 1]) < 0.:
+            normal *= -1.
+        normals.append(normal)
+    return np.vstack((np.asarray(top, dtype=float), np.asarray(buttom, dtype=float))), np.vstack(normals)
+
+
+def dual_lengths(points, edges):
+    # half the length of the adjacent marker edges per point, indexed like points
+    points = np.asarray(points, dtype=float)
+    edges = np.asarray(edges, dtype=np.int64).reshape(-1, 2)
+    lengths = np.linalg.norm(points[edges[:, 1], :2] - points[edges[:, 0], :2], axis=1)
+    return np.bincount(edges.ravel(), weights=np.repeat(lengths / 2., 2), minlength=len(points))
+
+
+class AdjointGradient:
+
+    def __init__(self, sensitivity, top, buttom, scale=1.):
+        # sensitivity: surface sensitivities of one coefficient (see SU2.load_surface_adjoint) in mesh units,
+        # without the nodal vector it needs 'length' (dual_lengths of the points),
+        # top, buttom: coordinates of the solved design, scale: mesh size / airfoil coordinates
+        self.scale = scale
+        self.contour, self.normals = contour_normals(top, buttom)
+        surface = np.column_stack((sensitivity['x'], sensitivity['y'])) / scale
+        # nearest contour point of every mesh surface point
+        distances = np.sum((surface[:, None, :] - self.contour[None, :, :]) ** 2, axis=2)
+        self.nearest = np.argmin(distances, axis=1)
+        self.maxDistance = np.sqrt(np.max(distances[np.arange(len(surface)), self.nearest])) if len(surface) > 0 else 0.
+        if 'sensX' in sensitivity:
+            # dJ/dx, dJ/dy of the points projected on the normal
+            normalSens = sensitivity['sensX'] * self.normals[self.nearest, 0] \
+                         + sensitivity['sensY'] * self.normals[self.nearest, 1]
+        else:
+            if 'length' not in sensitivity:
+                raise ValueError('surface sensitivity density without the dual edge lengths of its points')
+            # density along the inward normal of the solver -> dJ/dn outward of the point
+            normalSens = -np.asarray(sensitivity['sens'], dtype=float) * np.asarray(sensitivity['length'], dtype=float)
+        # summed up per contour point, a gradient is then one dot product per parameter
+        self.weights = np.bincount(self.nearest, weights=normalSens, minlength=len(self.contour))
+
+    def get_derivative(self, top, buttom, step):
+        # top, buttom: coordinates of the design with one parameter moved by step, same point count and
+        # stations as the solved one, returns d(coefficient)/d(parameter)
+        contour = np.vstack((np.asarray(top, dtype=float), np.asarray(buttom, dtype=float)))
+        if contour.shape != self.contour.shape:
+            raise ValueError('perturbed contour has ' + str(len(contour)) + ' points instead of ' + str(len(self.contour)))
+        normalDisplacement = np.sum((contour - self.contour) * self.normals, axis=1) * self.scale / step
+        return float(np.dot(self.weights, normalDisplacement))
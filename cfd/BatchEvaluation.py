@@ -0,0 +1,243 @@
+__author__ = "Juri Bieler"
+__version__ = "0.0.1"
+__status__ = "Development"
+
+# ==============================================================================
+# description     :evaluates independent airfoil/flow condition cases in a
+#                  process pool, every case in its own project dir
+# date            :2018-08-17
+# notes           :design: {'file': 'dataIn/foil.dat'} or {'top': .., 'buttom': ..},
+#                  optional 'name', 'gmsh' and 'c2d' (attribute overrides
+#                  of the mesher); condition: SU2 config dict
+# python_version  :3.6
+# ==============================================================================
+
+import time
+import shutil
+import traceback
+import numpy as np
+from concurrent.futures import ProcessPoolExecutor, wait, FIRST_COMPLETED
+from concurrent.futures.process import BrokenProcessPool
+
+from cfd.CFDrun import CFDrun
+from cfd.ConvergenceMonitor import ConvergenceMonitor, SolverFailure
+from cfd.RunLedger import RunLedger
+from constants import *
+
+
+def evaluate_case(case):
+    # runs in the worker process (pool or WorkQueue), never raises so one broken case does not take
+    # down the batch
+    result = dict()
+    result['design'] = case['design']
+    result['condition'] = case['condition']
+    result['attempt'] = case['attempt']
+    result['projectDir'] = WORKING_DIR + '/' + case['projectName']
+    result['results'] = dict()
+    result['stopReason'] = ''
+    result['error'] = ''
+    # solver failures and rejected meshes are not worth a retry
+    result['final'] = False
+    startTime = time.time()
+    cfd = None
+    try:
+        design = case['designDef']
+        # no left overs of an earlier attempt of the same case
+        RunLedger.reset_project_dir(result['projectDir'])
+        cfd = CFDrun(case['projectName'], used_cores=case['cores'])
+        if case['solverCommand'] is not None:
+            cfd.su2.cfdCommand = case['solverCommand']
+        cfd.meshQualityGate = case['meshQualityGate']
+        cfd.outputProfile = case['outputProfile']
+        if case['earlyTermination']:
+            cfd.su2.monitor = ConvergenceMonitor()
+        if 'file' in design:
+            cfd.load_airfoil_from_file(design['file'])
+        else:
+            # lists once the case went through json (WorkQueue)
+            cfd.set_airfoul_coords(np.asarray(design['top']), np.asarray(design['buttom']))
+
+        if case['mesher'] == 'gmsh':
+            for key, value in design.get('gmsh', dict()).items():
+                setattr(cfd.gmsh, key, value)
+            cfd.gmsh_generate_mesh(scale=case['scale'])
+            meshError = cfd.gmsh.errorFlag
+        else:
+            for key, value in design.get('c2d', dict()).items():
+                setattr(cfd.c2d, key, value)
+            cfd.construct2d_generate_mesh(scale=case['scale'])
+            meshError = cfd.c2d.errorFlag
+        if meshError:
+            result['error'] = 'mesh generation failed'
+        elif cfd.su2_fix_mesh():
+            result['error'] = 'mesh fix failed'
+        else:
+            try:
+                result['stopReason'] = cfd.su2_solve(case['config'])
+                if cfd.meshRejected:
+                    result['error'] = 'mesh rejected by quality gate'
+                    result['final'] = True
+                else:
+                    result['results'] = cfd.su2_parse_iteration_result()
+                    if not CFDrun.results_valid(result['results']):
+                        result['error'] = 'invalid results (cd out of range)'
+            except SolverFailure as e:
+                result['error'] = type(e).__name__ + ': ' + str(e)
+                result['final'] = True
+        cfd.clean_up()
+    except Exception as e:
+        result['error'] = type(e).__name__ + ': ' + str(e)
+        result['traceback'] = traceback.format_exc()
+        if cfd is not None and cfd.scratchDir is not None:
+            # do not leave the failed case in RAM
+            shutil.rmtree(cfd.scratchDir, ignore_errors=True)
+    result['time'] = time.time() - startTime
+    return result
+
+
+def failed_result(case, error):
+    # result dict of a case that did not run to the end, e.g. its worker died
+    result = dict()
+    result['design'] = case['design']
+    result['condition'] = case['condition']
+    result['attempt'] = case['attempt']
+    result['projectDir'] = WORKING_DIR + '/' + case['projectName']
+    result['results'] = dict()
+    result['stopReason'] = ''
+    result['error'] = error
+    result['final'] = True
+    result['time'] = 0.
+    return result
+
+
+class BatchEvaluator:
+
+    def __init__(self, batch_name, total_cores=SU2_USED_CORES, cores_per_case=1):
+        self.batchName = batch_name
+        # the pool runs total_cores // cores_per_case cases at once
+        self.totalCores = total_cores
+        self.coresPerCase = cores_per_case
+        # failed cases are repeated this many times in a fresh project dir
+        self.retries = 1
+        # 'construct2d' or 'gmsh'
+        self.mesher = 'construct2d'
+        self.scale = 1.
+        self.meshQualityGate = 'reject'
+        self.outputProfile = 'lean'
+        self.earlyTermination = True
+        # replaces SU2.cfdCommand in the workers, e.g. the stand-in solver
+        self.solverCommand = None
+
+    def get_worker_count(self):
+        return max(1, self.totalCores // max(1, self.coresPerCase))
+
+    def make_case(self, i_design, i_condition, design, condition, attempt):
+        name = design.get('name', 'd%04d' % i_design)
+        projectName = self.batchName + '_' + name + '_c%02d' % i_condition
+        if attempt > 0:
+            projectName += '_retry%d' % attempt
+        case = dict()
+        case['design'] = i_design
+        case['condition'] = i_condition
+        case['attempt'] = attempt
+        case['projectName'] = projectName
+        case['designDef'] = design
+        case['config'] = condition
+        case['cores'] = self.coresPerCase
+        case['mesher'] = self.mesher
+        case['scale'] = self.scale
+        case['meshQualityGate'] = self.meshQualityGate
+        case['outputProfile'] = self.outputProfile
+        case['earlyTermination'] = self.earlyTermination
+        case['solverCommand'] = self.solverCommand
+        return case
+
+    def evaluate(self, designs, conditions):
+        # generator, yields one result dict per design x condition as soon as it is final:
+        # {'design', 'condition', 'attempt', 'projectDir', 'results', 'stopReason', 'error', 'time'}
+        cases = [self.make_case(iD, iC, d, c, 0)
+                 for iD, d in enumerate(designs) for iC, c in enumerate(conditions)]
+        workers = self.get_worker_count()
+        print('batch ' + self.batchName + ': ' + str(len(cases)) + ' case(s) on ' + str(workers)
+              + ' worker(s) with ' + str(self.coresPerCase) + ' core(s) each')
+        self._executor = ProcessPoolExecutor(max_workers=workers)
+        # cases waiting for the shared pool and for a single worker pool, shared and isolated cases
+        # together never run on more than workers
+        self._sharedQueue = cases
+        self._isolatedQueue = []
+        # future -> (case, its own single worker pool or None for the shared pool)
+        running = dict()
+        try:
+            while len(running) > 0 or len(self._sharedQueue) > 0 or len(self._isolatedQueue) > 0:
+                self._fill(running, workers)
+                done, notDone = wait(list(running.keys()), return_when=FIRST_COMPLETED)
+                # (case, result) of the cases that finished normally
+                finished = []
+                sharedBroken = []
+                for future in done:
+                    if future not in running:
+                        continue
+                    case, isolated = running.pop(future)
+                    if isolated is not None:
+                        isolated.shutdown(wait=False)
+                    try:
+                        finished.append((case, future.result()))
+                    except BrokenProcessPool:
+                        if isolated is not None:
+                            # the case killed its own worker, so it is the broken one
+                            retryCase = self._retry_case(case)
+                            if retryCase is None:
+                                yield failed_result(case, 'worker process died')
+                            else:
+                                self._isolatedQueue.append(retryCase)
+                            continue
+                        sharedBroken.append(case)
+                if len(sharedBroken) > 0:
+                    # a worker died hard and took the shared pool with it, it is unknown which case caused
+                    # it, so every case of that pool without a result runs again in its own worker
+                    suspects = list(sharedBroken)
+                    for future in [f for f, (c, iso) in running.items() if iso is None]:
+                        case = running.pop(future)[0]
+                        if future.done() and not future.cancelled() and future.exception() is None:
+                            finished.append((case, future.result()))
+                        else:
+                            suspects.append(case)
+                    print('WARNING: batch worker died, rerun ' + str(len(suspects)) + ' case(s) isolated')
+                    self._executor.shutdown(wait=False)
+                    self._executor = ProcessPoolExecutor(max_workers=workers)
+                    self._isolatedQueue.extend(suspects)
+                for case, result in finished:
+                    if result['error'] != '' and not result['final'] and case['attempt'] < self.retries:
+                        print('WARNING: case ' + case['projectName'] + ' failed (' + result['error'] + '), retry')
+                        self._sharedQueue.append(self._retry_case(case))
+                        continue
+                    yield result
+        finally:
+            self._executor.shutdown(wait=True)
+            for case, isolated in running.values():
+                if isolated is not None:
+                    isolated.shutdown(wait=True)
+
+    def _fill(self, running, workers):
+        # starts waiting cases while less than workers run, suspects of a broken pool first
+        while len(running) < workers and len(self._isolatedQueue) > 0:
+            case = self._isolatedQueue.pop(0)
+            executor = ProcessPoolExecutor(max_workers=1)
+            running[executor.submit(evaluate_case, case)] = (case, executor)
+        while len(running) < workers and len(self._sharedQueue) > 0:
+            case = self._sharedQueue.pop(0)
+            running[self._executor.submit(evaluate_case, case)] = (case, None)
+
+    def _retry_case(self, case):
+        if case['attempt'] >= self.retries:
+            return None
+        return self.make_case(case['design'], case['condition'], case['designDef'], case['config'], case['attempt'] + 1)
+
+
+def evaluate_batch(designs, conditions, batch_name='batch', total_cores=SU2_USED_CORES, cores_per_case=1, **settings):
+    # runs every design at every condition, yields the results as they finish,
+    # settings are BatchEvaluator attributes, e.g. mesher='gmsh', retries=2
+    evaluator = BatchEvaluator(batch_name, total_cores=total_cores, cores_per_case=cores_per_case)
+    for key, value in settings.items():
+        setattr(evaluator, key, value)
+    return evaluator.evaluate(designs, conditions)
@@ -0,0 +1,132 @@
+__author__ = "Juri Bieler"
+__version__ = "0.0.1"
+__status__ = "Development"
+
+# ==============================================================================
+# description     :runs the CFDrun steps mesh -> fix -> solve -> parse as a
+#                  pipeline, so the next design is meshed while the current
+#                  one is solved
+# date            :2018-08-16
+# notes           :the solve workers times the cores of each CFDrun should not
+#                  exceed SU2_USED_CORES
+# python_version  :3.8
+# ==============================================================================
+
+import threading
+import queue
+import time
+
+from cfd.ConvergenceMonitor import SolverFailure
+
+
+_STOP = None
+
+
+class CFDPipeline:
+
+    def __init__(self, mesh_workers=2, fix_workers=1, solve_workers=1, parse_workers=1, queue_size=2):
+        # (name, function, worker count), every function works on the job dict in place
+        self.stages = [('mesh', self._mesh, mesh_workers),
+                       ('fix', self._fix, fix_workers),
+                       ('solve', self._solve, solve_workers),
+                       ('parse', self._parse, parse_workers)]
+        # jobs waiting between two stages, a full queue blocks the stage in front of it
+        self.queueSize = queue_size
+        # called with every finished job, from the parse worker thread
+        self.onResult = None
+        self.jobs = []
+
+    def add_job(self, cfd, config, mesh_func=None):
+        # mesh_func(cfd) builds the mesh, construct2d with the CFDrun settings by default
+        job = dict()
+        job['id'] = len(self.jobs)
+        job['cfd'] = cfd
+        job['config'] = config
+        job['meshFunc'] = mesh_func if mesh_func is not None else (lambda c: c.construct2d_generate_mesh())
+        job['error'] = ''
+        job['stopReason'] = ''
+        job['results'] = dict()
+        job['times'] = dict()
+        self.jobs.append(job)
+        return job['id']
+
+    def _mesh(self, job):
+        job['meshFunc'](job['cfd'])
+        if job['cfd'].c2d.errorFlag or job['cfd'].gmsh.errorFlag:
+            job['error'] = 'mesh generation failed'
+
+    def _fix(self, job):
+        if job['cfd'].su2_fix_mesh():
+            job['error'] = 'mesh fix failed'
+
+    def _solve(self, job):
+        cfd = job['cfd']
+        try:
+            job['stopReason'] = cfd.su2_solve(job['config'])
+        except SolverFailure as e:
+            job['error'] = type(e).__name__ + ': ' + str(e)
+        if cfd.meshRejected:
+            job['error'] = 'mesh rejected by quality gate'
+
+    def _parse(self, job):
+        if job['error'] == '':
+            job['results'] = job['cfd'].su2_parse_iteration_result()
+        job['cfd'].clean_up()
+
+    def _worker(self, stage_index, in_queue, out_queue, state):
+        name, func, workers = self.stages[stage_index]
+        while True:
+            job = in_queue.get()
+            if job is _STOP:
+                break
+            # failed jobs only pass the remaining stages, the parse stage still cleans up
+            if job['error'] == '' or name == 'parse':
+                startTime = time.time()
+                try:
+                    func(job)
+                except Exception as e:
+                    job['error'] = name + ' stage: ' + type(e).__name__ + ': ' + str(e)
+                job['times'][name] = time.time() - startTime
+            if out_queue is not None:
+                out_queue.put(job)
+            elif self.onResult is not None:
+                try:
+                    self.onResult(job)
+                except Exception as e:
+                    print('ERROR: pipeline result callback failed: ' + str(e))
+        # the last worker of a stage stops all workers of the next one
+        with state['lock']:
+            state['running'][stage_index] -= 1
+            last = state['running'][stage_index] == 0
+        if last and out_queue is not None:
+            for i in range(0, self.stages[stage_index + 1][2]):
+                out_queue.put(_STOP)
+
+    def run(self):
+        # returns the finished jobs in submission order, every job holds 'results', 'error',
+        # 'stopReason' and the seconds spent per stage in 'times'
+        queues = [queue.Queue(maxsize=self.queueSize) for i in range(0, len(self.stages))]
+        state = {'lock': threading.Lock(), 'running': [workers for name, func, workers in self.stages]}
+        threads = []
+        for i, (name, func, workers) in enumerate(self.stages):
+            outQueue = queues[i + 1] if i + 1 < len(self.stages) else None
+            for w in range(0, workers):
+                t = threading.Thread(target=self._worker, args=(i, queues[i], outQueue, state),
+                                     name='pipeline-' + name + '-' + str(w))
+                t.daemon = True
+                t.start()
+                threads.append(t)
+        print('pipeline: ' + str(len(self.jobs)) + ' job(s), workers per stage: '
+              + ', '.join(name + '=' + str(workers) for name, func, workers in self.stages))
+        for job in self.jobs:
+            queues[0].put(job)
+        for i in range(0, self.stages[0][2]):
+            queues[0].put(_STOP)
+        for t in threads:
+            t.join()
+        jobs = self.jobs
+        self.jobs = []
+        failed = sum(1 for job in jobs if job['error'] != '')
+        if failed > 0:
+            print('WARNING: ' + str(failed) + ' pipeline job(s) failed')
+        return jobs
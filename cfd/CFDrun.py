@@ -3,29 +3,78 @@ __version__ = "0.0.1"
 __status__ = "Development"
 
 import os
+import math
+import shutil
+import fnmatch
+import tempfile
 
 from meshing.Gmsh import Gmsh
 from airfoil.Airfoil import Airfoil
 from cfd.SU2 import SU2
+from cfd.SU2Process import run_processes
 from airfoil.BPAirfoil import BPAirfoil
 from meshing.Construct2d import Construct2d
 from meshing.Construct2dParser import Construct2dParser
+from meshing.MeshFix import MeshFix
+from meshing.MeshQuality import MeshQuality
+from cfd.StageTimer import StageTimer
+from cfd.AdjointGradient import dual_lengths
 
 from constants import *
 
 
+# files copied from a scratch dir to the project dir by clean_up, restart_flow.dat only with keepRestart
+SCRATCH_KEEP_FILES = ['history*', 'forces_breakdown.dat', 'airfoil.txt', '*.cfg', 'convergence.log', 'surface_adjoint*']
+# additionally kept once a run got its full output (see promote_full_output)
+FULL_OUTPUT_FILES = ['flow.*', 'surface_flow.*']
+
+
 class CFDrun:
 
-    def __init__(self, project_name, used_cores=SU2_USED_CORES):
+    def __init__(self, project_name, used_cores=SU2_USED_CORES, warm_start=None, scratch_dir=SCRATCH_DIR):
+        # results that are kept go here
+        self.persistentDir = WORKING_DIR + '/' + project_name
         # create project dir if necessary
-        self.projectDir = WORKING_DIR + '/' + project_name
-        # create project dir if necessary
-        if not os.path.isdir(self.projectDir):
-            os.mkdir(self.projectDir)
+        if not os.path.isdir(self.persistentDir):
+            os.mkdir(self.persistentDir)
+        # all files of the run are written here, without scratch dir it is the persistent one
+        self.projectDir = self.persistentDir
+        self.scratchDir = None
+        if scratch_dir is not None:
+            if os.path.isdir(scratch_dir):
+                self.scratchDir = tempfile.mkdtemp(prefix=project_name + '_', dir=scratch_dir)
+                self.projectDir = self.scratchDir
+            else:
+                print('WARNING: scratch dir ' + scratch_dir + ' not found, run in ' + self.persistentDir)
+        # file name patterns clean_up copies out of the scratch dir
+        self.keepFiles = list(SCRATCH_KEEP_FILES)
+        self.keepRestart = False
         self.su2 = SU2(SU2_BIN_PATH, used_cores=used_cores, mpi_exec=OS_MPI_COMMAND)
+        self.su2.launcher.bindTo = MPI_BIND_TO
+        self.su2.launcher.hosts = MPI_HOSTS
         self.foilCoord = None
         self.gmsh = Gmsh(GMSH_EXE_PATH)
         self.c2d = Construct2d(CONSTRUCT2D_EXE_PATH)
+        # 'native': fix the mesh in python, 'su2': use SU2_MSH, 'cross_check': both and compare
+        self.meshFixMode = 'native'
+        self.c2dParser = None
+        self.meshScale = 1.
+        self.meshFix = None
+        # 'reject': skip the solver for bad meshes, 'flag': only print the violations, 'off': no check
+        self.meshQualityGate = 'reject'
+        self.meshQuality = MeshQuality()
+        self.meshRejected = False
+        # optional WarmStart shared between successive designs
+        self.warmStart = warm_start
+        self.warmStarted = False
+        # mesh the solver runs on, relative to the project dir or absolute
+        self.meshFileName = 'airfoilMeshFixed.su2'
+        # 'full': all field output, 'lean': history and forces breakdown only (see SU2.OUTPUT_PROFILES)
+        self.outputProfile = 'full'
+        # wall time, cpu time and peak memory of every step, per run and summed up over all runs
+        self.timer = StageTimer(project_name,
+                                manifest_path=self.persistentDir + '/stage_times.json',
+                                csv_path=WORKING_DIR + '/stage_times.csv')
 
     def load_airfoil_from_file(self, file_name):
         self.airfoil = Airfoil(file_name)
@@ -43,19 +92,28 @@ class CFDrun:
 
     def gmsh_generate_mesh(self, scale=1.):
         print('start meshing with gmsh...')
-        self.gmsh.generate_geo_file(self.foilCoord, 'airfoilMesh.geo', 1000, working_dir=self.projectDir, scale=scale)
-        self.gmsh.run_2d_geo_file('airfoilMesh.geo', 'airfoilMesh.su2', working_dir=self.projectDir)
+        with self.timer.stage('gmsh'):
+            self.gmsh.generate_geo_file(self.foilCoord, 'airfoilMesh.geo', 1000, working_dir=self.projectDir, scale=scale)
+            self.gmsh.run_2d_geo_file('airfoilMesh.geo', 'airfoilMesh.su2', working_dir=self.projectDir)
+        self.c2dParser = None
+        self.meshScale = scale
 
     def construct2d_generate_mesh(self, scale=1., plot=False, wake_extension=0):
         print('start meshing with construct2d...')
         self.airfoil.write_to_dat('airfoil.dat', working_dir=self.projectDir)
 
-        self.c2d.run_mesh_generatoin('airfoil.dat', working_dir=self.projectDir)
+        with self.timer.stage('construct2d', points=self.c2d.pointNrAirfoilSurface, normal=self.c2d.pointsInNormalDir):
+            self.c2d.run_mesh_generatoin('airfoil.dat', working_dir=self.projectDir)
         #p2_to_su2_ogrid(self.projectDir + '/' + 'airfoil.p3d')
-        c2dParser = Construct2dParser(self.projectDir + '/' + 'airfoil.p3d')
-        if wake_extension > 0:
-            c2dParser.extend_wake(wake_extension)
-        c2dParser.p3d_to_su2_cgrid(self.projectDir + '/' + 'airfoilMesh.su2', scale=scale)
+        with self.timer.stage('p3d_convert'):
+            c2dParser = Construct2dParser(self.projectDir + '/' + 'airfoil.p3d')
+            if wake_extension > 0:
+                c2dParser.extend_wake(wake_extension)
+            # the native mesh fix works on the in memory arrays, no need for the intermediate mesh file
+            if self.meshFixMode != 'native':
+                c2dParser.p3d_to_su2_cgrid(self.projectDir + '/' + 'airfoilMesh.su2', scale=scale)
+        self.c2dParser = c2dParser
+        self.meshScale = scale
         if plot:
             print('saving mesh plot...')
             c2dParser.plot_mesh(scale=scale)
@@ -66,37 +124,225 @@ class CFDrun:
 
     def su2_fix_mesh(self):
         print('start mesh-fixing...')
-        self.su2.fix_mesh('airfoilMesh.su2', 'airfoilMeshFixed.su2', working_dir=self.projectDir)
+        with self.timer.stage('su2_msh' if self.meshFixMode == 'su2' else 'mesh_fix', mode=self.meshFixMode):
+            return self._fix_mesh()
+
+    def _fix_mesh(self):
+        if self.meshFixMode == 'su2':
+            self.su2.fix_mesh('airfoilMesh.su2', 'airfoilMeshFixed.su2', working_dir=self.projectDir)
+            return self.su2.errorFlag
+        self.meshFix = MeshFix()
+        if self.c2dParser is not None:
+            points, quads, markers = self.c2dParser.get_cgrid_arrays(scale=self.meshScale)
+            self.meshFix.set_mesh(points, {MeshFix.QUADRILATERAL: quads}, markers)
+        else:
+            self.meshFix.read_su2_file(self.projectDir + '/airfoilMesh.su2')
+        self.meshFix.fix()
+        self.meshFix.write_su2_file(self.projectDir + '/airfoilMeshFixed.su2')
+        if self.meshFixMode == 'cross_check':
+            self._cross_check_mesh_fix()
+        return self.meshFix.errorFlag
+
+    def _cross_check_mesh_fix(self):
+        self.su2.fix_mesh('airfoilMesh.su2', 'airfoilMeshFixedSU2.su2', working_dir=self.projectDir)
+        su2Fix = MeshFix()
+        su2Fix.read_su2_file(self.projectDir + '/airfoilMeshFixedSU2.su2')
+        native = (self.meshFix.get_point_count(), self.meshFix.get_element_count(), len(self.meshFix.markerOrder))
+        reference = (su2Fix.get_point_count(), su2Fix.get_element_count(), len(su2Fix.markerOrder))
+        if native != reference:
+            print('WARNING: native mesh fix differs from SU2_MSH (points, elements, markers): '
+                  + str(native) + ' vs. ' + str(reference))
+        else:
+            print('native mesh fix matches SU2_MSH')
+
+    def check_mesh_quality(self):
+        print('check mesh quality...')
+        mesh = self.meshFix
+        if mesh is None:
+            mesh = MeshFix()
+            mesh.read_su2_file(os.path.join(self.projectDir, self.meshFileName))
+        wallEdges = mesh.markers.get('airfoil', None)
+        with self.timer.stage('mesh_quality'):
+            ok = self.meshQuality.check(mesh.points, mesh.elements,
+                                        wall_edges=wallEdges,
+                                        reynolds=self.c2d.reynoldsNum,
+                                        ref_length=self.meshScale)
+        return ok
 
     def su2_solve(self, config):
+        self.meshRejected = False
+        if self.meshQualityGate != 'off':
+            if not self.check_mesh_quality() and self.meshQualityGate == 'reject':
+                print('ERROR: mesh rejected by quality gate, SU2_CFD is not started')
+                self.meshRejected = True
+                return None
         print('start solving...')
-        self.su2.write_single_core_batch_file(working_dir=self.projectDir)
-        return self.su2.run_cfd('airfoilMeshFixed.su2', config, working_dir=self.projectDir)
+        self.su2.outputProfile = self.outputProfile
+        if self.warmStart is None:
+            stopReason = self._run_cfd_timed('su2_cfd', config)
+            self._raise_solver_failure()
+            return stopReason
+
+        config = config.copy()
+        pointCount = self.get_mesh_point_count()
+        self.warmStarted = self.warmStart.is_compatible(pointCount)
+        if self.warmStarted:
+            print('warm start from ' + self.warmStart.sourceProject)
+            self.warmStart.provide(self.projectDir)
+        self.warmStart.apply_to_config(config, self.warmStarted)
+        stopReason = self._run_cfd_timed('su2_cfd', config, warmStart=self.warmStarted)
+        results = self.su2_parse_iteration_result()
+        if (self.su2.failure is not None or not self.results_valid(results)) and self.warmStarted:
+            # the restart did not work out, fall back to a cold start
+            print('WARNING: warm started run failed, rerun with cold start')
+            self.warmStart.invalidate()
+            self.warmStarted = False
+            self.warmStart.apply_to_config(config, False)
+            stopReason = self._run_cfd_timed('su2_cfd_cold_rerun', config, warmStart=False)
+            results = self.su2_parse_iteration_result()
+        self._raise_solver_failure()
+        if self.results_valid(results):
+            self.warmStart.store(self.projectDir, pointCount)
+        return stopReason
+
+    def _run_cfd_timed(self, stage_name, config, input_cfg_file='cfdRun.cfg', **info):
+        with self.timer.stage(stage_name, cores=self.su2.usedCores, **info) as record:
+            stopReason = self.su2.run_cfd(self.meshFileName, config, input_cfg_file=input_cfg_file,
+                                          working_dir=self.projectDir)
+            result = self.su2.lastResult
+            if result is not None:
+                record['info']['status'] = result.status
+                record['info']['iterations'] = result.iterations
+                # the solver's own timing, for comparison with the wall time
+                record['info']['su2TimeMin'] = result.coefficients.get('Time(min)', None)
+        return stopReason
+
+    def _raise_solver_failure(self):
+        # diverged or stalled runs were killed by the monitor, the caller gets the typed failure
+        if self.su2.failure is not None:
+            print('ERROR: SU2_CFD ' + str(self.su2.failure))
+            raise self.su2.failure
+
+    def promote_full_output(self, config):
+        # writes the field output of a lean run afterwards, by restarting from its own solution for
+        # one iteration, without a restart file the whole run is repeated
+        print('write full output for ' + self.persistentDir + '...')
+        self.keepFiles += FULL_OUTPUT_FILES
+        config = config.copy()
+        config['CONV_FILENAME'] = 'history_full'
+        restartPath = self.projectDir + '/restart_flow.dat'
+        if os.path.isfile(restartPath):
+            shutil.copyfile(restartPath, self.projectDir + '/solution_flow_full.dat')
+            config['RESTART_SOL'] = True
+            config['SOLUTION_FLOW_FILENAME'] = 'solution_flow_full.dat'
+            config['DISCARD_INFILES'] = True
+            config['EXT_ITER'] = 1
+        else:
+            print('WARNING: no restart file in ' + self.projectDir + ', rerun the whole solution')
+        monitor = self.su2.monitor
+        self.su2.monitor = None
+        self.su2.outputProfile = 'full'
+        try:
+            self._run_cfd_timed('su2_cfd_full_output', config, input_cfg_file='cfdRunFull.cfg')
+        finally:
+            self.su2.monitor = monitor
+            self.su2.outputProfile = self.outputProfile
+        if os.path.isfile(self.projectDir + '/solution_flow_full.dat'):
+            os.remove(self.projectDir + '/solution_flow_full.dat')
+
+    def su2_solve_adjoint(self, config, columns=('CD', 'CL', 'CMz'), solution_file='restart_flow.dat'):
+        # discrete adjoints of the coefficients on the converged flow solution in the project dir, all
+        # at once with the cores split between them, returns column -> surface sensitivities
+        # (see SU2.load_surface_adjoint), failed adjoints are missing
+        print('start adjoint solving for ' + ', '.join(columns) + '...')
+        if not os.path.isfile(self.projectDir + '/' + solution_file):
+            print('ERROR: no flow solution ' + solution_file + ' in ' + self.projectDir + ', adjoint not possible')
+            return dict()
+        cores = max(1, self.su2.usedCores // len(columns))
+        processes = [self.su2.create_adjoint_process(self.meshFileName, config, column, solution_file=solution_file,
+                                                     used_cores=cores, working_dir=self.projectDir)
+                     for column in columns]
+        with self.timer.stage('su2_cfd_ad', cores=cores * len(columns), objectives='/'.join(columns)) as record:
+            results = run_processes(processes)
+            record['info']['status'] = '/'.join(r.status for r in results)
+        # SU2 6.x writes a density per unit length, the marker edges give the length per point
+        mesh = self.meshFix
+        if mesh is None:
+            mesh = MeshFix()
+            mesh.read_su2_file(self.projectDir + '/' + self.meshFileName)
+        lengths = dual_lengths(mesh.points, mesh.markers['airfoil'])
+        sensitivities = dict()
+        for column, result in zip(columns, results):
+            sensitivity = self.su2.load_surface_adjoint(column, working_dir=self.projectDir)
+            if result.exitCode != 0 or sensitivity is None:
+                print('ERROR: SU2_CFD_AD for ' + column + ' failed, see ' + result.logFile)
+                continue
+            sensitivity['length'] = lengths[sensitivity['point']]
+            sensitivities[column] = sensitivity
+        # the adjoint solutions are not reused
+        for entry in os.scandir(self.projectDir):
+            if entry.name.startswith('restart_adj_'):
+                os.remove(entry.path)
+        return sensitivities
+
+    def get_mesh_point_count(self):
+        if self.meshFix is not None:
+            return self.meshFix.get_point_count()
+        return self.su2.read_mesh_point_count(self.meshFileName, working_dir=self.projectDir)
+
+    @staticmethod
+    def results_valid(results):
+        # same sanity check the optimizer applies to the drag
+        try:
+            cd = float(results['CD'])
+        except (KeyError, ValueError, TypeError):
+            return False
+        return not math.isnan(cd) and 0. < cd <= 100.
 
     def su2_parse_results(self):
         print('parse results...')
         totalCL, totalCD, totalCM, totalE = self.su2.parse_force_breakdown('forces_breakdown.dat', working_dir=self.projectDir)
         return totalCL, totalCD, totalCM, totalE
 
+    def su2_parse_force_breakdown(self):
+        # totals and per marker pressure/friction components
+        return self.su2.load_force_breakdown('forces_breakdown.dat', working_dir=self.projectDir)
+
+    def su2_load_surface_flow(self):
+        # only written with the 'full' output profile
+        return self.su2.load_surface_flow('surface_flow.csv', working_dir=self.projectDir)
+
     def su2_parse_iteration_result(self):
         print('parsing cfd iteration results')
-        return self.su2.parse_result_from_history('history.vtk', working_dir=self.projectDir)
+        return self.su2.parse_result_from_history(self.su2.historyFileName, working_dir=self.projectDir)
 
     def clean_up(self):
         print('clean up...')
-        if os.path.isfile(self.projectDir + '/airfoilMesh.su2'):
-            os.remove(self.projectDir + '/airfoilMesh.su2')
-        if os.path.isfile(self.projectDir + '/airfoil_stats.p3d'):
-            os.remove(self.projectDir + '/airfoil_stats.p3d')
-        if os.path.isfile(self.projectDir + '/airfoil.p3d'):
-            os.remove(self.projectDir + '/airfoil.p3d')
-        if os.path.isfile(self.projectDir + '/airfoil.nmf'):
-            os.remove(self.projectDir + '/airfoil.nmf')
-        #if os.path.isfile(self.projectDir + '/restart_flow.dat'):
-        #    os.remove(self.projectDir + '/restart_flow.dat')
-        if os.path.isfile(self.projectDir + '/original_grid.dat'):
-            os.remove(self.projectDir + '/original_grid.dat')
-        if os.path.isfile(self.projectDir + '/meshFix.cfg'):
-            os.remove(self.projectDir + '/meshFix.cfg')
-        if os.path.isfile(self.projectDir + '/surface_analysis.vtk'):
-            os.remove(self.projectDir + '/surface_analysis.vtk')
\ No newline at end of file
+        if self.scratchDir is not None:
+            self._persist_scratch()
+            return
+        # one directory listing instead of a stat for every file that might exist
+        names = set(['airfoilMesh.su2',
+                     'airfoil_stats.p3d',
+                     'airfoil.p3d',
+                     'airfoil.nmf',
+                     #'restart_flow.dat',
+                     'original_grid.dat',
+                     'construct2d.in',
+                     'meshFix.cfg',
+                     'airfoilMeshFixedSU2.su2',
+                     'surface_analysis.vtk'])
+        for entry in os.scandir(self.projectDir):
+            if entry.name in names:
+                os.remove(entry.path)
+
+    def _persist_scratch(self):
+        # copies the kept files out and drops the whole scratch dir at once
+        patterns = self.keepFiles + (['restart_flow.dat'] if self.keepRestart else [])
+        for entry in os.scandir(self.scratchDir):
+            if entry.is_file() and any(fnmatch.fnmatch(entry.name, p) for p in patterns):
+                shutil.copyfile(entry.path, self.persistentDir + '/' + entry.name)
+        shutil.rmtree(self.scratchDir, ignore_errors=True)
+        # later reads, e.g. su2_parse_iteration_result(), go to the kept copies
+        self.projectDir = self.persistentDir
+        self.scratchDir = None
@@ -0,0 +1,210 @@
+__author__ = "Juri Bieler"
+__version__ = "0.0.1"
+__status__ = "Development"
+
+# ==============================================================================
+# description     :AOA or mach sweeps on one shared mesh, every point restarts
+#                  from the solution of its neighbour
+# date            :2018-08-13
+# notes           :finished points are kept in <sweep name>_ledger.jsonl, a
+#                  restarted sweep only solves the missing and failed ones
+# python_version  :3.8
+# ==============================================================================
+
+import os
+import threading
+
+from cfd.CFDrun import CFDrun
+from cfd.SolverScheduler import SolverScheduler
+from cfd.WarmStart import WarmStart
+from cfd.ConvergenceMonitor import ConvergenceMonitor, SolverFailure
+from cfd.RunLedger import RunLedger
+from constants import *
+
+
+class ContinuationSweep:
+
+    def __init__(self, sweep_name, parameter='AOA', used_cores=SU2_USED_CORES, anchors=None):
+        self.sweepName = sweep_name
+        # SU2 config option that is swept, e.g. AOA or MACH_NUMBER
+        self.parameter = parameter
+        self.usedCores = used_cores
+        # cold started points, chains run outward from them in both directions
+        self.anchors = anchors
+        # stop the runs once the coefficients settled, without it a restart saves nothing
+        self.earlyTermination = True
+        # mesh once in this project, all sweep points use its mesh
+        self.meshRun = CFDrun(sweep_name + '_mesh', used_cores=used_cores)
+        # skip points the ledger holds as finished with the same inputs
+        self.resume = True
+        self.ledger = RunLedger(WORKING_DIR + '/' + sweep_name + '_ledger.jsonl')
+        self.meshDigest = ''
+        self.pointCount = 0
+        self.results = []
+        self._lock = threading.Lock()
+
+    def _project_name(self, value):
+        return self.sweepName + '_' + self.parameter.lower() + '_%0.4f' % value
+
+    def build_chains(self, values):
+        # returns a list of (anchor, [values in solving order]) chains, the anchor itself is the first
+        # point of its up chain, the down chain restarts from the anchor solution
+        values = sorted(set(float(v) for v in values))
+        anchors = self.anchors
+        if anchors is None:
+            anchors = [0.] if self.parameter == 'AOA' else [values[0]]
+        anchorValues = sorted(set(min(values, key=lambda v: abs(v - a)) for a in anchors))
+        assigned = dict((a, []) for a in anchorValues)
+        for v in values:
+            assigned[min(anchorValues, key=lambda a: abs(v - a))].append(v)
+        chains = []
+        for a in anchorValues:
+            up = sorted(v for v in assigned[a] if v > a)
+            down = sorted((v for v in assigned[a] if v < a), reverse=True)
+            chains.append((a, [a] + up))
+            if len(down) > 0:
+                chains.append((a, down))
+        return chains
+
+    def _point_hash(self, value, config):
+        return RunLedger.inputs_hash({'parameter': self.parameter, 'value': value,
+                                      'config': dict(config), 'mesh': self.meshDigest})
+
+    def _run_point(self, value, config, cores, warm_start, chain_id):
+        projectName = self._project_name(value)
+        pointHash = self._point_hash(value, config)
+        if self.resume and self.ledger.is_done(projectName, pointHash):
+            print('sweep ' + self.sweepName + ': ' + self.parameter + ' ' + str(value) + ' finished before, skip it')
+            # a copy, the ledger entry itself stays as recorded
+            result = dict(self.ledger.get_results(projectName))
+            result['chain'] = chain_id
+            result['resumed'] = True
+            with self._lock:
+                self.results.append(result)
+            return result, None
+        RunLedger.reset_project_dir(WORKING_DIR + '/' + projectName)
+        cfd = CFDrun(projectName, used_cores=cores, warm_start=warm_start)
+        # absolute, the mesh run may live in a scratch dir of its own
+        cfd.meshFileName = os.path.abspath(os.path.join(self.meshRun.projectDir, self.meshRun.meshFileName))
+        # the next point of the chain restarts from it
+        cfd.keepRestart = True
+        # the shared mesh was checked once already
+        cfd.meshQualityGate = 'off'
+        if self.earlyTermination:
+            cfd.su2.monitor = ConvergenceMonitor()
+        pointConfig = config.copy()
+        pointConfig[self.parameter] = value
+        try:
+            stopReason = cfd.su2_solve(pointConfig)
+        except SolverFailure as e:
+            stopReason = type(e).__name__ + ': ' + str(e)
+        results = cfd.su2_parse_iteration_result()
+        cfd.clean_up()
+        result = dict()
+        result['value'] = value
+        result['chain'] = chain_id
+        result['warmStarted'] = cfd.warmStarted
+        result['stopReason'] = stopReason
+        result['valid'] = cfd.su2.failure is None and CFDrun.results_valid(results)
+        result['results'] = results
+        result['projectDir'] = cfd.projectDir
+        result['resumed'] = False
+        self.ledger.record(projectName, pointHash, result, status='ok' if result['valid'] else 'failed')
+        with self._lock:
+            self.results.append(result)
+        return result, cfd
+
+    def _warm_start_path(self, name):
+        return WORKING_DIR + '/' + self.sweepName + '_' + name + '_warmStart.dat'
+
+    def _run_chain(self, chain_id, anchor, values, config, cores, anchor_run):
+        # every point restarts from its predecessor, the first one from the anchor solution
+        warmStart = WarmStart(self._warm_start_path('chain%02d' % chain_id))
+        anchorResult, anchorCfd = anchor_run
+        if anchorResult['valid']:
+            warmStart.store(anchorResult['projectDir'], self.pointCount)
+        chainResults = []
+        for value in values:
+            if value == anchor:
+                chainResults.append(anchorResult)
+                continue
+            result, cfd = self._run_point(value, config, cores, warmStart, chain_id)
+            if result['resumed'] and result['valid']:
+                # the next point restarts from the kept restart file of the skipped one
+                warmStart.store(result['projectDir'], self.pointCount)
+            chainResults.append(result)
+        return chainResults
+
+    def run(self, values, config):
+        self.results = []
+        chains = self.build_chains(values)
+        anchors = sorted(set(a for a, chainValues in chains))
+        pointCount = self.meshRun.get_mesh_point_count()
+        self.pointCount = pointCount
+        self.meshDigest = RunLedger.file_digest(self.meshRun.projectDir + '/' + self.meshRun.meshFileName)
+
+        # cold start all anchors first, the anchors get an empty warm start, so they write the
+        # restart file their chains start from
+        print('sweep ' + self.sweepName + ': cold start of ' + str(len(anchors)) + ' anchor(s)...')
+        anchorJobs = [(pointCount, self._anchor_job(i, a, config)) for i, a in enumerate(anchors)]
+        anchorRuns = SolverScheduler(self.usedCores).run(anchorJobs)
+        anchorResults = dict(zip(anchors, anchorRuns))
+
+        # then all continuation chains in parallel under the core budget
+        print('sweep ' + self.sweepName + ': ' + str(len(chains)) + ' continuation chain(s)...')
+        chainJobs = [(pointCount, self._chain_job(i, anchor, chainValues, config, anchorResults[anchor]))
+                     for i, (anchor, chainValues) in enumerate(chains)]
+        chainResults = SolverScheduler(self.usedCores).run(chainJobs)
+
+        self._add_iterations_saved(chains, chainResults, anchorResults)
+        self.results = sorted(self.results, key=lambda r: r['value'])
+        resumed = sum(1 for r in self.results if r['resumed'])
+        if resumed > 0:
+            print('sweep ' + self.sweepName + ': ' + str(resumed) + ' point(s) taken from the ledger')
+        return self.results
+
+    def _anchor_job(self, anchor_id, value, config):
+        warmStart = WarmStart(self._warm_start_path('anchor%02d' % anchor_id))
+        return lambda cores: self._run_point(value, config, cores, warmStart, anchor_id)
+
+    def _chain_job(self, chain_id, anchor, values, config, anchor_run):
+        return lambda cores: self._run_chain(chain_id, anchor, values, config, cores, anchor_run)
+
+    def _add_iterations_saved(self, chains, chain_results, anchor_results):
+        # the cold started anchor of a chain is the reference for its warm started points
+        for (anchor, chainValues), results in zip(chains, chain_results):
+            coldIterations = self._iterations(anchor_results[anchor][0])
+            for r in results:
+                if r['warmStarted'] and coldIterations is not None and self._iterations(r) is not None:
+                    r['iterationsSaved'] = coldIterations - self._iterations(r)
+                else:
+                    r['iterationsSaved'] = 0
+
+    def _iterations(self, result):
+        try:
+            return int(float(result['results']['Iteration']))
+        except (KeyError, ValueError, TypeError):
+            return None
+
+    def get_total_iterations_saved(self):
+        return sum(r.get('iterationsSaved', 0) for r in self.results)
+
+    def write_report(self, file_path):
+        outputF = open(file_path, 'w')
+        outputF.write(self.parameter + ',CL,CD,CMz,CL/CD,Iterations,Time(min),chain,warmStarted,iterationsSaved,stopReason\n')
+        for r in self.results:
+            res = r['results']
+            outputF.write(str(r['value']) + ','
+                          + str(res.get('CL', '')) + ','
+                          + str(res.get('CD', '')) + ','
+                          + str(res.get('CMz', '')) + ','
+                          + str(res.get('CL/CD', '')) + ','
+                          + str(res.get('Iteration', '')) + ','
+                          + str(res.get('Time(min)', '')) + ','
+                          + str(r['chain']) + ','
+                          + str(r['warmStarted']) + ','
+                          + str(r.get('iterationsSaved', 0)) + ','
+                          + r['stopReason'].replace(',', ';') + '\n')
+        outputF.write('% total iterations saved against cold starts: ' + str(self.get_total_iterations_saved()) + '\n')
+        outputF.close()
+        print('total iterations saved against cold starts: ' + str(self.get_total_iterations_saved()))
@@ -0,0 +1,194 @@
+__author__ = "Juri Bieler"
+__version__ = "0.0.1"
+__status__ = "Development"
+
+# ==============================================================================
+# description     :tails the SU2 history file while the solver runs and stops
+#                  it once the coefficients are converged, or kills it once
+#                  it diverged or stalled
+# date            :2018-08-09
+# notes           :
+# python_version  :3.6
+# ==============================================================================
+
+import os
+import numpy as np
+
+
+class SolverFailure(Exception):
+    # the solver was killed because the run could not deliver a usable result anymore
+
+    def __init__(self, reason, iteration=-1):
+        Exception.__init__(self, reason + ' (iteration ' + str(iteration) + ')')
+        self.reason = reason
+        self.iteration = iteration
+
+
+class SolverDivergedError(SolverFailure):
+    pass
+
+
+class SolverStalledError(SolverFailure):
+    pass
+
+
+class ConvergenceMonitor:
+
+    def __init__(self):
+        # cauchy criterion: relative spread of every field over the last window iterations
+        self.cauchyFields = ['CL', 'CD', 'CMz']
+        self.cauchyWindow = 100
+        self.cauchyEps = 1e-5
+        # the spread is relative to max(|last value|, floor), so coefficients close to zero (CMz, CL of an
+        # aoa sweep crossing zero) converge on an absolute spread of cauchyEps * floor
+        self.cauchyAbsFloor = {'CL': 1e-2, 'CD': 1e-3, 'CMz': 1e-3}
+        # residual criterion: drop in orders of magnitude of the residual field, None disables it
+        self.residualField = 'Res_Flow[0]'
+        self.residualDrop = None
+        # no criterion is applied before this iteration
+        self.minIterations = 200
+        # False: only diverged or stalled runs are stopped, converged ones end on the solver's own criteria
+        # and write the restart file of their last iteration (e.g. as start of an adjoint run)
+        self.stopWhenConverged = True
+        # divergence: nan/inf in the monitored fields, or the residual rose this many orders
+        # of magnitude above its lowest value so far, None disables the residual check
+        self.divergenceOrders = 4.
+        # stall: the residual did not improve by stallOrders within stallWindow iterations,
+        # None disables the check (default, oscillating RANS runs often end with usable coefficients)
+        self.stallWindow = None
+        self.stallOrders = 0.1
+        # seconds between two looks at the history file
+        self.pollInterval = 1.
+        # seconds the solver gets to exit after it was asked to stop
+        self.stopGracePeriod = 10.
+        self.reset()
+
+    def reset(self):
+        self.paraNames = None
+        self.records = []
+        self.stopReason = ''
+        self.stopIteration = -1
+        # SolverFailure if the run was killed as hopeless
+        self.failure = None
+        self._offset = 0
+        self._partial = b''
+        self._checkedCount = 0
+        self._bestResidual = np.inf
+        # residual and record index of the last improvement by stallOrders
+        self._stallResidual = np.inf
+        self._stallIndex = 0
+
+    def read_new_records(self, history_path):
+        # reads only the bytes appended since the last call
+        if not os.path.isfile(history_path):
+            return 0
+        f = open(history_path, 'rb')
+        f.seek(self._offset)
+        data = self._partial + f.read()
+        self._offset = f.tell()
+        f.close()
+        lines = data.split(b'\n')
+        # keep the half written last line for the next call
+        self._partial = lines[-1]
+        newCount = 0
+        for line in lines[:-1]:
+            line = line.decode('UTF-8').strip()
+            if len(line) == 0:
+                continue
+            if self.paraNames is None:
+                self.paraNames = [p.strip().replace('"', '') for p in line.split(',')]
+                continue
+            values = line.replace(' ', '').split(',')
+            if len(values) != len(self.paraNames):
+                continue
+            try:
+                self.records.append([float(v) for v in values])
+            except ValueError:
+                self.records.append([float('nan')] * len(self.paraNames))
+            newCount += 1
+        return newCount
+
+    def get_column(self, name):
+        if self.paraNames is None or name not in self.paraNames or len(self.records) == 0:
+            return None
+        return np.array(self.records)[:, self.paraNames.index(name)]
+
+    def get_iteration(self):
+        iterations = self.get_column('Iteration')
+        if iterations is None:
+            return len(self.records)
+        return int(iterations[-1])
+
+    def check_converged(self):
+        # returns the reason as string if the run can be stopped, None otherwise
+        if len(self.records) < max(self.minIterations, self.cauchyWindow):
+            return None
+        if self.cauchyFields is not None and len(self.cauchyFields) > 0:
+            data = np.array(self.records[-self.cauchyWindow:])
+            spreads = []
+            for field in self.cauchyFields:
+                if field not in self.paraNames:
+                    spreads = None
+                    break
+                window = data[:, self.paraNames.index(field)]
+                floor = self.cauchyAbsFloor.get(field, 1e-3)
+                spreads.append((window.max() - window.min()) / max(abs(window[-1]), floor))
+            if spreads is not None and max(spreads) <= self.cauchyEps:
+                return 'cauchy converged (' + ', '.join(self.cauchyFields) + ', window ' \
+                       + str(self.cauchyWindow) + ', eps ' + str(self.cauchyEps) + ')'
+        if self.residualDrop is not None:
+            residual = self.get_column(self.residualField)
+            if residual is not None and residual[0] - residual[-1] >= self.residualDrop:
+                return 'residual ' + self.residualField + ' dropped ' + str(self.residualDrop) + ' orders'
+        return None
+
+    def check_failed(self):
+        # returns a SolverFailure if the run is hopeless, None otherwise
+        if self.paraNames is None or len(self.records) == self._checkedCount:
+            return None
+        fields = [f for f in (self.cauchyFields or []) + [self.residualField] if f in self.paraNames]
+        columns = [self.paraNames.index(f) for f in fields]
+        newData = np.array(self.records[self._checkedCount:])[:, columns]
+        start = self._checkedCount
+        self._checkedCount = len(self.records)
+        if not np.all(np.isfinite(newData)):
+            row = start + int(np.argwhere(~np.isfinite(newData))[0][0])
+            return SolverDivergedError('nan or inf in history', self._iteration_at(row))
+        if self.residualField not in fields:
+            return None
+        residual = newData[:, fields.index(self.residualField)]
+        for i, r in enumerate(residual):
+            if r <= self._stallResidual - self.stallOrders or self._stallResidual == np.inf:
+                self._stallResidual = r
+                self._stallIndex = start + i
+            self._bestResidual = min(self._bestResidual, r)
+            if self.divergenceOrders is not None and r - self._bestResidual > self.divergenceOrders:
+                return SolverDivergedError('residual ' + self.residualField + ' rose ' + str(self.divergenceOrders)
+                                           + ' orders above its minimum', self._iteration_at(start + i))
+        if self.stallWindow is not None and len(self.records) >= self.minIterations \
+                and len(self.records) - 1 - self._stallIndex > self.stallWindow:
+            return SolverStalledError('residual ' + self.residualField + ' improved less than ' + str(self.stallOrders)
+                                      + ' orders in ' + str(self.stallWindow) + ' iterations', self.get_iteration())
+        return None
+
+    def _iteration_at(self, row):
+        if 'Iteration' in self.paraNames:
+            return int(self.records[row][self.paraNames.index('Iteration')])
+        return row
+
+    def check(self):
+        # failure first, a diverged run must not count as converged; returns the stop reason or None
+        failure = self.check_failed()
+        if failure is not None:
+            self.failure = failure
+            return failure.reason
+        if not self.stopWhenConverged:
+            return None
+        return self.check_converged()
+
+    def write_log(self, log_path):
+        outputF = open(log_path, 'w')
+        outputF.write('stopIteration,stopReason,failure\n')
+        failure = '' if self.failure is None else type(self.failure).__name__
+        outputF.write(str(self.stopIteration) + ',' + self.stopReason.replace(',', ';') + ',' + failure + '\n')
+        outputF.close()
@@ -0,0 +1,221 @@
+__author__ = "Juri Bieler"
+__version__ = "0.0.1"
+__status__ = "Development"
+
+# ==============================================================================
+# description     :sqlite cache of finished cfd evaluations, keyed by a hash of
+#                  the geometry, the flow condition, the mesh settings and the
+#                  solver config, so revisited designs are not solved again
+# date            :2018-08-18
+# notes           :usage: python -m cfd.EvaluationCache <db file> stats
+#                                                     evict [max entries] [max age in days]
+#                                                     compact
+# python_version  :3.6
+# ==============================================================================
+
+import os
+import sys
+import time
+import json
+import hashlib
+import sqlite3
+import threading
+
+import numpy as np
+
+from cfd.SU2Config import get_template, format_value
+
+
+# run management and output options, they do not change the solution
+IGNORED_CONFIG_KEYS = ['MESH_FILENAME', 'RESTART_SOL', 'SOLUTION_FLOW_FILENAME', 'RESTART_FLOW_FILENAME',
+                       'DISCARD_INFILES', 'WRT_SOL_FREQ', 'WRT_CON_FREQ', 'CONV_FILENAME', 'WRT_VOL_SOL',
+                       'WRT_SRF_SOL', 'WRT_CSV_SOL', 'VOLUME_FLOW_FILENAME', 'SURFACE_FLOW_FILENAME',
+                       'BREAKDOWN_FILENAME', 'OUTPUT_FORMAT']
+
+
+class EvaluationCache:
+
+    def __init__(self, db_path, decimals=8, default_cfg_file_path='dataIn/default.cfg'):
+        self.dbPath = db_path
+        # geometry and condition values are rounded to this many decimals before hashing,
+        # so the last bits of an optimizer step do not miss the cache
+        self.decimals = decimals
+        self.defaultCfgFilePath = default_cfg_file_path
+        # statistics of this session, the totals are kept in the db
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(db_path, timeout=30., check_same_thread=False)
+        self._db.execute('CREATE TABLE IF NOT EXISTS evaluations ('
+                         'key TEXT PRIMARY KEY, status TEXT, cl REAL, cd REAL, cm REAL, iterations INTEGER, '
+                         'mach REAL, aoa REAL, reynolds REAL, run_dir TEXT, created REAL, last_access REAL, '
+                         'hit_count INTEGER DEFAULT 0)')
+        self._db.execute('CREATE TABLE IF NOT EXISTS stats (name TEXT PRIMARY KEY, value INTEGER)')
+        self._db.commit()
+
+    def close(self):
+        self._db.close()
+
+    def _round(self, value):
+        return np.round(np.asarray(value, dtype=float), self.decimals) + 0.
+
+    def get_config_values(self, config):
+        # the template defaults with the run overrides on top, e.g. AOA is often only set in the template
+        values = dict(get_template(self.defaultCfgFilePath).values)
+        for key, value in config.items():
+            values[key.upper()] = format_value(value)
+        for key in IGNORED_CONFIG_KEYS:
+            values.pop(key, None)
+        return values
+
+    def get_config_digest(self, config):
+        values = self.get_config_values(config)
+        text = '\n'.join(key + '=' + values[key] for key in sorted(values.keys()))
+        return hashlib.sha256(text.encode('utf-8')).hexdigest()
+
+    def make_key(self, geometry, config, mesh_settings=None):
+        # geometry: dict of BP parameters or (top, buttom) coordinate arrays
+        # mesh_settings: dict, e.g. {'mesher': 'construct2d', 'pointsInNormalDir': 80, 'scale': 1.}
+        hasher = hashlib.sha256()
+        if isinstance(geometry, dict):
+            hasher.update(b'params')
+            for name in sorted(geometry.keys()):
+                hasher.update(name.encode('utf-8'))
+                hasher.update(self._round(geometry[name]).tobytes())
+        else:
+            hasher.update(b'coords')
+            for coords in geometry:
+                hasher.update(self._round(coords).tobytes())
+        # flow condition separately rounded, the digest below sees them as written to the cfg
+        values = self.get_config_values(config)
+        for name in ['MACH_NUMBER', 'AOA', 'REYNOLDS_NUMBER']:
+            hasher.update(name.encode('utf-8'))
+            hasher.update(self._round(float(values.get(name, 'nan'))).tobytes())
+        if mesh_settings is not None:
+            settings = dict()
+            for name, value in mesh_settings.items():
+                settings[name] = self._round(value).tolist() if isinstance(value, (int, float)) else str(value)
+            hasher.update(json.dumps(settings, sort_keys=True).encode('utf-8'))
+        hasher.update(self.get_config_digest(config).encode('utf-8'))
+        return hasher.hexdigest()
+
+    def _count(self, name):
+        self._db.execute('INSERT OR IGNORE INTO stats (name, value) VALUES (?, 0)', (name,))
+        self._db.execute('UPDATE stats SET value = value + 1 WHERE name = ?', (name,))
+
+    def get(self, key):
+        # returns {'status', 'CL', 'CD', 'CMz', 'Iteration', 'runDir'} or None
+        with self._lock:
+            row = self._db.execute('SELECT status, cl, cd, cm, iterations, run_dir FROM evaluations WHERE key = ?',
+                                   (key,)).fetchone()
+            if row is None:
+                self.misses += 1
+                self._count('misses')
+            else:
+                self.hits += 1
+                self._count('hits')
+                self._db.execute('UPDATE evaluations SET last_access = ?, hit_count = hit_count + 1 WHERE key = ?',
+                                 (time.time(), key))
+            self._db.commit()
+        if row is None:
+            return None
+        entry = dict()
+        entry['status'] = row[0]
+        entry['CL'] = row[1]
+        entry['CD'] = row[2]
+        entry['CMz'] = row[3]
+        entry['Iteration'] = row[4]
+        entry['runDir'] = row[5]
+        return entry
+
+    def put(self, key, results, config, run_dir='', status='ok'):
+        # results: dict with 'CL', 'CD', 'CMz' and 'Iteration' like CFDrun.su2_parse_iteration_result(),
+        # status 'failed' is meant for deterministic failures like a rejected mesh, those designs are not
+        # solved again either, transient ones (timeouts, stalls, dead workers) should not be stored
+        values = self.get_config_values(config)
+
+        def number(name, source):
+            try:
+                return float(source[name])
+            except (KeyError, TypeError, ValueError):
+                return None
+        now = time.time()
+        with self._lock:
+            self._db.execute('INSERT OR REPLACE INTO evaluations (key, status, cl, cd, cm, iterations, mach, aoa, '
+                             'reynolds, run_dir, created, last_access, hit_count) '
+                             'VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, 0)',
+                             (key, status, number('CL', results), number('CD', results), number('CMz', results),
+                              int(number('Iteration', results) or 0), number('MACH_NUMBER', values),
+                              number('AOA', values), number('REYNOLDS_NUMBER', values),
+                              os.path.abspath(run_dir) if run_dir != '' else '', now, now))
+            self._db.commit()
+
+    def get_stats(self):
+        with self._lock:
+            entries, failed = self._db.execute("SELECT COUNT(*), SUM(CASE WHEN status != 'ok' THEN 1 ELSE 0 END) "
+                                               "FROM evaluations").fetchone()
+            totals = dict(self._db.execute('SELECT name, value FROM stats').fetchall())
+        stats = dict()
+        stats['entries'] = entries
+        stats['failedEntries'] = failed or 0
+        stats['hits'] = self.hits
+        stats['misses'] = self.misses
+        stats['totalHits'] = totals.get('hits', 0)
+        stats['totalMisses'] = totals.get('misses', 0)
+        lookups = stats['totalHits'] + stats['totalMisses']
+        stats['totalHitRate'] = stats['totalHits'] / lookups if lookups > 0 else 0.
+        stats['fileSize'] = os.path.getsize(self.dbPath) if os.path.isfile(self.dbPath) else 0
+        return stats
+
+    def evict(self, max_entries=None, max_age_days=None):
+        # drops entries not used for max_age_days, then the least recently used ones above max_entries,
+        # returns the number of removed entries
+        removed = 0
+        with self._lock:
+            if max_age_days is not None:
+                removed += self._db.execute('DELETE FROM evaluations WHERE last_access < ?',
+                                            (time.time() - max_age_days * 24. * 3600.,)).rowcount
+            if max_entries is not None:
+                removed += self._db.execute('DELETE FROM evaluations WHERE key IN (SELECT key FROM evaluations '
+                                            'ORDER BY last_access DESC LIMIT -1 OFFSET ?)',
+                                            (int(max_entries),)).rowcount
+            self._db.commit()
+        return removed
+
+    def compact(self):
+        # gives the space of evicted entries back to the file system
+        with self._lock:
+            self._db.execute('VACUUM')
+
+
+def print_stats(stats):
+    print('entries:        ' + str(stats['entries']) + ' (' + str(stats['failedEntries']) + ' failed designs)')
+    print('hits / misses:  ' + str(stats['totalHits']) + ' / ' + str(stats['totalMisses'])
+          + ' (hit rate ' + '%.1f' % (100. * stats['totalHitRate']) + ' %)')
+    print('file size:      ' + '%.1f' % (stats['fileSize'] / 1024.) + ' kB')
+
+
+def main(args):
+    if len(args) < 2 or args[1] not in ['stats', 'evict', 'compact']:
+        print('usage: python -m cfd.EvaluationCache <db file> stats | evict [max entries] [max age in days] | compact')
+        return 1
+    if not os.path.isfile(args[0]):
+        print('ERROR: cache file ' + args[0] + ' not found')
+        return 1
+    cache = EvaluationCache(args[0])
+    if args[1] == 'evict':
+        maxEntries = int(args[2]) if len(args) > 2 and args[2] != '-' else None
+        maxAge = float(args[3]) if len(args) > 3 else None
+        print('evicted ' + str(cache.evict(max_entries=maxEntries, max_age_days=maxAge)) + ' entries')
+    elif args[1] == 'compact':
+        sizeBefore = os.path.getsize(args[0])
+        cache.compact()
+        print('compacted from ' + '%.1f' % (sizeBefore / 1024.) + ' kB to '
+              + '%.1f' % (os.path.getsize(args[0]) / 1024.) + ' kB')
+    print_stats(cache.get_stats())
+    cache.close()
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv[1:]))
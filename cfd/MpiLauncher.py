@@ -0,0 +1,61 @@
+__author__ = "Juri Bieler"
+__version__ = "0.0.1"
+__status__ = "Development"
+
+# ==============================================================================
+# description     :builds the SU2 solver command, directly through
+#                  mpiexec on linux, through a batch file on windows
+# date            :2018-08-14
+# notes           :the binding and host flags follow the OpenMPI notation,
+#                  other MPI flavours can pass their own flags in extraArgs
+# python_version  :3.6
+# ==============================================================================
+
+import os
+import sys
+
+
+class MpiLauncher:
+
+    def __init__(self, mpi_exec='mpiexec', bind_to=None, hosts=None, host_file=None):
+        self.mpiExec = mpi_exec
+        # core pinning of the ranks, e.g. 'core' or 'socket', None leaves it to the MPI default
+        self.bindTo = bind_to
+        # list of host names or 'host:slots' strings, None runs on the local node
+        self.hosts = hosts
+        self.hostFile = host_file
+        # additional mpiexec flags, inserted in front of the solver command
+        self.extraArgs = []
+        # the old powershell batch file route, only needed on windows
+        self.useBatchFile = sys.platform == 'win32'
+
+    def build_command(self, solver_command, args, cores):
+        # solver_command: list, e.g. ['SU2_CFD'] or [sys.executable, 'cfd/su2Standin.py']
+        command = list(solver_command) + list(args)
+        if cores <= 1:
+            return command
+        mpiCommand = [self.mpiExec, '-n', str(cores)]
+        if self.bindTo is not None:
+            mpiCommand += ['--bind-to', self.bindTo]
+        if self.hosts is not None and len(self.hosts) > 0:
+            mpiCommand += ['--host', ','.join(self.hosts)]
+        if self.hostFile is not None:
+            mpiCommand += ['--hostfile', os.path.abspath(self.hostFile)]
+        mpiCommand += self.extraArgs
+        return mpiCommand + command
+
+    def write_batch_file(self, command, batch_file_name, working_dir='outDir/'):
+        # powershell.exe -Command "mpiexec -n 6 ../../su2-windows-latest/ExecParallel/bin/SU2_CFD.exe cfdRun.cfg"
+        runCommand = 'powershell.exe -Command "' + ' '.join(command) + '"'
+        ouputF = open(working_dir + '/' + batch_file_name, 'w')
+        ouputF.write(runCommand)
+        ouputF.close()
+        return os.path.abspath(working_dir + '/' + batch_file_name)
+
+    def get_command(self, solver_command, args, cores, working_dir='outDir/'):
+        # the final argument list to start, on windows a batch file is written for mpi runs
+        command = self.build_command(solver_command, args, cores)
+        if self.useBatchFile and cores > 1:
+            return [self.write_batch_file(command, 'cfdMpiRun.bat', working_dir=working_dir)]
+        return command
+
@@ -0,0 +1,199 @@
+__author__ = "Juri Bieler"
+__version__ = "0.0.1"
+__status__ = "Development"
+
+# ==============================================================================
+# description     :packs finished project dirs of a campaign into compressed
+#                  zip volumes with an index, instead of keeping thousands of
+#                  loose dirs, and reads single files back
+# date            :2018-08-21
+# notes           :<base>_0000.zip, <base>_0001.zip, ... hold casesPerVolume
+#                  cases each, so appending does not get slower as the
+#                  campaign grows. <base>_index.jsonl maps case -> volume
+#                  usage: python -m cfd.RunArchive <base> list
+#                                                 extract <case> <target dir>
+#                                                 pack <project dir> [...]
+# python_version  :3.6
+# ==============================================================================
+
+import os
+import sys
+import json
+import time
+import shutil
+import zipfile
+import threading
+
+from cfd.RunLedger import json_default
+
+
+class RunArchive:
+
+    def __init__(self, base_path, cases_per_volume=500):
+        # e.g. 'dataOut/iter_archive' -> dataOut/iter_archive_0000.zip and dataOut/iter_archive_index.jsonl
+        self.basePath = base_path
+        self.casesPerVolume = cases_per_volume
+        self.indexPath = base_path + '_index.jsonl'
+        # case name -> index entry {'case', 'volume', 'files', 'metadata', 'time'}
+        self.index = dict()
+        self.caseOrder = []
+        # volume -> number of cases in it
+        self.volumeCounts = dict()
+        self._lock = threading.Lock()
+        self._load_index()
+
+    def _load_index(self):
+        self.index = dict()
+        self.caseOrder = []
+        self.volumeCounts = dict()
+        if not os.path.isfile(self.indexPath):
+            return
+        inputF = open(self.indexPath, 'r')
+        for line in inputF:
+            if len(line.strip()) == 0:
+                continue
+            try:
+                entry = json.loads(line)
+            except ValueError:
+                print('WARNING: skip broken line in archive index ' + self.indexPath)
+                continue
+            self._add_to_index(entry)
+        inputF.close()
+
+    def _add_to_index(self, entry):
+        if entry['case'] not in self.index:
+            self.caseOrder.append(entry['case'])
+        self.index[entry['case']] = entry
+        self.volumeCounts[entry['volume']] = self.volumeCounts.get(entry['volume'], 0) + 1
+
+    def get_volume_path(self, volume):
+        return self.basePath + '_%04d.zip' % volume
+
+    def _current_volume(self):
+        if len(self.volumeCounts) == 0:
+            return 0
+        volume = max(self.volumeCounts.keys())
+        return volume if self.volumeCounts[volume] < self.casesPerVolume else volume + 1
+
+    def get_reference(self, case):
+        # short pointer to a case, e.g. for the run dir column of the evaluation cache
+        return self.basePath + '#' + case
+
+    def add_case(self, case, project_dir, metadata=None, remove_source=False, skip_patterns=None):
+        # packs all files of project_dir (not recursive) under <case>/ into the current volume,
+        # metadata is stored in the index (json types), returns the list of packed files
+        skip = set(skip_patterns) if skip_patterns is not None else set()
+        fileNames = sorted(entry.name for entry in os.scandir(project_dir)
+                           if entry.is_file() and entry.name not in skip)
+        with self._lock:
+            volume = self._current_volume()
+            archive = zipfile.ZipFile(self.get_volume_path(volume), 'a', compression=zipfile.ZIP_DEFLATED)
+            try:
+                for name in fileNames:
+                    archive.write(project_dir + '/' + name, case + '/' + name)
+                if metadata is not None:
+                    archive.writestr(case + '/metadata.json', json.dumps(metadata, default=json_default))
+            finally:
+                archive.close()
+            entry = dict()
+            entry['case'] = case
+            entry['volume'] = volume
+            entry['files'] = fileNames
+            entry['metadata'] = metadata
+            entry['time'] = time.time()
+            # the index entry goes last, a case is only listed once its volume was closed properly
+            outputF = open(self.indexPath, 'a')
+            outputF.write(json.dumps(entry, default=json_default) + '\n')
+            outputF.close()
+            self._add_to_index(json.loads(json.dumps(entry, default=json_default)))
+        if remove_source:
+            shutil.rmtree(project_dir)
+        return fileNames
+
+
+class RunArchiveReader:
+
+    def __init__(self, base_path):
+        self.archive = RunArchive(base_path)
+        # volume -> open ZipFile
+        self._volumes = dict()
+
+    def close(self):
+        for z in self._volumes.values():
+            z.close()
+        self._volumes = dict()
+
+    def list_cases(self):
+        return list(self.archive.caseOrder)
+
+    def has_case(self, case):
+        return case in self.archive.index
+
+    def get_metadata(self, case):
+        return self.archive.index[case]['metadata']
+
+    def list_files(self, case):
+        return list(self.archive.index[case]['files'])
+
+    def _volume(self, case):
+        volume = self.archive.index[case]['volume']
+        if volume not in self._volumes:
+            self._volumes[volume] = zipfile.ZipFile(self.archive.get_volume_path(volume), 'r')
+        return self._volumes[volume]
+
+    def read(self, case, file_name):
+        # bytes of one file of a case, only that member is decompressed
+        return self._volume(case).read(case + '/' + file_name)
+
+    def read_text(self, case, file_name):
+        return self.read(case, file_name).decode('utf-8', errors='replace')
+
+    def read_history(self, case, file_name='history.vtk'):
+        # the SU2 history as dict of column name -> list of floats
+        lines = self.read_text(case, file_name).splitlines()
+        names = [n.strip().strip('"') for n in lines[0].split(',')]
+        columns = dict((n, []) for n in names)
+        for line in lines[1:]:
+            values = line.split(',')
+            if len(values) != len(names):
+                continue
+            for n, v in zip(names, values):
+                columns[n].append(float(v))
+        return columns
+
+    def extract(self, case, target_dir):
+        # restores the project dir of a case, e.g. to look at the fields in paraview
+        if not os.path.isdir(target_dir):
+            os.makedirs(target_dir)
+        z = self._volume(case)
+        for name in self.list_files(case):
+            outputF = open(target_dir + '/' + name, 'wb')
+            outputF.write(z.read(case + '/' + name))
+            outputF.close()
+
+
+def main(args):
+    if len(args) < 2 or args[1] not in ['list', 'extract', 'pack']:
+        print('usage: python -m cfd.RunArchive <base> list | extract <case> <target dir> | pack <project dir> [...]')
+        return 1
+    if args[1] == 'pack':
+        # moves loose project dirs of older campaigns into the archive
+        archive = RunArchive(args[0])
+        for projectDir in args[2:]:
+            case = os.path.basename(os.path.normpath(projectDir))
+            files = archive.add_case(case, projectDir, remove_source=True)
+            print('packed ' + case + ' (' + str(len(files)) + ' files)')
+        return 0
+    reader = RunArchiveReader(args[0])
+    if args[1] == 'list':
+        for case in reader.list_cases():
+            print(case + ': ' + ', '.join(reader.list_files(case)))
+    else:
+        reader.extract(args[2], args[3])
+        print('extracted ' + args[2] + ' to ' + args[3])
+    reader.close()
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv[1:]))
@@ -0,0 +1,137 @@
+__author__ = "Juri Bieler"
+__version__ = "0.0.1"
+__status__ = "Development"
+
+# ==============================================================================
+# description     :ledger of the finished cases of a sweep, so a restarted
+#                  sweep skips them and the result csv can be rebuilt from it
+# date            :2018-08-19
+# notes           :one json object per line, appended and flushed after every
+#                  case, the last entry of a case wins
+# python_version  :3.6
+# ==============================================================================
+
+import os
+import json
+import time
+import shutil
+import hashlib
+import threading
+
+
+def json_default(value):
+    # json.dump default for numpy arrays and scalars, the 1 element arrays openMDAO hands out become scalars
+    if hasattr(value, 'tolist'):
+        value = value.tolist()
+        if isinstance(value, list) and len(value) == 1:
+            value = value[0]
+        return value
+    return str(value)
+
+
+class RunLedger:
+
+    def __init__(self, file_path):
+        self.filePath = file_path
+        # case id -> last entry {'case', 'inputsHash', 'status', 'results', 'time'}
+        self.entries = dict()
+        # case ids in the order they were first recorded
+        self.caseOrder = []
+        self._lock = threading.Lock()
+        self.load()
+
+    @staticmethod
+    def inputs_hash(inputs):
+        # inputs: anything json can take, e.g. {'AOA': 2., 'config': config, 'mesh': meshDigest}
+        text = json.dumps(inputs, sort_keys=True, default=json_default)
+        return hashlib.sha256(text.encode('utf-8')).hexdigest()
+
+    @staticmethod
+    def file_digest(file_path):
+        # identifies e.g. a shared mesh, so the cases are rerun once it changed
+        hasher = hashlib.sha256()
+        inputF = open(file_path, 'rb')
+        for chunk in iter(lambda: inputF.read(1024 * 1024), b''):
+            hasher.update(chunk)
+        inputF.close()
+        return hasher.hexdigest()
+
+    def load(self):
+        self.entries = dict()
+        self.caseOrder = []
+        if not os.path.isfile(self.filePath):
+            return
+        inputF = open(self.filePath, 'r')
+        for i, line in enumerate(inputF):
+            if len(line.strip()) == 0:
+                continue
+            try:
+                entry = json.loads(line)
+            except ValueError:
+                # a line cut off by a crash, that case simply runs again
+                print('WARNING: skip broken line ' + str(i + 1) + ' of ledger ' + self.filePath)
+                continue
+            if entry['case'] not in self.entries:
+                self.caseOrder.append(entry['case'])
+            self.entries[entry['case']] = entry
+        inputF.close()
+
+    def is_done(self, case, inputs_hash):
+        # only successful cases with unchanged inputs count, failed ones run again
+        entry = self.entries.get(case, None)
+        return entry is not None and entry['status'] == 'ok' and entry['inputsHash'] == inputs_hash
+
+    def get_results(self, case):
+        entry = self.entries.get(case, None)
+        if entry is None:
+            return None
+        return entry['results']
+
+    def record(self, case, inputs_hash, results, status='ok'):
+        entry = dict()
+        entry['case'] = case
+        entry['inputsHash'] = inputs_hash
+        entry['status'] = status
+        entry['results'] = results
+        entry['time'] = time.time()
+        line = json.dumps(entry, default=json_default)
+        with self._lock:
+            outputF = open(self.filePath, 'a')
+            outputF.write(line + '\n')
+            outputF.flush()
+            os.fsync(outputF.fileno())
+            outputF.close()
+            if case not in self.entries:
+                self.caseOrder.append(case)
+            self.entries[case] = json.loads(line)
+
+    def get_counts(self):
+        counts = dict()
+        for entry in self.entries.values():
+            counts[entry['status']] = counts.get(entry['status'], 0) + 1
+        return counts
+
+    @staticmethod
+    def reset_project_dir(project_dir):
+        # a case that runs (again) starts from an empty project dir, left overs of a crashed run
+        # like an old history file must not end up in its results
+        if os.path.isdir(project_dir):
+            shutil.rmtree(project_dir)
+        os.makedirs(project_dir)
+
+    def write_csv(self, file_path, header, row_func, cases=None):
+        # rebuilds a result csv from the successful cases, row_func(case, results) returns the values
+        # of one line, cases gives the order (default: order of the ledger)
+        if cases is None:
+            cases = self.caseOrder
+        outputF = open(file_path, 'w')
+        outputF.write(header + '\n')
+        rowCount = 0
+        for case in cases:
+            entry = self.entries.get(case, None)
+            if entry is None or entry['status'] != 'ok':
+                continue
+            outputF.write(','.join(str(v) for v in row_func(case, entry['results'])) + '\n')
+            rowCount += 1
+        outputF.close()
+        return rowCount
@@ -2,9 +2,41 @@ __author__ = "Juri Bieler"
 __version__ = "0.0.1"
 __status__ = "Development"
 
-import subprocess
 import os
 import re
+import numpy as np
+
+from cfd.SU2Config import get_template, SU2Config
+from cfd.MpiLauncher import MpiLauncher
+from cfd.SU2Process import SU2Process, new_event_loop, run_processes
+
+# output options per named profile, values set explicitly in the run config take precedence
+OUTPUT_PROFILES = dict()
+# all field output, for designs that are looked at
+OUTPUT_PROFILES['full'] = {'WRT_VOL_SOL': True,
+                           'WRT_SRF_SOL': True,
+                           'WRT_CSV_SOL': True}
+# only history and forces breakdown, for optimization loop runs
+OUTPUT_PROFILES['lean'] = {'WRT_VOL_SOL': False,
+                           'WRT_SRF_SOL': False,
+                           'WRT_CSV_SOL': False,
+                           'WRT_CON_FREQ': 1}
+
+# history column -> (OBJECTIVE_FUNCTION, suffix SU2 adds to the adjoint files)
+ADJOINT_OBJECTIVES = dict()
+ADJOINT_OBJECTIVES['CD'] = ('DRAG', 'cd')
+ADJOINT_OBJECTIVES['CL'] = ('LIFT', 'cl')
+ADJOINT_OBJECTIVES['CMz'] = ('MOMENT_Z', 'cmz')
+
+# number pattern that needs at least one digit, unlike [-+]?[0-9]*\.?[0-9]*
+_NUMBER = r'[-+]?(?:\d+\.?\d*|\.\d+)(?:[eE][-+]?\d+)?'
+# "Total CL:    0.349 | Pressure (101.1%):    0.353 | Friction ( -1.1%):  -0.004"
+# inside a surface block the total carries its share as well: "Total CL (100.000%): ..."
+_BREAKDOWN_TOTAL_RE = re.compile(r'^Total\s+(?P<name>[A-Za-z/]+)\s*(?:\(\s*(?P<share>' + _NUMBER + r')%\))?:'
+                                 r'\s*(?P<total>' + _NUMBER + r')')
+_BREAKDOWN_PART_RE = re.compile(r'\|\s*(?P<part>[A-Za-z]+)\s*\(\s*(?P<share>' + _NUMBER + r')%\):\s*(?P<value>' + _NUMBER + r')')
+_BREAKDOWN_SURFACE_RE = re.compile(r'^Surface name:\s*(?P<name>\S+)')
+
 
 class SU2:
 
@@ -12,138 +44,241 @@ class SU2:
         self.su2BinPath = su2_binaries_path
         self.usedCores = used_cores
         self.mpiExec = mpi_exec
+        self.launcher = MpiLauncher(mpi_exec)
+        # solver command without the config file, can be replaced by a stand-in like
+        # [sys.executable, 'cfd/su2Standin.py']
+        self.cfdCommand = [os.path.abspath(self.su2BinPath + '/SU2_CFD')]
+        # discrete adjoint solver, the stand-in covers it as well
+        self.adjointCommand = [os.path.abspath(self.su2BinPath + '/SU2_CFD_AD')]
+        # key of OUTPUT_PROFILES used for run_cfd
+        self.outputProfile = 'full'
         self.errorFlag = False
-        self.copyComments = False
+        # CONV_FILENAME with the extension SU2 adds for the PARAVIEW output format
+        self.historyFileName = 'history.vtk'
+        # optional ConvergenceMonitor, stops the solver once the coefficients converged
+        self.monitor = None
+        self.stopReason = ''
+        # SU2RunResult of the last blocking run_cfd call
+        self.lastResult = None
+        # SolverFailure of the last run, None if it was not killed by the monitor
+        self.failure = None
 
-    def fix_mesh(self, input_su2_file, output_su2_file, working_dir='outDir/'):
+    def create_mesh_fix_process(self, input_su2_file, output_su2_file, working_dir='outDir/', timeout=None):
         config = dict()
         config['MESH_FILENAME'] = input_su2_file
         config['MESH_OUT_FILENAME'] = output_su2_file
         self.generate_config_file('meshFix.cfg', config, working_dir=working_dir)
-        p = subprocess.Popen([self.su2BinPath + '/SU2_MSH',
-                              'meshFix.cfg'],
-                             cwd=working_dir, stdout=subprocess.PIPE)
-        out, err = p.communicate()
-        print(out.decode('UTF-8'))
-        if err is not None:
-            print('SU2_MSH process failed')
+        return SU2Process([os.path.abspath(self.su2BinPath + '/SU2_MSH'), 'meshFix.cfg'],
+                          working_dir=working_dir, log_name='su2_msh', timeout=timeout)
+
+    def fix_mesh(self, input_su2_file, output_su2_file, working_dir='outDir/'):
+        process = self.create_mesh_fix_process(input_su2_file, output_su2_file, working_dir=working_dir)
+        result = run_processes([process])[0]
+        logF = open(result.logFile, 'r', errors='replace')
+        success = 'Exit Success (SU2_MSH)' in logF.read()
+        logF.close()
+        if result.exitCode != 0 or not success:
+            print('SU2_MSH process failed, see ' + result.logFile)
             self.errorFlag = True
-        if 'Exit Success (SU2_MSH)' in out.decode('UTF-8'):
+        else:
             print('SU2_MSH process successful')
 
-    def write_single_core_batch_file(self, input_cfg_file='cfdRun.cfg', working_dir='outDir/'):
-        runCommand = '"'
-        runCommand += os.path.abspath(self.su2BinPath) + '/SU2_CFD.exe'
-        runCommand += '" '
-        runCommand += input_cfg_file
-        ouputF = open(working_dir + '/' + 'singleCoreCfdRun.bat', 'w')
-        ouputF.write(runCommand)
-        ouputF.close()
-
-    def write_multi_core_batch_file(self, input_cfg_file='cfdRun.cfg', working_dir='outDir/'):
-        runCommand = 'powershell.exe -Command '
-        runCommand += '"'
-        runCommand += self.mpiExec + ' '
-        runCommand += '-n ' + str(self.usedCores) + ' '
-        runCommand += os.path.abspath(self.su2BinPath) + '/SU2_CFD.exe '
-        runCommand += input_cfg_file
-        runCommand += '"'
-
-        ouputF = open(working_dir + '/' + 'cfdMpiRun.bat', 'w')
-        ouputF.write(runCommand)
-        ouputF.close()
+    def read_mesh_point_count(self, su2_file, working_dir='outDir/'):
+        f = open(os.path.join(working_dir, su2_file), 'r')
+        for line in f:
+            if line.startswith('NPOIN'):
+                f.close()
+                return int(line.split('=')[1].split()[0])
+        f.close()
+        return -1
 
-    def run_cfd(self, input_su2_file, configDict, input_cfg_file='cfdRun.cfg', working_dir='outDir/'):
+    def create_cfd_process(self, input_su2_file, configDict, input_cfg_file='cfdRun.cfg', working_dir='outDir/', timeout=None):
+        # the returned SU2Process is started with await process.start() or await process.run()
         configDict['MESH_FILENAME'] = input_su2_file
-        self.generate_config_file('cfdRun.cfg', configDict, working_dir=working_dir)
+        runConfig = SU2Config(OUTPUT_PROFILES[self.outputProfile])
+        runConfig.update(configDict)
+        self.generate_config_file(input_cfg_file, runConfig, working_dir=working_dir)
+        command = self.launcher.get_command(self.cfdCommand, [input_cfg_file], self.usedCores, working_dir=working_dir)
+        historyFileName = self.historyFileName
+        if 'CONV_FILENAME' in configDict:
+            # runs with their own history, e.g. the full output restart
+            historyFileName = configDict['CONV_FILENAME'] + os.path.splitext(self.historyFileName)[1]
+        return SU2Process(command, working_dir=working_dir, log_name='su2_cfd', timeout=timeout,
+                          history_path=working_dir + '/' + historyFileName, monitor=self.monitor)
+
+    def create_adjoint_process(self, input_su2_file, configDict, column, solution_file='restart_flow.dat',
+                               used_cores=None, working_dir='outDir/', timeout=None):
+        # discrete adjoint of one coefficient (key of ADJOINT_OBJECTIVES) on the converged flow solution,
+        # every coefficient gets its own cfg, history and surface_adjoint file, so they can run side by side
+        objective, suffix = ADJOINT_OBJECTIVES[column]
+        runConfig = SU2Config(configDict)
+        runConfig['MESH_FILENAME'] = input_su2_file
+        runConfig['MATH_PROBLEM'] = 'DISCRETE_ADJOINT'
+        runConfig['OBJECTIVE_FUNCTION'] = objective
+        runConfig['SOLUTION_FLOW_FILENAME'] = solution_file
+        runConfig['RESTART_SOL'] = False
+        runConfig['CONV_FILENAME'] = 'history_adj_' + suffix
+        runConfig['RESTART_ADJ_FILENAME'] = 'restart_adj_' + suffix + '.dat'
+        runConfig['SURFACE_ADJ_FILENAME'] = 'surface_adjoint_' + suffix
+        # the sensitivities are only written to the surface csv
+        runConfig['WRT_CSV_SOL'] = True
+        runConfig['WRT_VOL_SOL'] = False
+        runConfig['WRT_SRF_SOL'] = False
+        inputCfgFile = 'cfdRunAdjoint_' + suffix + '.cfg'
+        self.generate_config_file(inputCfgFile, runConfig, working_dir=working_dir)
+        cores = self.usedCores if used_cores is None else used_cores
+        command = self.launcher.get_command(self.adjointCommand, [inputCfgFile], cores, working_dir=working_dir)
+        return SU2Process(command, working_dir=working_dir, log_name='su2_cfd_ad_' + suffix, timeout=timeout,
+                          history_path=working_dir + '/history_adj_' + suffix + os.path.splitext(self.historyFileName)[1])
+
+    async def run_cfd_async(self, input_su2_file, configDict, input_cfg_file='cfdRun.cfg', working_dir='outDir/', timeout=None):
+        process = self.create_cfd_process(input_su2_file, configDict, input_cfg_file=input_cfg_file,
+                                          working_dir=working_dir, timeout=timeout)
         print('run SU2_CFD on ' + str(self.usedCores) + ' core(s)...')
-        if self.usedCores == 1:
-            p = subprocess.Popen([self.su2BinPath + '/SU2_CFD',
-                                  input_cfg_file],
-                                 cwd=working_dir)#, stdout=subprocess.PIPE)
-        else:
-            ####powershell.exe -Command "mpiexec ../../su2-windows-latest/ExecParallel/bin/SU2_CFD.exe cfdRun.cfg"
-            self.write_multi_core_batch_file(input_cfg_file=input_cfg_file, working_dir=working_dir)
-            batchFilePath = os.path.abspath(working_dir + '/' + 'cfdMpiRun.bat')
-            p = subprocess.Popen([batchFilePath], cwd=working_dir)
-        p.wait()
-        '''
-        out, err = p.communicate()
-        print(out.decode('UTF-8'))
-        if err is not None:
-            print('SU2_MSH process failed')
-            self.errorFlag = True
-        if 'Exit Success (SU2_CFD)' in out.decode('UTF-8'):
-            print('SU2_CFD process successful')
-        '''
+        result = await process.run()
+        self.stopReason = result.stopReason
+        self.failure = result.failure
+        if self.monitor is not None:
+            self.monitor.write_log(working_dir + '/' + 'convergence.log')
+        return result
 
+    def run_cfd(self, input_su2_file, configDict, input_cfg_file='cfdRun.cfg', working_dir='outDir/', timeout=None):
+        # blocking version of run_cfd_async, the solver output goes to su2_cfd.log in the working dir
+        loop = new_event_loop()
+        try:
+            result = loop.run_until_complete(self.run_cfd_async(input_su2_file, configDict, input_cfg_file=input_cfg_file,
+                                                                working_dir=working_dir, timeout=timeout))
+        finally:
+            loop.close()
+        self.lastResult = result
+        return self.stopReason
 
     def generate_config_file(self, ouput_cfg_file_name, configDict, working_dir='outDir/', default_cfg_file_path='dataIn/default.cfg'):
-        inputF =  open(default_cfg_file_path, 'r')
-        lines = inputF.read().splitlines()
-        config = configDict.copy()
-
+        template = get_template(default_cfg_file_path)
         ouputF = open(working_dir + '/' + ouput_cfg_file_name, 'w')
-
-        for line in lines:
-            #just copy the comments
-            if len(line) > 0:
-                if line.lstrip()[0] == '%' and self.copyComments:
-                    ouputF.write(line + '\n')
-                else:
-                    paramName = line.strip().replace(' ','').split('=')[0].upper()
-                    if paramName in config.keys():
-                        ouputF.write(paramName + '= ' + config[paramName] + '\n')
-                        del config[paramName]
-                    else:
-                        ouputF.write(line + '\n')
-            else:
-                ouputF.write('\n')
-        inputF.close()
-        # add remaining config variables if there are any
-        if len(config) > 0:
-            ouputF.write('\n%remaining custom variables\n')
-            for key, value in config.items():
-                ouputF.write(key + '= ' + value + '\n')
+        ouputF.write(template.render(configDict))
         ouputF.close()
 
     def parse_force_breakdown(self, forces_breakdown_file_name, working_dir='outDir/'):
-        f = open(working_dir + '/' + forces_breakdown_file_name)
-        lines = f.read().splitlines()
-        totalCL = 0.
-        totalCD = 0.
-        totalCM = 0.
-        totalE = 0.
-        for l in lines:
-            if 'Total CL:' in l:
-                totalCL = float(self._parse_param_from_row(l))
-            if 'Total CD:' in l:
-                totalCD = float(self._parse_param_from_row(l))
-            if 'Total CL/CD:' in l:
-                totalE = float(self._parse_param_from_row(l))
-            if 'Total CMz:' in l:
-                totalCM = float(self._parse_param_from_row(l))
+        totals = self.load_force_breakdown(forces_breakdown_file_name, working_dir=working_dir)['totals']
+        totalCL = totals.get('CL', {}).get('total', 0.)
+        totalCD = totals.get('CD', {}).get('total', 0.)
+        totalCM = totals.get('CMz', {}).get('total', 0.)
+        totalE = totals.get('CL/CD', {}).get('total', 0.)
         return totalCL, totalCD, totalCM, totalE
 
+    def load_force_breakdown(self, forces_breakdown_file_name, working_dir='outDir/'):
+        # returns {'totals': {'CD': {'total': .., 'pressure': .., 'friction': .., ...}, ...},
+        #          'markers': {'airfoil': {'CD': {'total': .., 'share': .., 'pressure': .., ...}, ...}}}
+        # the pressure/friction shares in percent are stored as 'pressure_share', 'friction_share'
+        breakdown = {'totals': dict(), 'markers': dict()}
+        target = breakdown['totals']
+        f = open(working_dir + '/' + forces_breakdown_file_name, 'r')
+        for line in f:
+            line = line.strip()
+            match = _BREAKDOWN_TOTAL_RE.match(line)
+            if match is None:
+                match = _BREAKDOWN_SURFACE_RE.match(line)
+                if match is not None:
+                    target = breakdown['markers'].setdefault(match.group('name'), dict())
+                continue
+            entry = {'total': float(match.group('total'))}
+            if match.group('share') is not None:
+                entry['share'] = float(match.group('share'))
+            for part in _BREAKDOWN_PART_RE.finditer(line, match.end()):
+                name = part.group('part').lower()
+                entry[name] = float(part.group('value'))
+                entry[name + '_share'] = float(part.group('share'))
+            target[match.group('name')] = entry
+        f.close()
+        return breakdown
+
+    def load_surface_flow(self, surface_file_name='surface_flow.csv', working_dir='outDir/'):
+        # loads a surface csv (Cp, Cf, y+ ... per surface point) in one bulk parse,
+        # returns a dict of contiguous columns, e.g. surface['Pressure_Coefficient']
+        f = open(working_dir + '/' + surface_file_name, 'rb')
+        paraNames = self._read_history_header(f)
+        text = f.read()
+        f.close()
+        values = np.array(text.replace(b',', b' ').split(), dtype=float)
+        rowCount = len(values) // len(paraNames)
+        values = values[:rowCount * len(paraNames)].reshape(rowCount, len(paraNames))
+        return dict((name, np.ascontiguousarray(values[:, i])) for i, name in enumerate(paraNames))
+
+    def load_surface_adjoint(self, column, working_dir='outDir/'):
+        # surface sensitivities of the adjoint run of column (see create_adjoint_process), returns
+        # {'point', 'x', 'y', 'sens'} and 'sensX', 'sensY' if the solver wrote the vector, None if there is no file,
+        # 'sens' is the SU2 6.x density along the normal into the airfoil
+        suffix = ADJOINT_OBJECTIVES[column][1]
+        # depending on the version SU2 appends the objective suffix to the file name a second time
+        for name in ['surface_adjoint_' + suffix + '.csv', 'surface_adjoint_' + suffix + '_' + suffix + '.csv']:
+            if os.path.isfile(working_dir + '/' + name):
+                break
+        else:
+            return None
+        surface = self.load_surface_flow(name, working_dir=working_dir)
+        sensitivity = dict()
+        sensitivity['point'] = (surface['PointID'] if 'PointID' in surface else surface['Point']).astype(np.int64)
+        sensitivity['x'] = surface['x'] if 'x' in surface else surface['x_coord']
+        sensitivity['y'] = surface['y'] if 'y' in surface else surface['y_coord']
+        sensitivity['sens'] = surface['Surface_Sensitivity'] if 'Surface_Sensitivity' in surface else surface['Sensitivity']
+        if 'Sensitivity_x' in surface and 'Sensitivity_y' in surface:
+            sensitivity['sensX'] = surface['Sensitivity_x']
+            sensitivity['sensY'] = surface['Sensitivity_y']
+        return sensitivity
+
+    def _read_history_header(self, history_file):
+        paraNames = history_file.readline().decode('UTF-8').strip().split(',')
+        return [p.strip().replace('"', '') for p in paraNames]
+
+    def _read_last_record(self, history_file, field_count, block_size=4096):
+        # seeks backwards from the end until a complete record is found, a half written
+        # line of a still running solver is skipped
+        history_file.seek(0, os.SEEK_END)
+        pos = history_file.tell()
+        tail = b''
+        while pos > 0:
+            readSize = min(block_size, pos)
+            pos -= readSize
+            history_file.seek(pos)
+            tail = history_file.read(readSize) + tail
+            lines = tail.split(b'\n')
+            # the first line might be cut off unless we reached the start of the file
+            if pos > 0:
+                lines = lines[1:]
+            if not tail.endswith(b'\n'):
+                lines = lines[:-1]
+            for line in reversed(lines):
+                values = line.decode('UTF-8').strip().replace(' ', '').split(',')
+                if len(values) == field_count and len(values[0]) > 0:
+                    return values
+        return None
+
     def parse_result_from_history(self, history_file_name, working_dir='outDir/'):
-        f = open(working_dir + '/' + history_file_name)
-        lines = f.read().splitlines()
         outDict = dict()
-        paraNames = lines[0].split(',')
-        paraNames = [p.replace('"', '') for p in paraNames]
-        finalLine = lines[-1]
-        if len(finalLine) == 0:
-            finalLine = lines[-2]
-        finalLine = finalLine.strip().replace(' ', '')
-        values = finalLine.split(',')
-        if len(paraNames) != len(values):
+        f = open(working_dir + '/' + history_file_name, 'rb')
+        paraNames = self._read_history_header(f)
+        values = self._read_last_record(f, len(paraNames))
+        f.close()
+        if values is None:
             print('ERROR: csv is not homegenious, file path: ' + working_dir + '/' + history_file_name)
+            return outDict
         for i in range(0, len(values)):
             outDict[paraNames[i]] = values[i]
         return outDict
 
-    def _parse_param_from_row(self, rowStr):
-        rowStr = rowStr.strip()
-        rowStr = rowStr.replace(' ', '')
-        param = list(filter(None, re.findall(r"[-+]?[0-9]*\.?[0-9]*", rowStr)))
-        return param[0]
\ No newline at end of file
+    def load_history(self, history_file_name, working_dir='outDir/'):
+        # loads the whole history as numpy structured array in one bulk parse,
+        # fields are named like the history columns, e.g. history['CD']
+        f = open(working_dir + '/' + history_file_name, 'rb')
+        paraNames = self._read_history_header(f)
+        text = f.read()
+        f.close()
+        # drop a half written last line
+        if len(text) > 0 and not text.endswith(b'\n'):
+            text = text[:text.rfind(b'\n') + 1]
+        values = np.array(text.replace(b',', b' ').split(), dtype=float)
+        rowCount = len(values) // len(paraNames)
+        values = np.ascontiguousarray(values[:rowCount * len(paraNames)])
+        dtype = np.dtype([(name, np.float64) for name in paraNames])
+        return values.view(dtype)
@@ -0,0 +1,133 @@
+__author__ = "Juri Bieler"
+__version__ = "0.0.1"
+__status__ = "Development"
+
+# ==============================================================================
+# description     :parses the SU2 default config once and renders run configs
+#                  from typed overrides
+# date            :2018-08-07
+# notes           :
+# python_version  :3.6
+# ==============================================================================
+
+import os
+
+# abs path -> (mtime, SU2ConfigTemplate)
+_TEMPLATE_CACHE = dict()
+
+
+def format_value(value):
+    # converts python values to the notation used in SU2 config files
+    if hasattr(value, 'tolist'):
+        # numpy scalars and the 1 element arrays openMDAO hands out
+        value = value.tolist()
+        if isinstance(value, list) and len(value) == 1:
+            value = value[0]
+    if isinstance(value, bool):
+        return 'YES' if value else 'NO'
+    if isinstance(value, (list, tuple)):
+        return '( ' + ', '.join(format_value(v) for v in value) + ' )'
+    return str(value)
+
+
+class SU2ConfigTemplate:
+
+    def __init__(self, file_path):
+        self.filePath = file_path
+        inputF = open(file_path, 'r')
+        self.lines = inputF.read().splitlines()
+        inputF.close()
+        # param name -> line index of its first occurrence
+        self.keyLines = dict()
+        # param name -> value as written in the template, in file order
+        self.values = dict()
+        self.keyOrder = []
+        for i, line in enumerate(self.lines):
+            stripped = line.strip()
+            if len(stripped) == 0 or stripped[0] == '%' or '=' not in stripped:
+                continue
+            key, _, value = stripped.partition('=')
+            key = key.replace(' ', '').upper()
+            if key not in self.keyLines:
+                self.keyLines[key] = i
+                self.values[key] = value.strip()
+                self.keyOrder.append(key)
+
+    def get(self, key, default=None):
+        return self.values.get(key.upper(), default)
+
+    def render(self, overrides):
+        lines = list(self.lines)
+        remaining = []
+        for key, value in overrides.items():
+            key = key.upper()
+            if key in self.keyLines:
+                lines[self.keyLines[key]] = key + '= ' + format_value(value)
+            else:
+                remaining.append(key + '= ' + format_value(value))
+        # add remaining config variables if there are any
+        if len(remaining) > 0:
+            lines.append('')
+            lines.append('%remaining custom variables')
+            lines.extend(remaining)
+        return '\n'.join(lines) + '\n'
+
+
+def get_template(file_path):
+    # parsed templates are cached per path and reparsed only if the file changed
+    absPath = os.path.abspath(file_path)
+    mtime = os.path.getmtime(absPath)
+    cached = _TEMPLATE_CACHE.get(absPath, None)
+    if cached is None or cached[0] != mtime:
+        cached = (mtime, SU2ConfigTemplate(absPath))
+        _TEMPLATE_CACHE[absPath] = cached
+    return cached[1]
+
+
+class SU2Config(dict):
+    # dict of SU2 options that accepts typed values:
+    # config['EXT_ITER'] = 5000, config['FIXED_CL_MODE'] = False, config['MARKER_FAR'] = ['farfield']
+
+    def __init__(self, *args, **kwargs):
+        dict.__init__(self)
+        self.update(*args, **kwargs)
+
+    def __setitem__(self, key, value):
+        dict.__setitem__(self, key.upper(), format_value(value))
+
+    def __getitem__(self, key):
+        return dict.__getitem__(self, key.upper())
+
+    def __contains__(self, key):
+        return dict.__contains__(self, key.upper())
+
+    def __delitem__(self, key):
+        dict.__delitem__(self, key.upper())
+
+    def get(self, key, default=None):
+        return dict.get(self, key.upper(), default)
+
+    def pop(self, key, *default):
+        return dict.pop(self, key.upper(), *default)
+
+    def setdefault(self, key, default=None):
+        if key not in self:
+            self[key] = default
+        return self[key]
+
+    def update(self, *args, **kwargs):
+        for key, value in dict(*args, **kwargs).items():
+            self[key] = value
+
+    def get_run_value(self, key, default_cfg_file_path='dataIn/default.cfg'):
+        # the value the solver runs with: the one set here, else the one of the config template
+        if key in self:
+            return self[key]
+        return get_template(default_cfg_file_path).get(key)
+
+    def set(self, key, value):
+        self[key] = value
+        return self
+
+    def copy(self):
+        return SU2Config(self)
@@ -0,0 +1,263 @@
+__author__ = "Juri Bieler"
+__version__ = "0.0.1"
+__status__ = "Development"
+
+# ==============================================================================
+# description     :asyncio driven SU2 runs, output goes to rotating log files,
+#                  the history can be followed as async iterator and one event
+#                  loop can supervise many runs at once
+# date            :2018-08-15
+# notes           :
+# python_version  :3.8
+# ==============================================================================
+
+import asyncio
+import subprocess
+import os
+import sys
+import time
+
+from cfd.ConvergenceMonitor import ConvergenceMonitor, SolverDivergedError, SolverStalledError
+
+
+# asyncio subprocesses can only be started from worker threads (SolverScheduler, CFDPipeline) since 3.8
+MIN_PYTHON_VERSION = (3, 8)
+
+
+def new_event_loop():
+    if sys.version_info < MIN_PYTHON_VERSION:
+        raise RuntimeError('SU2Process needs python >= %d.%d, running %d.%d'
+                           % (MIN_PYTHON_VERSION + tuple(sys.version_info[:2])))
+    # subprocesses need the proactor loop on windows
+    if sys.platform == 'win32':
+        return asyncio.ProactorEventLoop()
+    return asyncio.new_event_loop()
+
+
+class RotatingLog:
+
+    def __init__(self, file_path, max_bytes=10 * 1024 * 1024, backup_count=3):
+        # file_path.1 ... file_path.<backup_count> keep the older output
+        self.filePath = file_path
+        self.maxBytes = max_bytes
+        self.backupCount = backup_count
+        self.fileNames = [file_path]
+        self._file = open(file_path, 'wb')
+        self._size = 0
+
+    def _rotate(self):
+        self._file.close()
+        for i in range(self.backupCount - 1, 0, -1):
+            if os.path.isfile(self.filePath + '.' + str(i)):
+                os.replace(self.filePath + '.' + str(i), self.filePath + '.' + str(i + 1))
+        if self.backupCount > 0:
+            os.replace(self.filePath, self.filePath + '.1')
+        self._file = open(self.filePath, 'wb')
+        self._size = 0
+
+    def write(self, data):
+        if self._size > 0 and self._size + len(data) > self.maxBytes:
+            self._rotate()
+        self._file.write(data)
+        self._file.flush()
+        self._size += len(data)
+
+    def close(self):
+        self._file.close()
+
+
+class SU2RunResult:
+
+    def __init__(self):
+        # 'finished', 'failed', 'converged' (stopped by the monitor), 'diverged', 'stalled',
+        # 'timeout' or 'cancelled'
+        self.status = ''
+        self.exitCode = None
+        self.stopReason = ''
+        self.iterations = 0
+        # last history record, e.g. coefficients['CD']
+        self.coefficients = dict()
+        self.wallTime = 0.
+        self.logFile = ''
+        self.errorLogFile = ''
+        # SolverFailure if the monitor killed the run as hopeless
+        self.failure = None
+
+    def is_success(self):
+        return self.status in ['finished', 'converged']
+
+    def __repr__(self):
+        return 'SU2RunResult(status=' + self.status + ', exitCode=' + str(self.exitCode) \
+               + ', iterations=' + str(self.iterations) + ', CD=' + str(self.coefficients.get('CD', None)) + ')'
+
+
+class SU2Process:
+
+    def __init__(self, command, working_dir='outDir/', log_name='su2', timeout=None, history_path=None, monitor=None):
+        self.command = command
+        self.workingDir = working_dir
+        self.logName = log_name
+        # seconds until the run is killed, None waits forever
+        self.timeout = timeout
+        # history file to follow, None for binaries without history like SU2_MSH
+        self.historyPath = history_path
+        # a ConvergenceMonitor stops the run once converged, without one the history is only read
+        self.monitor = monitor
+        self.reader = monitor if monitor is not None else ConvergenceMonitor()
+        self.pollInterval = self.reader.pollInterval
+        self.process = None
+        self.result = SU2RunResult()
+        self._finished = False
+        self._cancelled = False
+        self._changed = None
+        self._watchTask = None
+
+    async def start(self):
+        self.reader.reset()
+        self._changed = asyncio.Condition()
+        self._startTime = time.time()
+        self.stdoutLog = RotatingLog(self.workingDir + '/' + self.logName + '.log')
+        self.stderrLog = RotatingLog(self.workingDir + '/' + self.logName + '.err.log')
+        self.process = await asyncio.create_subprocess_exec(*self.command,
+                                                            cwd=self.workingDir,
+                                                            stdout=subprocess.PIPE,
+                                                            stderr=subprocess.PIPE)
+        self._watchTask = asyncio.ensure_future(self._watch())
+        return self
+
+    async def _pump(self, stream, log):
+        while True:
+            chunk = await stream.read(65536)
+            if len(chunk) == 0:
+                break
+            log.write(chunk)
+
+    async def _notify(self):
+        async with self._changed:
+            self._changed.notify_all()
+
+    async def _watch(self):
+        # follows the history until the process exited, then closes the logs and wakes up progress()
+        pumps = [asyncio.ensure_future(self._pump(self.process.stdout, self.stdoutLog)),
+                 asyncio.ensure_future(self._pump(self.process.stderr, self.stderrLog))]
+        exited = asyncio.ensure_future(self.process.wait())
+        while not exited.done():
+            await asyncio.wait([exited], timeout=self.pollInterval)
+            if self.historyPath is None or self.reader.read_new_records(self.historyPath) == 0:
+                continue
+            await self._notify()
+            if self.monitor is not None and self.result.stopReason == '':
+                reason = self.monitor.check()
+                if reason is None:
+                    continue
+                self.result.stopReason = reason
+                self.result.failure = self.monitor.failure
+                if self.monitor.failure is not None:
+                    # hopeless runs get no grace period
+                    self.monitor.stopIteration = self.monitor.failure.iteration
+                    print('kill ' + self.logName + ' at iteration ' + str(self.monitor.stopIteration) + ': ' + reason)
+                    self.process.kill()
+                    await self.process.wait()
+                else:
+                    self.monitor.stopIteration = self.monitor.get_iteration()
+                    print('stop ' + self.logName + ' at iteration ' + str(self.monitor.stopIteration) + ': ' + reason)
+                    await self._stop()
+        await asyncio.gather(*pumps)
+        self.stdoutLog.close()
+        self.stderrLog.close()
+        if self.historyPath is not None:
+            self.reader.read_new_records(self.historyPath)
+        self._finished = True
+        await self._notify()
+
+    async def _stop(self):
+        if self.process.returncode is not None:
+            return
+        self.process.terminate()
+        try:
+            await asyncio.wait_for(self.process.wait(), self.reader.stopGracePeriod)
+        except asyncio.TimeoutError:
+            self.process.kill()
+            await self.process.wait()
+
+    def cancel(self):
+        # can be called from any coroutine of the same loop, wait() then returns a 'cancelled' result
+        self._cancelled = True
+        if self.process is not None and self.process.returncode is None:
+            self.process.terminate()
+
+    async def progress(self):
+        # async iterator over the history records, every record is a dict like {'Iteration': 12., 'CD': 0.01, ...}
+        index = 0
+        while True:
+            async with self._changed:
+                await self._changed.wait_for(lambda: len(self.reader.records) > index or self._finished)
+            records = self.reader.records
+            while index < len(records):
+                yield dict(zip(self.reader.paraNames, records[index]))
+                index += 1
+            if self._finished and index >= len(self.reader.records):
+                return
+
+    async def wait(self):
+        try:
+            await asyncio.wait_for(asyncio.shield(self._watchTask), self.timeout)
+        except asyncio.TimeoutError:
+            print('ERROR: ' + self.logName + ' did not finish within ' + str(self.timeout) + ' s, killing it')
+            self.result.status = 'timeout'
+            self.result.stopReason = 'timeout after ' + str(self.timeout) + ' s'
+            await self._stop()
+            await self._watchTask
+        except asyncio.CancelledError:
+            self.cancel()
+            await self._stop()
+            await self._watchTask
+            raise
+        return self._make_result()
+
+    def _make_result(self):
+        result = self.result
+        result.exitCode = self.process.returncode
+        result.wallTime = time.time() - self._startTime
+        result.logFile = self.stdoutLog.filePath
+        result.errorLogFile = self.stderrLog.filePath
+        if len(self.reader.records) > 0:
+            result.coefficients = dict(zip(self.reader.paraNames, self.reader.records[-1]))
+            result.iterations = self.reader.get_iteration()
+        if result.status == '':
+            if self._cancelled:
+                result.status = 'cancelled'
+                result.stopReason = 'cancelled'
+            elif isinstance(result.failure, SolverDivergedError):
+                result.status = 'diverged'
+            elif isinstance(result.failure, SolverStalledError):
+                result.status = 'stalled'
+            elif result.stopReason != '':
+                result.status = 'converged'
+            elif result.exitCode == 0:
+                result.status = 'finished'
+            else:
+                result.status = 'failed'
+        if result.stopReason == '':
+            result.stopReason = 'solver finished (exit code ' + str(result.exitCode) + ')'
+        if self.monitor is not None:
+            self.monitor.stopReason = result.stopReason
+            if self.monitor.stopIteration < 0:
+                self.monitor.stopIteration = result.iterations
+        return result
+
+    async def run(self):
+        await self.start()
+        return await self.wait()
+
+
+def run_processes(processes):
+    # supervises all SU2Process objects from one event loop, returns their results in order
+    async def run_all():
+        return await asyncio.gather(*[p.run() for p in processes])
+    loop = new_event_loop()
+    try:
+        results = loop.run_until_complete(run_all())
+    finally:
+        loop.close()
+    return list(results)
@@ -0,0 +1,81 @@
+__author__ = "Juri Bieler"
+__version__ = "0.0.1"
+__status__ = "Development"
+
+# ==============================================================================
+# description     :distributes solver jobs over the core budget, small meshes
+#                  run as several narrow jobs side by side, big meshes as one
+#                  wide MPI job
+# date            :2018-08-14
+# notes           :
+# python_version  :3.8
+# ==============================================================================
+
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from constants import *
+
+
+class SolverScheduler:
+
+    def __init__(self, total_cores=SU2_USED_CORES, min_points_per_core=SU2_MIN_POINTS_PER_CORE):
+        self.totalCores = max(1, total_cores)
+        # a rank with less points spends more time in communication than in solving
+        self.minPointsPerCore = min_points_per_core
+        self.freeCores = self.totalCores
+        self._cond = threading.Condition()
+
+    def cores_for(self, point_count):
+        # widest job that still keeps every rank busy, unknown mesh sizes get the whole budget
+        if point_count is None or point_count <= 0:
+            return self.totalCores
+        return max(1, min(self.totalCores, point_count // self.minPointsPerCore))
+
+    def plan(self, point_counts):
+        # cores per job, if there are less jobs than fit side by side the idle cores are shared out
+        widths = [self.cores_for(n) for n in point_counts]
+        spare = self.totalCores - sum(widths)
+        # one core at a time, widest jobs first, the sum stays within the budget
+        order = sorted(range(len(widths)), key=lambda i: -widths[i])
+        while spare > 0 and len(order) > 0:
+            for i in order[:spare]:
+                widths[i] += 1
+            spare = self.totalCores - sum(widths)
+        return widths
+
+    def _acquire(self, cores):
+        with self._cond:
+            while self.freeCores < cores:
+                self._cond.wait()
+            self.freeCores -= cores
+
+    def _release(self, cores):
+        with self._cond:
+            self.freeCores += cores
+            self._cond.notify_all()
+
+    def _run_job(self, func, cores):
+        self._acquire(cores)
+        try:
+            return func(cores)
+        finally:
+            self._release(cores)
+
+    def run(self, jobs):
+        # jobs: list of (point_count, func), func gets the number of cores and returns the result,
+        # the results are returned in submission order
+        if len(jobs) == 0:
+            return []
+        widths = self.plan([n for n, func in jobs])
+        print('schedule ' + str(len(jobs)) + ' solver job(s) on ' + str(self.totalCores)
+              + ' core(s), cores per job: ' + str(widths))
+        # wide jobs first, the narrow ones fill the gaps
+        order = sorted(range(len(jobs)), key=lambda i: -widths[i])
+        executor = ThreadPoolExecutor(max_workers=min(len(jobs), self.totalCores))
+        try:
+            futures = dict((i, executor.submit(self._run_job, jobs[i][1], widths[i])) for i in order)
+            results = [futures[i].result() for i in range(len(jobs))]
+        finally:
+            executor.shutdown(wait=True)
+        return results
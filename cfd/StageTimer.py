@@ -0,0 +1,239 @@
+__author__ = "Juri Bieler"
+__version__ = "0.0.1"
+__status__ = "Development"
+
+# ==============================================================================
+# description     :records wall time, cpu time and peak memory of the steps of
+#                  a cfd run, as json manifest per run and as one csv for all
+# date            :2018-08-18
+# notes           :child cpu time is the RUSAGE_CHILDREN difference over the
+#                  stage, it includes the mpi ranks once mpiexec reaped them.
+#                  peak rss is sampled from /proc, without /proc only the
+#                  ru_maxrss high water marks are available. both are process
+#                  wide, stages that ran at the same time as another one in
+#                  this process (pipeline threads) carry overlapping=True and
+#                  their cpu and memory figures include the other stages
+# python_version  :3.6
+# ==============================================================================
+
+import os
+import time
+import json
+import socket
+import threading
+from contextlib import contextmanager
+
+try:
+    import resource
+except ImportError:
+    # windows
+    resource = None
+
+
+CSV_FIELDS = ['run', 'stage', 'start', 'wallTime', 'cpuSelf', 'cpuChildren', 'peakRssSelfMB', 'peakRssChildrenMB', 'info',
+              'overlapping']
+
+_CSV_LOCK = threading.Lock()
+# records of the stages currently measured in this process, of all timers
+_ACTIVE_STAGES = dict()
+_ACTIVE_LOCK = threading.Lock()
+
+
+def _enter_stage(record):
+    with _ACTIVE_LOCK:
+        record['overlapping'] = len(_ACTIVE_STAGES) > 0
+        for other in _ACTIVE_STAGES.values():
+            other['overlapping'] = True
+        _ACTIVE_STAGES[id(record)] = record
+
+
+def _leave_stage(record):
+    with _ACTIVE_LOCK:
+        _ACTIVE_STAGES.pop(id(record), None)
+
+
+def _cpu_times():
+    # (self, children) user + system seconds
+    if resource is not None:
+        selfUsage = resource.getrusage(resource.RUSAGE_SELF)
+        childUsage = resource.getrusage(resource.RUSAGE_CHILDREN)
+        return selfUsage.ru_utime + selfUsage.ru_stime, childUsage.ru_utime + childUsage.ru_stime
+    times = os.times()
+    return times.user + times.system, times.children_user + times.children_system
+
+
+def _max_rss_mb():
+    # high water marks of this process and of all reaped children, kB on linux
+    if resource is None:
+        return None, None
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024., \
+           resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss / 1024.
+
+
+def _read_proc_table():
+    # pid -> (parent pid, rss in bytes)
+    table = dict()
+    pageSize = os.sysconf('SC_PAGE_SIZE')
+    for name in os.listdir('/proc'):
+        if not name.isdigit():
+            continue
+        try:
+            f = open('/proc/' + name + '/stat', 'r')
+            stat = f.read()
+            f.close()
+        except (IOError, OSError):
+            # the process ended in between
+            continue
+        # the command name in brackets may contain spaces
+        fields = stat[stat.rfind(')') + 2:].split()
+        table[int(name)] = (int(fields[1]), int(fields[21]) * pageSize)
+    return table
+
+
+class _PeakRssSampler:
+    # samples the resident memory of this process and of all its descendants in a background thread
+
+    def __init__(self, interval):
+        self.interval = interval
+        self.peakSelf = 0.
+        self.peakChildren = 0.
+        self.available = os.path.isfile('/proc/self/stat')
+        self._stopEvent = threading.Event()
+        self._thread = None
+
+    def _sample(self):
+        table = _read_proc_table()
+        pid = os.getpid()
+        children = dict()
+        for p, (parent, rss) in table.items():
+            children.setdefault(parent, []).append(p)
+        childRss = 0
+        stack = list(children.get(pid, []))
+        while len(stack) > 0:
+            p = stack.pop()
+            childRss += table[p][1]
+            stack.extend(children.get(p, []))
+        selfRss = table[pid][1] if pid in table else 0
+        self.peakSelf = max(self.peakSelf, selfRss / 1024. ** 2)
+        self.peakChildren = max(self.peakChildren, childRss / 1024. ** 2)
+
+    def _run(self):
+        while True:
+            self._sample()
+            if self._stopEvent.wait(self.interval):
+                break
+
+    def start(self):
+        if self.available:
+            self._thread = threading.Thread(target=self._run, name='rss-sampler')
+            self._thread.daemon = True
+            self._thread.start()
+
+    def stop(self):
+        if self._thread is not None:
+            self._stopEvent.set()
+            self._thread.join()
+
+
+class StageTimer:
+
+    def __init__(self, run_name, manifest_path=None, csv_path=None):
+        self.runName = run_name
+        # per run json, rewritten after every stage
+        self.manifestPath = manifest_path
+        # one line per stage of all runs, appended
+        self.csvPath = csv_path
+        # seconds between two memory samples
+        self.sampleInterval = 0.2
+        self.enabled = True
+        self.stages = []
+
+    @contextmanager
+    def stage(self, name, **info):
+        # with timer.stage('su2_cfd', cores=6) as record: ... record['info']['iterations'] = 1200
+        record = dict()
+        record['stage'] = name
+        record['start'] = time.time()
+        record['info'] = dict(info)
+        if not self.enabled:
+            yield record
+            return
+        _enter_stage(record)
+        sampler = _PeakRssSampler(self.sampleInterval)
+        sampler.start()
+        cpuSelf, cpuChildren = _cpu_times()
+        try:
+            yield record
+        finally:
+            sampler.stop()
+            endSelf, endChildren = _cpu_times()
+            _leave_stage(record)
+            record['wallTime'] = time.time() - record['start']
+            record['cpuSelf'] = endSelf - cpuSelf
+            record['cpuChildren'] = endChildren - cpuChildren
+            if sampler.available:
+                record['peakRssSelfMB'] = sampler.peakSelf
+                record['peakRssChildrenMB'] = sampler.peakChildren
+            else:
+                record['peakRssSelfMB'], record['peakRssChildrenMB'] = _max_rss_mb()
+            self.stages.append(record)
+            self.write_manifest()
+            self.append_csv(record)
+
+    def get_totals(self):
+        totals = dict()
+        for key in ['wallTime', 'cpuSelf', 'cpuChildren']:
+            totals[key] = sum(s[key] for s in self.stages)
+        peaks = [s['peakRssChildrenMB'] for s in self.stages if s['peakRssChildrenMB'] is not None]
+        totals['peakRssChildrenMB'] = max(peaks) if len(peaks) > 0 else None
+        # the sums include other stages of this process if any stage overlapped
+        totals['overlapping'] = any(s.get('overlapping', False) for s in self.stages)
+        return totals
+
+    def write_manifest(self):
+        if self.manifestPath is None:
+            return
+        manifest = dict()
+        manifest['run'] = self.runName
+        manifest['host'] = socket.gethostname()
+        manifest['cpuCount'] = os.cpu_count()
+        manifest['stages'] = self.stages
+        manifest['totals'] = self.get_totals()
+        outputF = open(self.manifestPath, 'w')
+        json.dump(manifest, outputF, indent=2)
+        outputF.close()
+
+    def append_csv(self, record):
+        if self.csvPath is None:
+            return
+        values = dict(record)
+        values['run'] = self.runName
+        values['info'] = ';'.join(k + '=' + str(v).replace(',', ' ') for k, v in sorted(record['info'].items()))
+        line = ','.join(str(values[f]) if values[f] is not None else '' for f in CSV_FIELDS)
+        with _CSV_LOCK:
+            writeHeader = not os.path.isfile(self.csvPath)
+            outputF = open(self.csvPath, 'a')
+            if writeHeader:
+                outputF.write(','.join(CSV_FIELDS) + '\n')
+            outputF.write(line + '\n')
+            outputF.close()
+
+    def print_summary(self):
+        for s in self.stages:
+            print('%-20s wall %8.2f s  cpu self %8.2f s  cpu children %8.2f s' %
+                  (s['stage'], s['wallTime'], s['cpuSelf'], s['cpuChildren']))
+
+
+def load_stage_csv(csv_path):
+    # the aggregated csv as list of dicts with float columns, e.g. for capacity planning
+    rows = []
+    inputF = open(csv_path, 'r')
+    header = inputF.readline().strip().split(',')
+    for line in inputF:
+        values = dict(zip(header, line.rstrip('\n').split(',')))
+        for key in ['start', 'wallTime', 'cpuSelf', 'cpuChildren', 'peakRssSelfMB', 'peakRssChildrenMB']:
+            values[key] = float(values[key]) if values.get(key, '') != '' else None
+        values['overlapping'] = values.get('overlapping', '') == 'True'
+        rows.append(values)
+    inputF.close()
+    return rows
@@ -0,0 +1,62 @@
+__author__ = "Juri Bieler"
+__version__ = "0.0.1"
+__status__ = "Development"
+
+# ==============================================================================
+# description     :keeps the last converged flow solution, so the next design
+#                  on a mesh with the same topology can restart from it
+# date            :2018-08-10
+# notes           :
+# python_version  :3.6
+# ==============================================================================
+
+import os
+import shutil
+
+
+class WarmStart:
+
+    def __init__(self, storage_path):
+        # the solution is copied here, so it survives clean up of the project dir
+        self.storagePath = storage_path
+        self.pointCount = -1
+        self.sourceProject = ''
+        self.restartFileName = 'restart_flow.dat'
+        self.solutionFileName = 'solution_flow.dat'
+        # SU2 writes the restart file only every WRT_SOL_FREQ iterations and at the regular end,
+        # runs that are stopped early need intermediate writes
+        self.writeFrequency = 100
+
+    def is_available(self):
+        return self.pointCount > 0 and os.path.isfile(self.storagePath)
+
+    def is_compatible(self, point_count):
+        return self.is_available() and self.pointCount == point_count
+
+    def store(self, project_dir, point_count):
+        restartPath = project_dir + '/' + self.restartFileName
+        if not os.path.isfile(restartPath):
+            print('WARNING: no restart file to keep for warm start in ' + project_dir)
+            return False
+        shutil.copyfile(restartPath, self.storagePath)
+        self.pointCount = point_count
+        self.sourceProject = project_dir
+        return True
+
+    def provide(self, project_dir):
+        # copies the stored solution into the project dir as SU2 restart input
+        shutil.copyfile(self.storagePath, project_dir + '/' + self.solutionFileName)
+
+    def invalidate(self):
+        self.pointCount = -1
+        self.sourceProject = ''
+        if os.path.isfile(self.storagePath):
+            os.remove(self.storagePath)
+
+    def apply_to_config(self, config, restart):
+        config['WRT_SOL_FREQ'] = self.writeFrequency
+        config['RESTART_SOL'] = restart
+        if restart:
+            config['SOLUTION_FLOW_FILENAME'] = self.solutionFileName
+            # take AOA and iteration counter from the config, not from the restart file
+            config['DISCARD_INFILES'] = True
@@ -0,0 +1,377 @@
+__author__ = "Juri Bieler"
+__version__ = "0.0.1"
+__status__ = "Development"
+
+# ==============================================================================
+# description     :job queue on a shared file system, a broker submits cfd
+#                  cases, workers on any node that sees the queue dir pull
+#                  them, run them and write the results back
+# date            :2018-08-20
+# notes           :usage: python -m cfd.WorkQueue worker <queue dir> [max jobs]
+#                         python -m cfd.WorkQueue status <queue dir>
+#                  the workers have to run from the project root (same
+#                  relative WORKING_DIR and input files as the broker).
+#                  a job is claimed by renaming pending/<id>.json to
+#                  running/<id>.<worker>.json, the worker then writes its id
+#                  into that file, the mtime of that file is the heartbeat,
+#                  jobs without heartbeat go back to pending.
+#                  every attempt runs in its own project dir, a worker whose
+#                  running file disappeared kills its case, the first result
+#                  of a job wins (done files are published with a hard link)
+# python_version  :3.6
+# ==============================================================================
+
+import os
+import re
+import sys
+import json
+import time
+import signal
+import socket
+import subprocess
+import multiprocessing
+
+from cfd.BatchEvaluation import BatchEvaluator, evaluate_case, failed_result
+from cfd.RunLedger import json_default
+
+# job ids become file names, worker ids follow the last dot of the running file names
+JOB_ID_PATTERN = re.compile(r'^[A-Za-z0-9_+-][A-Za-z0-9_.+-]*$')
+WORKER_ID_PATTERN = re.compile(r'^[A-Za-z0-9_+-]+$')
+
+
+def _write_tmp(file_path, data):
+    tmpPath = file_path + '.' + socket.gethostname() + '_' + str(os.getpid()) + '.tmp'
+    outputF = open(tmpPath, 'w')
+    json.dump(data, outputF, default=json_default)
+    outputF.flush()
+    os.fsync(outputF.fileno())
+    outputF.close()
+    return tmpPath
+
+
+def _write_atomic(file_path, data):
+    # readers never see a half written file
+    os.replace(_write_tmp(file_path, data), file_path)
+
+
+def _publish_once(file_path, data):
+    # like _write_atomic, but never replaces an existing file: link() fails if the name exists, also on
+    # nfs, returns False if another writer was first
+    tmpPath = _write_tmp(file_path, data)
+    try:
+        os.link(tmpPath, file_path)
+        return True
+    except FileExistsError:
+        return False
+    finally:
+        os.remove(tmpPath)
+
+
+def _run_case_process(case, conn):
+    # child process of a worker, in its own session so the worker can kill the case with all solver processes
+    if hasattr(os, 'setsid'):
+        os.setsid()
+    conn.send(evaluate_case(case))
+    conn.close()
+
+
+def _kill_case_process(process, grace_period=10.):
+    if not process.is_alive():
+        process.join()
+        return
+    killpg = getattr(os, 'killpg', None)
+    if killpg is not None:
+        try:
+            killpg(process.pid, signal.SIGTERM)
+        except ProcessLookupError:
+            pass
+    else:
+        process.terminate()
+    process.join(grace_period)
+    if process.is_alive():
+        if killpg is not None:
+            try:
+                killpg(process.pid, signal.SIGKILL)
+            except ProcessLookupError:
+                pass
+        else:
+            process.kill()
+        process.join()
+
+
+def _read_json(file_path):
+    inputF = open(file_path, 'r')
+    data = json.load(inputF)
+    inputF.close()
+    return data
+
+
+class WorkQueue:
+
+    def __init__(self, queue_dir):
+        self.queueDir = queue_dir
+        self.pendingDir = queue_dir + '/pending'
+        self.runningDir = queue_dir + '/running'
+        self.doneDir = queue_dir + '/done'
+        for d in [self.pendingDir, self.runningDir, self.doneDir]:
+            if not os.path.isdir(d):
+                os.makedirs(d)
+        # seconds without heartbeat until a running job counts as lost
+        self.leaseTimeout = 60.
+        # a job is given up after this many lost leases
+        self.maxAttempts = 3
+        self.pollInterval = 1.
+        # running file name -> (last mtime, local time it was seen changing), the broker only compares
+        # its own clock, so the clocks of the nodes do not have to agree
+        self._leaseSeen = dict()
+
+    def _job_id(self, case):
+        return case['projectName']
+
+    def submit(self, case):
+        # case: dict like BatchEvaluator.make_case() builds it, returns the job id
+        jobId = self._job_id(case)
+        if not JOB_ID_PATTERN.match(jobId):
+            raise ValueError('job id ' + repr(jobId) + ' is no plain file name (letters, digits, _ + - .)')
+        job = dict()
+        job['id'] = jobId
+        job['attempt'] = 0
+        job['case'] = case
+        job['submitted'] = time.time()
+        _write_atomic(self.pendingDir + '/' + jobId + '.json', job)
+        return jobId
+
+    def submit_batch(self, designs, conditions, batch_name='batch', cores_per_case=1, **settings):
+        # same arguments as evaluate_batch, every design x condition becomes one job
+        evaluator = BatchEvaluator(batch_name, total_cores=cores_per_case, cores_per_case=cores_per_case)
+        for key, value in settings.items():
+            setattr(evaluator, key, value)
+        jobIds = []
+        for iD, design in enumerate(designs):
+            for iC, condition in enumerate(conditions):
+                jobIds.append(self.submit(evaluator.make_case(iD, iC, design, dict(condition), 0)))
+        print('queue ' + self.queueDir + ': submitted ' + str(len(jobIds)) + ' job(s)')
+        return jobIds
+
+    def get_result(self, job_id):
+        path = self.doneDir + '/' + job_id + '.json'
+        if not os.path.isfile(path):
+            return None
+        return _read_json(path)
+
+    def requeue_expired(self):
+        # puts jobs of dead workers back to pending, returns the number of requeued jobs
+        now = time.time()
+        requeued = 0
+        for entry in os.scandir(self.runningDir):
+            if not entry.name.endswith('.json'):
+                continue
+            try:
+                mtime = entry.stat().st_mtime
+            except FileNotFoundError:
+                # finished in between
+                continue
+            seen = self._leaseSeen.get(entry.name, None)
+            if seen is None or seen[0] != mtime:
+                self._leaseSeen[entry.name] = (mtime, now)
+                continue
+            if now - seen[1] < self.leaseTimeout:
+                continue
+            del self._leaseSeen[entry.name]
+            if self._requeue(entry.path):
+                requeued += 1
+        return requeued
+
+    def _requeue(self, running_path):
+        try:
+            job = _read_json(running_path)
+        except (FileNotFoundError, ValueError):
+            return False
+        if os.path.isfile(self.doneDir + '/' + job['id'] + '.json'):
+            # the worker died after writing its result
+            os.remove(running_path)
+            return False
+        worker = job.get('worker', 'unknown')
+        job['attempt'] += 1
+        if job['attempt'] >= self.maxAttempts:
+            print('ERROR: job ' + job['id'] + ' lost ' + str(job['attempt']) + ' times, give up')
+            result = failed_result(job['case'], 'worker lost (last: ' + worker + ')')
+            result['jobId'] = job['id']
+            result['worker'] = worker
+            _publish_once(self.doneDir + '/' + job['id'] + '.json', result)
+        else:
+            print('WARNING: worker ' + worker + ' lost job ' + job['id'] + ', requeue it')
+            _write_atomic(self.pendingDir + '/' + job['id'] + '.json', job)
+        try:
+            os.remove(running_path)
+        except FileNotFoundError:
+            pass
+        return True
+
+    def collect(self, job_ids, timeout=None):
+        # generator, yields the result dicts (see BatchEvaluator.evaluate) as they come in and
+        # requeues jobs of dead workers meanwhile
+        remaining = set(job_ids)
+        startTime = time.time()
+        while len(remaining) > 0:
+            for jobId in sorted(remaining):
+                result = self.get_result(jobId)
+                if result is not None:
+                    remaining.discard(jobId)
+                    yield result
+            if len(remaining) == 0:
+                break
+            if timeout is not None and time.time() - startTime > timeout:
+                print('ERROR: queue ' + self.queueDir + ': ' + str(len(remaining)) + ' job(s) not done in time')
+                break
+            self.requeue_expired()
+            time.sleep(self.pollInterval)
+
+    def get_status(self):
+        status = dict()
+        status['pending'] = len([n for n in os.listdir(self.pendingDir) if n.endswith('.json')])
+        status['running'] = len([n for n in os.listdir(self.runningDir) if n.endswith('.json')])
+        status['done'] = len([n for n in os.listdir(self.doneDir) if n.endswith('.json')])
+        workers = set()
+        for name in os.listdir(self.runningDir):
+            if not name.endswith('.json'):
+                continue
+            try:
+                workers.add(_read_json(self.runningDir + '/' + name).get('worker', 'unknown'))
+            except (FileNotFoundError, ValueError):
+                # finished in between
+                continue
+        status['workers'] = sorted(workers)
+        return status
+
+    def stop_workers(self):
+        # workers stop after their current job once this file exists
+        open(self.queueDir + '/stop', 'w').close()
+
+    def start_local_workers(self, count, max_jobs=None, env=None):
+        # workers as child processes of this node, e.g. for tests or a single box
+        if os.path.isfile(self.queueDir + '/stop'):
+            os.remove(self.queueDir + '/stop')
+        command = [sys.executable, '-m', 'cfd.WorkQueue', 'worker', self.queueDir]
+        if max_jobs is not None:
+            command.append(str(max_jobs))
+        workerEnv = dict(os.environ)
+        if env is not None:
+            workerEnv.update(env)
+        return [subprocess.Popen(command, env=workerEnv) for i in range(0, count)]
+
+
+class QueueWorker:
+
+    def __init__(self, queue_dir, worker_id=None):
+        self.queue = WorkQueue(queue_dir)
+        # host and pid, the dots are reserved for the file names
+        if worker_id is None:
+            worker_id = re.sub(r'[^A-Za-z0-9_+-]', '-', socket.gethostname()) + '-' + str(os.getpid())
+        if not WORKER_ID_PATTERN.match(worker_id):
+            raise ValueError('worker id ' + repr(worker_id) + ' may only have letters, digits, _ + -')
+        self.workerId = worker_id
+        # must be well below WorkQueue.leaseTimeout of the broker
+        self.heartbeatInterval = 5.
+        # seconds to wait for new jobs before the worker quits, None waits until the stop file shows up
+        self.idleTimeout = None
+        self.jobCount = 0
+
+    def claim(self):
+        # returns (job, running file path) or None if no job is pending
+        for name in sorted(os.listdir(self.queue.pendingDir)):
+            if not name.endswith('.json'):
+                continue
+            jobId = name[:-len('.json')]
+            runningPath = self.queue.runningDir + '/' + jobId + '.' + self.workerId + '.json'
+            try:
+                # only one worker wins the rename
+                os.rename(self.queue.pendingDir + '/' + name, runningPath)
+            except (FileNotFoundError, OSError):
+                continue
+            try:
+                job = _read_json(runningPath)
+            except ValueError:
+                print('ERROR: broken job file ' + runningPath)
+                os.remove(runningPath)
+                continue
+            # the lease names its worker, also the first heartbeat
+            job['worker'] = self.workerId
+            _write_atomic(runningPath, job)
+            return job, runningPath
+        return None
+
+    def run_job(self, job, running_path):
+        # runs the case in a child process and keeps the lease alive meanwhile, returns the result or None
+        # if the lease was lost (the broker requeued the job) and the case was killed
+        print('worker ' + self.workerId + ': run job ' + job['id'] + ' (attempt ' + str(job['attempt']) + ')')
+        case = dict(job['case'])
+        if job['attempt'] > 0:
+            # a falsely expired lease may still have the first attempt running somewhere
+            case['projectName'] += '_attempt%d' % job['attempt']
+        receiver, sender = multiprocessing.Pipe(duplex=False)
+        process = multiprocessing.Process(target=_run_case_process, args=(case, sender))
+        process.start()
+        sender.close()
+        result = None
+        while result is None:
+            if receiver.poll(self.heartbeatInterval):
+                try:
+                    result = receiver.recv()
+                except EOFError:
+                    result = failed_result(case, 'case process died')
+                break
+            try:
+                os.utime(running_path, None)
+            except FileNotFoundError:
+                print('WARNING: worker ' + self.workerId + ' lost the lease of job ' + job['id'] + ', stop it')
+                _kill_case_process(process)
+                receiver.close()
+                return None
+        receiver.close()
+        process.join()
+        result['jobId'] = job['id']
+        result['worker'] = self.workerId
+        result['queueAttempt'] = job['attempt']
+        if not _publish_once(self.queue.doneDir + '/' + job['id'] + '.json', result):
+            print('WARNING: job ' + job['id'] + ' was finished by another worker, result dropped')
+        try:
+            os.remove(running_path)
+        except FileNotFoundError:
+            pass
+        self.jobCount += 1
+        return result
+
+    def run(self, max_jobs=None):
+        idleSince = time.time()
+        while max_jobs is None or self.jobCount < max_jobs:
+            if os.path.isfile(self.queue.queueDir + '/stop'):
+                break
+            claimed = self.claim()
+            if claimed is None:
+                if self.idleTimeout is not None and time.time() - idleSince > self.idleTimeout:
+                    break
+                time.sleep(self.queue.pollInterval)
+                continue
+            self.run_job(*claimed)
+            idleSince = time.time()
+        print('worker ' + self.workerId + ': stop after ' + str(self.jobCount) + ' job(s)')
+
+
+def main(args):
+    if len(args) < 2 or args[0] not in ['worker', 'status']:
+        print('usage: python -m cfd.WorkQueue worker <queue dir> [max jobs] | status <queue dir>')
+        return 1
+    if args[0] == 'status':
+        status = WorkQueue(args[1]).get_status()
+        print('pending: ' + str(status['pending']) + ', running: ' + str(status['running'])
+              + ', done: ' + str(status['done']))
+        print('busy workers: ' + ', '.join(status['workers']))
+        return 0
+    worker = QueueWorker(args[1])
+    worker.run(max_jobs=int(args[2]) if len(args) > 2 else None)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv[1:]))
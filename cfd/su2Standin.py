@@ -0,0 +1,263 @@
+__author__ = "Juri Bieler"
+__version__ = "0.0.1"
+__status__ = "Development"
+
+# ==============================================================================
+# description     :stand-in for SU2_CFD, reads the same config and writes the
+#                  same history, restart and forces breakdown files with made
+#                  up but converging coefficients, in seconds instead of hours
+# date            :2018-08-14
+# notes           :usage: python su2Standin.py cfdRun.cfg
+#                  runs under mpiexec as well, only rank 0 writes files
+#                  SU2_STANDIN_DELAY: seconds per iteration (default 0)
+#                  stops on RESIDUAL_REDUCTION/RESIDUAL_MINVAL like SU2 does
+#                  SU2_STANDIN_FAIL: 'diverge' lets the coefficients blow up
+#                  with MATH_PROBLEM= DISCRETE_ADJOINT it acts as SU2_CFD_AD,
+#                  the surface sensitivities are made up such that the
+#                  objective behaves like a constant times the airfoil area
+#                  weighted with 1 + x / xmax (xmax of the marker points),
+#                  written like SU2 6.x: a density per unit length along the
+#                  normal pointing into the airfoil
+# python_version  :3.6
+# ==============================================================================
+
+import os
+import sys
+import math
+import time
+
+
+HISTORY_FIELDS = ['Iteration', 'CL', 'CD', 'CSF', 'CMx', 'CMy', 'CMz', 'CFx', 'CFy', 'CFz', 'CL/CD', 'AOA',
+                  'Res_Flow[0]', 'Res_Flow[1]', 'Res_Flow[2]', 'Res_Flow[3]', 'Res_Flow[4]',
+                  'Linear_Solver_Iterations', 'Time(min)']
+
+
+def read_config(cfg_file):
+    config = dict()
+    f = open(cfg_file, 'r')
+    for line in f:
+        line = line.strip()
+        if len(line) == 0 or line[0] == '%' or '=' not in line:
+            continue
+        key, _, value = line.partition('=')
+        key = key.strip().upper()
+        if key not in config:
+            config[key] = value.strip()
+    f.close()
+    return config
+
+
+def get_rank():
+    for name in ['OMPI_COMM_WORLD_RANK', 'PMI_RANK', 'PMIX_RANK', 'MPI_LOCALRANKID']:
+        if name in os.environ:
+            return int(os.environ[name])
+    return 0
+
+
+def read_point_count(mesh_file):
+    f = open(mesh_file, 'r')
+    for line in f:
+        if line.startswith('NPOIN'):
+            f.close()
+            return int(line.split('=')[1].split()[0])
+    f.close()
+    return 0
+
+
+def read_marker_points(mesh_file, marker='airfoil'):
+    # coordinates of the mesh points and the edges of one marker
+    points = []
+    edges = []
+    f = open(mesh_file, 'r')
+    lines = iter(f)
+    for line in lines:
+        if line.startswith('NPOIN'):
+            count = int(line.split('=')[1].split()[0])
+            for i in range(0, count):
+                values = next(lines).split()
+                points.append((float(values[0]), float(values[1])))
+        elif line.startswith('MARKER_TAG') and line.split('=')[1].strip() == marker:
+            count = int(next(lines).split('=')[1])
+            for i in range(0, count):
+                values = next(lines).split()
+                edges.append((int(values[1]), int(values[2])))
+    f.close()
+    return points, edges
+
+
+# d(coefficient)/d(area) of the made up sensitivities, per OBJECTIVE_FUNCTION
+ADJOINT_AREA_FACTORS = {'DRAG': 0.02, 'LIFT': -0.5, 'MOMENT_Z': 0.1}
+
+
+def write_surface_adjoint(file_name, points, edges, factor):
+    # moving the surface outward by dn at x adds dn * (1 + x / xmax) weighted area per unit length,
+    # SU2 6.x counts the normal into the airfoil, hence the minus
+    ids = sorted(set(i for edge in edges for i in edge))
+    xMax = max(points[i][0] for i in ids)
+    ouputF = open(file_name, 'w')
+    ouputF.write('"Point","Sensitivity","PsiRho","Phi_x","Phi_y","PsiE","x_coord","y_coord"\n')
+    for i in ids:
+        sens = -factor * (1. + points[i][0] / xMax)
+        ouputF.write('%d, %.12e, %.12e, %.12e, %.12e, %.12e, %.12e, %.12e\n'
+                     % (i, sens, 0.1 * sens, 0., 0., 0.5 * sens, points[i][0], points[i][1]))
+    ouputF.close()
+
+
+def run_adjoint(config, mesh_file, iterations):
+    solutionFile = config.get('SOLUTION_FLOW_FILENAME', 'solution_flow.dat')
+    if not os.path.isfile(solutionFile):
+        print('Error: direct solution ' + solutionFile + ' not found')
+        return 1
+    objective = config.get('OBJECTIVE_FUNCTION', 'DRAG')
+    if objective not in ADJOINT_AREA_FACTORS:
+        print('Error: objective ' + objective + ' not supported by the stand-in')
+        return 1
+    points, edges = read_marker_points(mesh_file)
+    print('SU2_CFD_AD stand-in: ' + objective + ', ' + str(len(edges)) + ' surface edges')
+    delay = float(os.environ.get('SU2_STANDIN_DELAY', '0'))
+    historyFile = config.get('CONV_FILENAME', 'history')
+    historyFile += '.vtk' if config.get('OUTPUT_FORMAT', 'PARAVIEW') == 'PARAVIEW' else '.csv'
+    historyF = open(historyFile, 'w')
+    historyF.write('"Iteration","Res_AdjFlow[0]","Res_AdjFlow[1]","Res_AdjFlow[2]","Res_AdjFlow[3]","Sens_Geo"\n')
+    for i in range(0, iterations):
+        residual = -1. - 8. * i / max(iterations - 1, 1)
+        historyF.write('%8d, %14.8e, %14.8e, %14.8e, %14.8e, %14.8e\n'
+                       % (i, residual, residual - 0.2, residual - 0.3, residual - 0.1, 1. - math.exp(-i / 20.)))
+        if delay > 0:
+            time.sleep(delay)
+    historyF.close()
+    write_restart(config.get('RESTART_ADJ_FILENAME', 'restart_adj.dat'), len(points), iterations - 1)
+    write_surface_adjoint(config.get('SURFACE_ADJ_FILENAME', 'surface_adjoint') + '.csv', points, edges,
+                          ADJOINT_AREA_FACTORS[objective])
+    print('Exit Success (SU2_CFD_AD)')
+    return 0
+
+
+def final_coefficients(aoa, mach):
+    # thin airfoil lift with prandtl-glauert correction and a parabolic drag polar
+    beta = math.sqrt(max(1. - mach ** 2, 0.05))
+    cl = 2. * math.pi * math.radians(aoa + 2.) / beta
+    cd = 0.008 + 0.012 * cl ** 2
+    cm = -0.05 - 0.01 * cl
+    return cl, cd, cm
+
+
+def write_restart(file_name, point_count, iteration):
+    ouputF = open(file_name, 'w')
+    ouputF.write('"PointID"\t"x"\t"y"\t"Conservative_1"\t"Conservative_2"\t"Conservative_3"\t"Conservative_4"\n')
+    for i in range(0, point_count):
+        ouputF.write('%d\t0.0\t0.0\t1.0\t0.1\t0.0\t2.5\n' % i)
+    ouputF.write('EXT_ITER= ' + str(iteration + 1) + '\n')
+    ouputF.close()
+
+
+def write_forces_breakdown(file_name, cl, cd, cm):
+    ouputF = open(file_name, 'w')
+    ouputF.write('Surface forces breakdown (SU2_CFD stand-in):\n\n')
+    ouputF.write('Total CL:    %10.6f | Pressure (%6.2f%%): %10.6f | Friction (%6.2f%%): %10.6f\n'
+                 % (cl, 100., cl, 0., 0.))
+    ouputF.write('Total CD:    %10.6f | Pressure (%6.2f%%): %10.6f | Friction (%6.2f%%): %10.6f\n'
+                 % (cd, 60., 0.6 * cd, 40., 0.4 * cd))
+    ouputF.write('Total CMz:   %10.6f | Pressure (%6.2f%%): %10.6f | Friction (%6.2f%%): %10.6f\n'
+                 % (cm, 100., cm, 0., 0.))
+    ouputF.write('Total CL/CD: %10.6f | Pressure (%6.2f%%): %10.6f | Friction (%6.2f%%): %10.6f\n'
+                 % (cl / cd, 100., cl / cd, 0., 0.))
+    ouputF.close()
+
+
+def write_surface_csv(file_name, cl, point_count=200):
+    # pressure and friction along an ellipse shaped surface, in the column layout of SU2 surface csv files
+    ouputF = open(file_name, 'w')
+    ouputF.write('"PointID","x","y","Pressure","Pressure_Coefficient","Skin_Friction_Coefficient_X",'
+                 '"Skin_Friction_Coefficient_Y","Heat_Flux","Y_Plus"\n')
+    for i in range(0, point_count):
+        phi = 2. * math.pi * i / point_count
+        x = 0.5 + 0.5 * math.cos(phi)
+        y = 0.06 * math.sin(phi)
+        cp = 1. - 4. * math.sin(phi) ** 2 - cl * math.sin(phi)
+        ouputF.write('%d, %.8e, %.8e, %.8e, %.8e, %.8e, %.8e, %.8e, %.8e\n'
+                     % (i, x, y, 25000. * (1. + 0.3 * cp), cp, 0.003 * math.sin(phi) ** 2, 0., 0., 0.8))
+    ouputF.close()
+
+
+def main(cfg_file):
+    config = read_config(cfg_file)
+    if get_rank() != 0:
+        return 0
+    meshFile = config.get('MESH_FILENAME', '')
+    if not os.path.isfile(meshFile):
+        print('Error: mesh file ' + meshFile + ' not found')
+        return 1
+    pointCount = read_point_count(meshFile)
+    aoa = float(config.get('AOA', '0.'))
+    mach = float(config.get('MACH_NUMBER', '0.3'))
+    iterations = int(config.get('EXT_ITER', '1000'))
+    writeFreq = int(config.get('WRT_SOL_FREQ', str(iterations)))
+    restart = config.get('RESTART_SOL', 'NO') == 'YES'
+    solutionFile = config.get('SOLUTION_FLOW_FILENAME', 'solution_flow.dat')
+    restartFile = config.get('RESTART_FLOW_FILENAME', 'restart_flow.dat')
+    historyFile = config.get('CONV_FILENAME', 'history')
+    historyFile += '.vtk' if config.get('OUTPUT_FORMAT', 'PARAVIEW') == 'PARAVIEW' else '.csv'
+    delay = float(os.environ.get('SU2_STANDIN_DELAY', '0'))
+    diverge = os.environ.get('SU2_STANDIN_FAIL', '') == 'diverge'
+
+    if config.get('MATH_PROBLEM', 'DIRECT') == 'DISCRETE_ADJOINT':
+        # the adjoint converges faster than the flow in real life as well
+        return run_adjoint(config, meshFile, min(iterations, 200))
+
+    if restart and not os.path.isfile(solutionFile):
+        print('Error: restart solution ' + solutionFile + ' not found')
+        return 1
+    # a restart starts closer to the converged state
+    tau = 50. if restart else 300.
+    amplitude = 0.05 if restart else 1.
+
+    # like SU2 the run ends early once the density residual met the residual criterion
+    residualCriterion = config.get('CONV_CRITERIA', 'RESIDUAL') == 'RESIDUAL'
+    residualReduction = float(config.get('RESIDUAL_REDUCTION', '9'))
+    residualMinval = float(config.get('RESIDUAL_MINVAL', '-12'))
+
+    cl, cd, cm = final_coefficients(aoa, mach)
+    print('SU2_CFD stand-in: ' + str(pointCount) + ' points, AOA ' + str(aoa) + ', mach ' + str(mach))
+    startTime = time.time()
+    historyF = open(historyFile, 'w')
+    historyF.write(','.join('"' + f + '"' for f in HISTORY_FIELDS) + '\n')
+    for i in range(0, iterations):
+        decay = amplitude * math.exp(-i / tau) * math.cos(i / 7.)
+        if diverge and i > 50:
+            decay = math.exp(min((i - 50) / 10., 300.))
+        iCl = cl * (1. + decay)
+        iCd = cd * (1. + 0.5 * decay)
+        iCm = cm * (1. + decay)
+        envelope = abs(decay) if diverge and i > 50 else amplitude * math.exp(-i / tau) * (1. + 0.5 * abs(math.cos(i / 7.)))
+        residual = math.log10(envelope + 1e-14)
+        if i == 0:
+            startResidual = residual
+        values = [i, iCl, iCd, 0., 0., 0., iCm, iCd, iCl, 0., iCl / iCd, aoa,
+                  residual, residual - 0.3, residual - 0.5, residual - 0.2, residual - 1.,
+                  5, (time.time() - startTime) / 60.]
+        historyF.write('%8d, ' % i + ', '.join('%14.8e' % v for v in values[1:]) + '\n')
+        historyF.flush()
+        if (i + 1) % writeFreq == 0:
+            write_restart(restartFile, pointCount, i)
+        if residualCriterion and (startResidual - residual >= residualReduction or residual <= residualMinval):
+            print('Residual criterion reached after ' + str(i + 1) + ' iterations')
+            break
+        if delay > 0:
+            time.sleep(delay)
+    historyF.close()
+    write_restart(restartFile, pointCount, i)
+    write_forces_breakdown('forces_breakdown.dat', iCl, iCd, iCm)
+    if config.get('WRT_CSV_SOL', 'YES') == 'YES':
+        write_surface_csv(config.get('SURFACE_FLOW_FILENAME', 'surface_flow') + '.csv', iCl)
+    if config.get('WRT_VOL_SOL', 'YES') == 'YES':
+        open(config.get('VOLUME_FLOW_FILENAME', 'flow') + '.vtk', 'w').close()
+    print('Exit Success (SU2_CFD)')
+    return 0
+
+
+if __name__ == '__main__':
+    if len(sys.argv) < 2:
+        print('usage: python su2Standin.py <config file>')
+        sys.exit(1)
+    sys.exit(main(sys.argv[1]))
@@ -5,6 +5,9 @@ __status__ = "Development"
 import numpy as np
 
 from cfd.CFDrun import CFDrun
+from cfd.BatchEvaluation import evaluate_batch
+from cfd.CFDPipeline import CFDPipeline
+from cfd.RunLedger import RunLedger
 from constants import *
 
 import matplotlib.pyplot as plt
@@ -43,49 +46,61 @@ def run_convergence_analysis_gmsh():
     cmList = np.zeros((len(innerMeshSize),len(outerMeshSize)))
     eList = np.zeros((len(innerMeshSize),len(outerMeshSize)))
 
-    ouputF = open(WORKING_DIR + '/' + 'convergenceResult.txt', 'w')
-    ouputF.write('innerMeshSize,outerMeshSize,CL,CD,CM,E,Iterations,Time(min)\n')
+    # finished cases survive a crash in the ledger, a restart only runs the missing and failed ones
+    ledger = RunLedger(WORKING_DIR + '/' + 'nacaMesh_ledger.jsonl')
 
+    # every mesh variant is an independent case, they run side by side under the core budget
+    designs = []
+    cases = []
+    caseNames = []
     for iI in range(0, len(innerMeshSize)):
         for iO in range(0, len(outerMeshSize)):
-
-            projectName = 'nacaMesh_i%06d_o%06d' % (int(innerMeshSize[iI]*1000), int(outerMeshSize[iO]*1000))
-            projectDir = WORKING_DIR + '/' + projectName
-            #create project dir if necessary
-            if not os.path.isdir(projectDir):
-                os.mkdir(projectDir)
-
-            cfd = CFDrun(projectName, used_cores=SU2_USED_CORES)
-            cfd.load_airfoil_from_file(INPUT_DIR + '/naca641-212.csv')
-            cfd.gmsh.innerMeshSize = innerMeshSize[iI]
-            cfd.gmsh.outerMeshSize = outerMeshSize[iO]
-            #cfd.gmsh_generate_mesh()
-            cfd.gmsh_generate_mesh()
-            cfd.su2_fix_mesh()
-            cfd.su2_solve(config)
-            results = cfd.su2_parse_iteration_result()
+            projectName = 'i%06d_o%06d' % (int(innerMeshSize[iI]*1000), int(outerMeshSize[iO]*1000))
+            caseNames.append(projectName)
+            design = {'file': INPUT_DIR + '/naca641-212.csv',
+                      'name': projectName,
+                      'gmsh': {'innerMeshSize': innerMeshSize[iI],
+                               'outerMeshSize': outerMeshSize[iO]}}
+            caseHash = RunLedger.inputs_hash({'design': design, 'config': config})
+            if ledger.is_done(projectName, caseHash):
+                continue
+            design['hash'] = caseHash
+            designs.append(design)
+            cases.append((iI, iO))
+    print(str(len(caseNames) - len(designs)) + ' of ' + str(len(caseNames)) + ' cases finished before')
+
+    for result in evaluate_batch(designs, [config], batch_name='nacaMesh', mesher='gmsh', outputProfile='full',
+                                 earlyTermination=False):
+        iI, iO = cases[result['design']]
+        design = designs[result['design']]
+        if result['error'] != '':
+            print('ERROR: iI: ' + str(iI) + ' iO: ' + str(iO) + ' failed: ' + result['error'])
+            ledger.record(design['name'], design['hash'], {'error': result['error']}, status='failed')
+            continue
+        results = result['results']
+        results['innerMeshSize'] = innerMeshSize[iI]
+        results['outerMeshSize'] = outerMeshSize[iO]
+        ledger.record(design['name'], design['hash'], results)
+        print('totalCL: ' + str(results['CL']))
+        print('totalCD: ' + str(results['CD']))
+        print('iI: ' + str(iI) + ' iO: ' + str(iO))
+
+    # the result file is rebuilt from the ledger, so it holds the cases of all earlier attempts as well
+    ledger.write_csv(WORKING_DIR + '/' + 'convergenceResult.txt',
+                     'innerMeshSize,outerMeshSize,CL,CD,CM,E,Iterations,Time(min)',
+                     lambda case, r: [r['innerMeshSize'], r['outerMeshSize'], r['CL'], r['CD'], r['CMz'],
+                                      r['CL/CD'], r['Iteration'], r['Time(min)']],
+                     cases=caseNames)
+    for iI in range(0, len(innerMeshSize)):
+        for iO in range(0, len(outerMeshSize)):
+            results = ledger.get_results(caseNames[iI * len(outerMeshSize) + iO])
+            if results is None or 'CL' not in results:
+                continue
             #totalCL, totalCD, totalCM, totalE = cfd.su2_parse_results()
-            totalCL = results['CL']
-            totalCD = results['CD']
-            totalCM = results['CMz']
-            totalE = results['CL/CD']
-            clList[iI][iO] = totalCL
-            cdList[iI][iO] = totalCD
-            cmList[iI][iO] = totalCM
-            eList[iI][iO] = totalE
-            ouputF.write(str(innerMeshSize[iI])+','
-                         +str(outerMeshSize[iO])+','
-                         +str(totalCL)+','
-                         +str(totalCD)+','
-                         +str(totalCM)+','
-                         +str(totalE)+','
-                         +str(results['Iteration'])+','
-                         +str(results['Time(min)'])+'\n')
-            ouputF.flush()
-
-            print('totalCL: ' + str(totalCL))
-            print('totalCD: ' + str(totalCD))
-            print('iI: ' + str(iI) + ' iO: ' + str(iO))
+            clList[iI][iO] = results['CL']
+            cdList[iI][iO] = results['CD']
+            cmList[iI][iO] = results['CMz']
+            eList[iI][iO] = results['CL/CD']
 
 
     plt.pcolor(innerMeshSize, outerMeshSize, clList)
@@ -124,46 +139,48 @@ def run_convergence_analysis_construct2d():
     ouputF = open(WORKING_DIR + '/' + 'convergenceResult.txt', 'w')
     ouputF.write('innerMeshSize,outerMeshSize,CL,CD,CM,E,Iterations,Time(min)\n')
 
+    # mesh the next variant while the current one is solved
+    pipeline = CFDPipeline(mesh_workers=2, solve_workers=1)
+    cases = []
     for iI in range(0, len(normalMeshDivider)):
         for iO in range(0, len(secondParam)):
 
             projectName = 'nacaMesh_i%06d_o%06d' % (int(normalMeshDivider[iI]), int(secondParam[iO]))
-            projectDir = WORKING_DIR + '/' + projectName
-            #create project dir if necessary
-            if not os.path.isdir(projectDir):
-                os.mkdir(projectDir)
-
             cfd = CFDrun(projectName, used_cores=SU2_USED_CORES)
             cfd.load_airfoil_from_file(INPUT_DIR + '/naca641-212.csv')
             cfd.c2d.pointsInNormalDir = normalMeshDivider[iI]
             #cfd.gmsh.outerMeshSize = outerMeshSize[iO]
-            #cfd.gmsh_generate_mesh()
-            cfd.construct2d_generate_mesh()
-            cfd.su2_fix_mesh()
-            cfd.su2_solve(config)
-            results = cfd.su2_parse_iteration_result()
-            #totalCL, totalCD, totalCM, totalE = cfd.su2_parse_results()
-            totalCL = results['CL']
-            totalCD = results['CD']
-            totalCM = results['CMz']
-            totalE = results['CL/CD']
-            clList[iI][iO] = totalCL
-            cdList[iI][iO] = totalCD
-            cmList[iI][iO] = totalCM
-            eList[iI][iO] = totalE
-            ouputF.write(str(normalMeshDivider[iI])+','
-                         +str(secondParam[iO])+','
-                         +str(totalCL)+','
-                         +str(totalCD)+','
-                         +str(totalCM)+','
-                         +str(totalE)+','
-                         +str(results['Iteration'])+','
-                         +str(results['Time(min)'])+'\n')
-            ouputF.flush()
-
-            print('totalCL: ' + str(totalCL))
-            print('totalCD: ' + str(totalCD))
-            print('iI: ' + str(iI) + ' iO: ' + str(iO))
+            #pipeline.add_job(cfd, config, mesh_func=lambda c: c.gmsh_generate_mesh())
+            pipeline.add_job(cfd, config)
+            cases.append((iI, iO))
+
+    for (iI, iO), job in zip(cases, pipeline.run()):
+        if job['error'] != '':
+            print('ERROR: iI: ' + str(iI) + ' iO: ' + str(iO) + ' failed: ' + job['error'])
+            continue
+        results = job['results']
+        #totalCL, totalCD, totalCM, totalE = cfd.su2_parse_results()
+        totalCL = results['CL']
+        totalCD = results['CD']
+        totalCM = results['CMz']
+        totalE = results['CL/CD']
+        clList[iI][iO] = totalCL
+        cdList[iI][iO] = totalCD
+        cmList[iI][iO] = totalCM
+        eList[iI][iO] = totalE
+        ouputF.write(str(normalMeshDivider[iI])+','
+                     +str(secondParam[iO])+','
+                     +str(totalCL)+','
+                     +str(totalCD)+','
+                     +str(totalCM)+','
+                     +str(totalE)+','
+                     +str(results['Iteration'])+','
+                     +str(results['Time(min)'])+'\n')
+        ouputF.flush()
+
+        print('totalCL: ' + str(totalCL))
+        print('totalCD: ' + str(totalCD))
+        print('iI: ' + str(iI) + ' iO: ' + str(iO))
 
 
     ouputF.close()
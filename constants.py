@@ -6,9 +6,17 @@ GMSH_EXE_PATH = 'bin/gmsh/gmsh.exe'
 #SU2_BIN_PATH = 'D:/prog/portable/Luftfahrt/su2-windows-latest/ExecParallel/bin/'
 SU2_BIN_PATH = 'bin/su2-windows-latest/ExecParallel/bin/'
 OS_MPI_COMMAND = 'mpiexec'
+# core pinning of the MPI ranks ('core', 'socket' or None) and host list (None runs on the local node)
+MPI_BIND_TO = None
+MPI_HOSTS = None
 CONSTRUCT2D_EXE_PATH = 'bin/construct2d/construct2d.exe'
 SU2_USED_CORES = 6
+# below this many mesh points per core a wider MPI job does not run faster
+SU2_MIN_POINTS_PER_CORE = 10000
 WORKING_DIR = 'dataOut/'
+# RAM backed dir for the cfd runs, e.g. '/dev/shm', only whitelisted results are copied to WORKING_DIR,
+# None runs directly in WORKING_DIR
+SCRATCH_DIR = None
 INPUT_DIR = 'dataIn/'
 
 
@@ -11,7 +11,7 @@ try:
     opti.cabinLength = 0.55
     opti.cabinHeigth = 0.14
     opti.PROJECT_NAME_PREFIX = 'bwbCenter_'
-    opti.config['AOA'] = str(0.0)
+    opti.config['AOA'] = 0.0
     #opti.config['UPDATE_ALPHA'] = str(10)
     #opti.config['FIXED_CL_MODE'] = 'NO'
     #opti.config['TARGET_CL'] = str(0.25)
@@ -28,7 +28,7 @@ try:
     opti.cabinLength = 0.55
     opti.cabinHeigth = 0.14
     opti.PROJECT_NAME_PREFIX = 'test02'
-    opti.config['AOA'] = str(0.0)
+    opti.config['AOA'] = 0.0
     opti.runOpenMdao()
 except:
     print('#################################################################')
@@ -41,7 +41,7 @@ try:
     opti.cabinLength = 0.6
     opti.cabinHeigth = 0.13
     opti.PROJECT_NAME_PREFIX = 'test03'
-    opti.config['AOA'] = str(0.0)
+    opti.config['AOA'] = 0.0
     opti.runOpenMdao()
 except:
     print('#################################################################')
@@ -6,23 +6,14 @@ __status__ = "Development"
 # description     :offers API to gmsh, which is used to generate a mesh from a cad geometry
 # date            :2018-01-11
 # notes           :
-# python_version  :3.6
+# python_version  :3.8
 # ==============================================================================
 
+import asyncio
 import subprocess
 import os
-#import fcntl
-import numpy as np
-import time
-import threading
-import select
 import sys
-from threading  import Thread
 
-try:
-    from Queue import Queue, Empty
-except ImportError:
-    from queue import Queue, Empty  # python 3.x
 
 class Construct2d:
 
@@ -36,109 +27,155 @@ class Construct2d:
         self.pointsInNormalDir = 100
         self.reynoldsNum = 1e6
 
-    def wait_for_keyword(self, que, word):
-        while (True):
-            try:
-                line = que.get_nowait()  # or q.get(timeout=.1)
-                if sys.version_info[0] >= 3:
-                    line = line.decode('UTF-8')
-            except Empty:
-                #print('no output yet')
-                time.sleep(0.01)
-            else:  # got line
-                print(line)
-                if word in line:
-                    return True
-
-    def enqueue_output(self, out, queue):
-        for line in iter(out.readline, b''):
-            queue.put(line)
-        print('closing')
-        out.close()
-
-    def write_to_console_and_enter(self, p, str):
-        outStr = str + '\n'
-        if sys.version_info[0] >= 3:
-            outStr = outStr.encode('UTF-8')
-        p.stdin.write(outStr)
-        p.stdin.flush()
-
-    def run_mesh_generatoin(self, input_dat_file_name, working_dir='dataOut/'):
-        self.errorFlag = False
-
-        ON_POSIX = 'posix' in sys.builtin_module_names
-
-        p = subprocess.Popen([self.construct2dPath], cwd=working_dir, stdin=subprocess.PIPE, stdout=subprocess.PIPE, bufsize=1, close_fds=ON_POSIX)
-        q = Queue()
-        t = Thread(target=self.enqueue_output, args=(p.stdout, q))
-        #t.daemon = True  # thread dies with the program
-        t.start()
-
-        self.wait_for_keyword(q, 'QUIT')
-        self.write_to_console_and_enter(p, input_dat_file_name)
-        self.wait_for_keyword(q, 'QUIT')
-
+        # seconds to wait for one menu step and for the whole mesh generation
+        self.stepTimeout = 60.
+        self.totalTimeout = 600.
+        # write all menu answers up front instead of waiting for every prompt
+        self.batchMode = False
+
+    def _menu_steps(self, input_dat_file_name):
+        # list of (answer to send, keyword to wait for before the next answer)
+        steps = []
+        steps.append((None, 'QUIT'))
+        steps.append((input_dat_file_name, 'QUIT'))
         #enter airfoil surface options
-        self.write_to_console_and_enter(p, 'SOPT')
-        self.wait_for_keyword(q, 'QUIT')
+        steps.append(('SOPT', 'QUIT'))
         #points on surface
-        self.write_to_console_and_enter(p, 'NSRF')
-        self.wait_for_keyword(q, 'Current')
-        self.write_to_console_and_enter(p, str(self.pointNrAirfoilSurface))
-        self.wait_for_keyword(q, 'QUIT')
+        steps.append(('NSRF', 'Current'))
+        steps.append((str(self.pointNrAirfoilSurface), 'QUIT'))
         #farfield radius
-        self.write_to_console_and_enter(p, 'RADI')
-        self.wait_for_keyword(q, 'Current')
-        self.write_to_console_and_enter(p, str(self.farfieldRadius))
-        self.wait_for_keyword(q, 'QUIT')
+        steps.append(('RADI', 'Current'))
+        steps.append((str(self.farfieldRadius), 'QUIT'))
         #go back
-        self.write_to_console_and_enter(p, 'QUIT')
-        self.wait_for_keyword(q, 'QUIT')
-
+        steps.append(('QUIT', 'QUIT'))
         #enter volume grid options
-        self.write_to_console_and_enter(p, 'VOPT')
-        self.wait_for_keyword(q, 'QUIT')
+        steps.append(('VOPT', 'QUIT'))
         #select mesh type
-        self.write_to_console_and_enter(p, 'TOPO')
-        self.wait_for_keyword(q, 'Sharp')
+        steps.append(('TOPO', 'Sharp'))
         if self.useCGrid:
-            self.write_to_console_and_enter(p, 'CGRD')
+            steps.append(('CGRD', 'QUIT'))
         else:
-            self.write_to_console_and_enter(p, 'OGRD')
-        self.wait_for_keyword(q, 'QUIT')
+            steps.append(('OGRD', 'QUIT'))
         #set num of points in normal direction
-        self.write_to_console_and_enter(p, 'JMAX')
-        self.wait_for_keyword(q, 'Current')
-        self.write_to_console_and_enter(p, str(self.pointsInNormalDir))
-        self.wait_for_keyword(q, 'QUIT')
+        steps.append(('JMAX', 'Current'))
+        steps.append((str(self.pointsInNormalDir), 'QUIT'))
         #enter reynolds number
-        self.write_to_console_and_enter(p, 'RECD')
-        self.wait_for_keyword(q, 'Current')
-        self.write_to_console_and_enter(p, str(self.reynoldsNum))
-        self.wait_for_keyword(q, 'QUIT')
-
-
-
-
+        steps.append(('RECD', 'Current'))
+        steps.append((str(self.reynoldsNum), 'QUIT'))
         # go back
-        self.write_to_console_and_enter(p, 'QUIT')
-        self.wait_for_keyword(q, 'QUIT')
-
-
+        steps.append(('QUIT', 'QUIT'))
         #start meshing
-        self.write_to_console_and_enter(p, 'GRID')
-        self.wait_for_keyword(q, 'QUIT')
-        self.write_to_console_and_enter(p, 'SMTH')
-        self.wait_for_keyword(q, 'QUIT')
+        steps.append(('GRID', 'QUIT'))
+        steps.append(('SMTH', 'QUIT'))
         #quit
-        self.write_to_console_and_enter(p, 'QUIT')
-
-        if os.path.isfile(working_dir + '/' + input_dat_file_name.replace('.dat', '.p3d')):
+        steps.append(('QUIT', None))
+        return steps
+
+    async def _wait_for_keyword(self, p, word, text, deadline):
+        # wakes up as soon as output arrives, returns the output following the keyword
+        loop = asyncio.get_event_loop()
+        while word not in text:
+            timeout = min(self.stepTimeout, deadline - loop.time())
+            if timeout <= 0.:
+                raise asyncio.TimeoutError()
+            chunk = await asyncio.wait_for(p.stdout.read(4096), timeout)
+            if len(chunk) == 0:
+                raise EOFError('construct2d closed its output while waiting for: ' + word)
+            chunk = chunk.decode('UTF-8', errors='replace')
+            print(chunk, end='')
+            text += chunk
+        return text[text.index(word) + len(word):]
+
+    async def run_mesh_generation_async(self, input_dat_file_name, working_dir='dataOut/'):
+        errorFlag = False
+        loop = asyncio.get_event_loop()
+        deadline = loop.time() + self.totalTimeout
+        p = await asyncio.create_subprocess_exec(self.construct2dPath,
+                                                 cwd=working_dir,
+                                                 stdin=subprocess.PIPE,
+                                                 stdout=subprocess.PIPE,
+                                                 stderr=subprocess.STDOUT)
+        text = ''
+        try:
+            for answer, keyword in self._menu_steps(input_dat_file_name):
+                if answer is not None:
+                    p.stdin.write((answer + '\n').encode('UTF-8'))
+                    await p.stdin.drain()
+                if keyword is not None:
+                    text = await self._wait_for_keyword(p, keyword, text, deadline)
+            # drain the remaining output so the process can exit
+            while True:
+                timeout = deadline - loop.time()
+                if timeout <= 0.:
+                    raise asyncio.TimeoutError()
+                chunk = await asyncio.wait_for(p.stdout.read(4096), timeout)
+                if len(chunk) == 0:
+                    break
+            await asyncio.wait_for(p.wait(), max(deadline - loop.time(), 0.1))
+        except (asyncio.TimeoutError, EOFError, ConnectionError) as e:
+            print('ERROR: construct2d stalled or stopped unexpectedly, killing it (' + str(e) + ')')
+            if p.returncode is None:
+                p.kill()
+                await p.wait()
+            errorFlag = True
+
+        if os.path.isfile(working_dir + '/' + input_dat_file_name.replace('.dat', '.p3d')) and not errorFlag:
             print('p3d file created successfully')
         else:
             print('ERROR: the p3d file could not be created as expected')
+            errorFlag = True
+        return errorFlag
+
+    def _new_event_loop(self):
+        # asyncio subprocesses can only be started from worker threads since 3.8
+        if sys.version_info < (3, 8):
+            raise RuntimeError('Construct2d needs python >= 3.8, running %d.%d' % tuple(sys.version_info[:2]))
+        # subprocesses need the proactor loop on windows
+        if sys.platform == 'win32':
+            return asyncio.ProactorEventLoop()
+        return asyncio.new_event_loop()
+
+    def run_mesh_generation_batch(self, input_dat_file_name, working_dir='dataOut/', log_file_name='construct2d.log'):
+        # fire and wait: all answers are written to an input file that is piped into construct2d,
+        # the output goes to a log and success is judged by the produced p3d file
+        self.errorFlag = False
+        p3dPath = working_dir + '/' + input_dat_file_name.replace('.dat', '.p3d')
+        if os.path.isfile(p3dPath):
+            os.remove(p3dPath)
+        answers = [answer for answer, keyword in self._menu_steps(input_dat_file_name) if answer is not None]
+        inputF = open(working_dir + '/' + 'construct2d.in', 'w')
+        inputF.write('\n'.join(answers) + '\n')
+        inputF.close()
+
+        inputF = open(working_dir + '/' + 'construct2d.in', 'r')
+        logF = open(working_dir + '/' + log_file_name, 'w')
+        p = subprocess.Popen([self.construct2dPath], cwd=working_dir, stdin=inputF, stdout=logF, stderr=subprocess.STDOUT)
+        try:
+            p.wait(timeout=self.totalTimeout)
+        except subprocess.TimeoutExpired:
+            print('ERROR: construct2d did not finish within ' + str(self.totalTimeout) + ' s, killing it')
+            p.kill()
+            p.wait()
             self.errorFlag = True
+        inputF.close()
+        logF.close()
 
+        if os.path.isfile(p3dPath) and os.path.getsize(p3dPath) > 0 and not self.errorFlag:
+            print('p3d file created successfully')
+        else:
+            print('ERROR: the p3d file could not be created as expected, see ' + log_file_name)
+            self.errorFlag = True
+        return self.errorFlag
+
+    def run_mesh_generatoin(self, input_dat_file_name, working_dir='dataOut/'):
+        if self.batchMode:
+            return self.run_mesh_generation_batch(input_dat_file_name, working_dir=working_dir)
+        self.errorFlag = False
+        loop = self._new_event_loop()
+        try:
+            self.errorFlag = loop.run_until_complete(self.run_mesh_generation_async(input_dat_file_name, working_dir=working_dir))
+        finally:
+            loop.close()
         print('done')
         return self.errorFlag
 
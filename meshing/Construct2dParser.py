@@ -87,6 +87,40 @@ class Construct2dParser:
         return oldId
 
 
+    def _duplicate_map(self):
+        # maps every node of the first grid line onto the first node with identical coordinates,
+        # same result as check_for_duplicates but for all nodes at once
+        remap = np.arange(len(self.pointList), dtype=np.int64)
+        _, first, inverse = np.unique(self.pointList[:self.nNode, :2], axis=0, return_index=True, return_inverse=True)
+        remap[:self.nNode] = first[inverse.reshape(-1)]
+        return remap
+
+    def get_cgrid_arrays(self, scale=1.):
+        # builds the c-grid connectivity as arrays instead of writing it to a file
+        # returns points (nPoints, 2), quads (nElems, 4), markers [(tag, (nEdges, 2)), ...]
+        remap = self._duplicate_map()
+        nGrid, mGrid = np.meshgrid(np.arange(self.nNode - 1), np.arange(self.mNode - 1))
+        p1 = self.get_pointID(nGrid, mGrid)
+        quads = np.stack((p1, p1 + 1, p1 + self.nNode + 1, p1 + self.nNode), axis=-1).reshape(-1, 4)
+        quads = remap[quads]
+
+        # airfoil surface, first grid line without the wake
+        n = np.arange(self.nNode - 1)
+        p1 = self.get_pointID(n, 0)
+        onFoil = (self.pointList[p1, 0] <= 1.) & (self.pointList[p1 + 1, 0] <= 1.)
+        airfoilEdges = remap[np.stack((p1[onFoil], p1[onFoil] + 1), axis=-1)]
+
+        # farfield, outer c ring bottom to top, then the outlet from top to half and half to bottom
+        m = np.arange(self.mNode - 1)
+        outerRing = np.stack((self.get_pointID(n, self.mNode - 1), self.get_pointID(n + 1, self.mNode - 1)), axis=-1)
+        mRev = m[::-1]
+        outletTop = np.stack((self.get_pointID(self.nNode - 1, mRev), self.get_pointID(self.nNode - 1, mRev + 1)), axis=-1)
+        outletBottom = np.stack((self.get_pointID(0, m), self.get_pointID(0, m + 1)), axis=-1)
+        farfieldEdges = remap[np.vstack((outerRing, outletTop, outletBottom))]
+
+        points = self.pointList[:, :2] * scale
+        return points, quads, [('airfoil', airfoilEdges), ('farfield', farfieldEdges)]
+
     def p3d_to_su2_cgrid(self, output_file_name, scale=1.):
 
         #fig = plt.figure()
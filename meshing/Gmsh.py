@@ -11,6 +11,7 @@ __status__ = "Development"
 
 import subprocess
 import os
+import io
 import numpy as np
 
 class Gmsh:
@@ -32,14 +33,16 @@ class Gmsh:
         self.farfieldWakeLength = 4
 
     #runns gmsh.exe from command line with to create a mesh file
-    def run_2d_geo_file(self, input_file_name, output_file_name, working_dir='dataOut/', min_mesh_size=1e-10, max_mesh_size=1e22):
+    def run_2d_geo_file(self, input_file_name, output_file_name, working_dir='dataOut/', min_mesh_size=1e-10, max_mesh_size=1e22, timeout=None, log_file_name='gmsh.log'):
         # -2 : mesh 2D
         # -format str: select format here inp (abaqus mesh)
         # -o str: output file name
         # -order int: 1,...,5
         # -clmin float: min mesh size
         # -clmax float: max mesh size
+        self.errorFlag = False
         format = output_file_name.split('.')[-1]
+        logF = open(working_dir + '/' + log_file_name, 'w')
         p = subprocess.Popen([self.gmshPath,
                               input_file_name,
                               '-2',
@@ -47,16 +50,22 @@ class Gmsh:
                               '-clmin', str(min_mesh_size),
                               '-clmax', str(max_mesh_size),
                               '-o', output_file_name],
-                             cwd=working_dir, stdout=subprocess.PIPE)
-        out, err = p.communicate()
-        print(out.decode('UTF-8'))
-        if err is not None:
-            print('gmsh process failed')
+                             cwd=working_dir, stdout=logF, stderr=subprocess.STDOUT)
+        try:
+            p.wait(timeout=timeout)
+        except subprocess.TimeoutExpired:
+            print('gmsh process timed out after ' + str(timeout) + ' s, killing it')
+            p.kill()
+            p.wait()
+            self.errorFlag = True
+        logF.close()
+        if p.returncode != 0:
+            print('gmsh process failed, see ' + working_dir + '/' + log_file_name)
             self.errorFlag = True
         if not os.path.isfile(working_dir + '/' + output_file_name):
             print('error gmash did not create the file as expected')
             self.errorFlag = True
-        return
+        return self.errorFlag
 
     def generate_geo_file(self, airfoil_points, output_file_name, startIndex, working_dir='dataOut/', scale=1.):
         ## Read in data using this bit
@@ -90,68 +99,70 @@ class Gmsh:
         y = airfoil_points[:,1] * scale
         z = np.zeros(n_lines)
 
-        fout = open(working_dir + '/' + output_file_name, 'w')
-
         # Format
         # Point(1) = {0, 0, 0, lc};
-        fout.write("airfoil_lc = %f;\n" % (self.innerMeshSize))
-        j = startIndex
-        for i in range(n_lines):
-            outputline = "Point(%i) = { %8.8f, %8.8f, %8.8f, airfoil_lc};\n " \
-                         % (j, x[i], y[i], z[i])
-            j = j + 1
-            fout.write(outputline)
+        # all airfoil points are rendered in one pass
+        pointBlock = io.StringIO()
+        np.savetxt(pointBlock,
+                   np.column_stack((np.arange(startIndex, startIndex + n_lines), x, y, z)),
+                   fmt='Point(%i) = { %8.8f, %8.8f, %8.8f, airfoil_lc};')
+
+        out = []
+        out.append("airfoil_lc = %f;\n" % (self.innerMeshSize))
+        out.append(pointBlock.getvalue())
 
         # gmsh bspline format
         # Write out splinefit line
-        fout.write("Spline(%i) = {%i:%i, %i};\n" \
+        out.append("Spline(%i) = {%i:%i, %i};\n" \
                    % (startIndex, startIndex, startIndex + n_lines - 1, startIndex))
 
         # generate circular farfield
 
-        fout.write("radius = %i;\n" % (self.farfieldRadi * scale))
-        fout.write("farfield_lc = %f;\n" % (self.outerMeshSize))
-        fout.write("Point(11) = {0, 0, 0, farfield_lc};\n")
-        fout.write("Point(12) = {0, -radius, 0, farfield_lc};\n")
-        fout.write("Point(13) = {-radius, 0, 0, farfield_lc};\n")
-        fout.write("Point(14) = {0, radius, 0, farfield_lc};\n")
-        fout.write("Point(15) = {%d * radius, radius, 0, farfield_lc};\n" % (self.farfieldWakeLength))
-        fout.write("Point(16) = {%d * radius, -radius, 0, farfield_lc};\n" % (self.farfieldWakeLength))
-        fout.write("Circle(21) = {12, 11, 13};\n")
-        fout.write("Circle(22) = {13, 11, 14};\n")
-        fout.write("Line(25) = {14, 15};\n")
-        fout.write("Line(26) = {15, 16};\n")
-        fout.write("Line(27) = {16, 12};\n")
-        fout.write("Line Loop(1) = {21, 22, 25, 26, 27};\n")
-        fout.write("\n")
-
-        fout.write("Line Loop(2) = {1000};\n")
-        fout.write("Plane Surface(2000) = {1, 2};\n")
-        fout.write("\n")
+        out.append("radius = %i;\n" % (self.farfieldRadi * scale))
+        out.append("farfield_lc = %f;\n" % (self.outerMeshSize))
+        out.append("Point(11) = {0, 0, 0, farfield_lc};\n")
+        out.append("Point(12) = {0, -radius, 0, farfield_lc};\n")
+        out.append("Point(13) = {-radius, 0, 0, farfield_lc};\n")
+        out.append("Point(14) = {0, radius, 0, farfield_lc};\n")
+        out.append("Point(15) = {%d * radius, radius, 0, farfield_lc};\n" % (self.farfieldWakeLength))
+        out.append("Point(16) = {%d * radius, -radius, 0, farfield_lc};\n" % (self.farfieldWakeLength))
+        out.append("Circle(21) = {12, 11, 13};\n")
+        out.append("Circle(22) = {13, 11, 14};\n")
+        out.append("Line(25) = {14, 15};\n")
+        out.append("Line(26) = {15, 16};\n")
+        out.append("Line(27) = {16, 12};\n")
+        out.append("Line Loop(1) = {21, 22, 25, 26, 27};\n")
+        out.append("\n")
+
+        out.append("Line Loop(2) = {1000};\n")
+        out.append("Plane Surface(2000) = {1, 2};\n")
+        out.append("\n")
 
 
         #new test
         # Using Progression 2.00
-        fout.write("// define points on farfield\n")
-        fout.write("Transfinite Line{25} = %d;\n" % (self.pointsOnWake * self.farfieldWakeLength))
-        fout.write("Transfinite Line{26} = %d;\n" % (self.pointsOnWake * 2))
-        fout.write("Transfinite Line{27} = %d;\n" % (self.pointsOnWake * self.farfieldWakeLength))
-        fout.write("// circle\n")
-        fout.write("Transfinite Line{21} = %d;\n" % (self.pointsOnRadi))
-        fout.write("Transfinite Line{22} = %d;\n" % (self.pointsOnRadi))
-        fout.write("\n")
+        out.append("// define points on farfield\n")
+        out.append("Transfinite Line{25} = %d;\n" % (self.pointsOnWake * self.farfieldWakeLength))
+        out.append("Transfinite Line{26} = %d;\n" % (self.pointsOnWake * 2))
+        out.append("Transfinite Line{27} = %d;\n" % (self.pointsOnWake * self.farfieldWakeLength))
+        out.append("// circle\n")
+        out.append("Transfinite Line{21} = %d;\n" % (self.pointsOnRadi))
+        out.append("Transfinite Line{22} = %d;\n" % (self.pointsOnRadi))
+        out.append("\n")
         #end new test
 
 
-        fout.write("Physical Line(\"airfoil\") = {1000};\n")
-        fout.write("Physical Line(\"farfield\") = {21, 22, 25, 26, 27};\n")
-        #fout.write("Transfinite Line{1000} = 500;\n")
-        #fout.write("Transfinite Line{3001} = 500;\n")
-        #fout.write("Transfinite Surface{2000} = {1, 2};\n")
-        fout.write("Physical Surface(2000) = {2000};\n")
+        out.append("Physical Line(\"airfoil\") = {1000};\n")
+        out.append("Physical Line(\"farfield\") = {21, 22, 25, 26, 27};\n")
+        #out.append("Transfinite Line{1000} = 500;\n")
+        #out.append("Transfinite Line{3001} = 500;\n")
+        #out.append("Transfinite Surface{2000} = {1, 2};\n")
+        out.append("Physical Surface(2000) = {2000};\n")
         if self.recombinMesh:
-            fout.write("Recombine Surface{2000};\n")
+            out.append("Recombine Surface{2000};\n")
 
+        fout = open(working_dir + '/' + output_file_name, 'w')
+        fout.write(''.join(out))
         fout.close()
 
 if __name__ == '__main__':
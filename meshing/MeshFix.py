@@ -0,0 +1,184 @@
+__author__ = "Juri Bieler"
+__version__ = "0.0.1"
+__status__ = "Development"
+
+# ==============================================================================
+# description     :native replacement for the SU2_MSH round-trip, checks cell
+#                  orientation and marker closure on the in-memory mesh arrays
+#                  and writes the final su2 mesh directly
+# date            :2018-08-02
+# notes           :
+# python_version  :3.6
+# ==============================================================================
+
+import numpy as np
+
+
+class MeshFix:
+
+    # vtk element identifiers as used by the su2 mesh format
+    LINE = 3
+    TRIANGLE = 5
+    QUADRILATERAL = 9
+    NODES_PER_ELEM = {LINE: 2, TRIANGLE: 3, QUADRILATERAL: 4}
+
+    def __init__(self):
+        self.errorFlag = False
+        # (nPoints, 2) coordinates
+        self.points = None
+        # vtk element type -> (nElems, nodesPerElem) connectivity
+        self.elements = dict()
+        # marker tag -> (nEdges, 2) line connectivity, kept in insertion order
+        self.markers = dict()
+        self.markerOrder = []
+
+        self.flippedCount = 0
+        self.degeneratedCount = 0
+        self.removedPointCount = 0
+        self.openMarkers = []
+        # tolerance below which a cell area counts as degenerated
+        self.minCellArea = 1e-14
+
+    def set_mesh(self, points, elements, markers):
+        self.points = np.asarray(points, dtype=float)[:, :2]
+        self.elements = dict()
+        for elemType, conn in elements.items():
+            self.elements[elemType] = np.asarray(conn, dtype=np.int64)
+        self.markers = dict()
+        self.markerOrder = []
+        for tag, edges in markers:
+            self.markers[tag] = np.asarray(edges, dtype=np.int64).reshape(-1, 2)
+            self.markerOrder.append(tag)
+
+    def read_su2_file(self, file_path):
+        f = open(file_path, 'r')
+        lines = [l.strip() for l in f.read().splitlines()]
+        f.close()
+        lines = [l for l in lines if len(l) > 0 and l[0] != '%']
+
+        elements = dict()
+        markers = []
+        points = None
+        i = 0
+        while i < len(lines):
+            key, _, value = lines[i].partition('=')
+            key = key.strip().upper()
+            value = value.strip()
+            if key == 'NELEM':
+                count = int(value)
+                rows = [l.split() for l in lines[i + 1:i + 1 + count]]
+                byType = dict()
+                for r in rows:
+                    elemType = int(r[0])
+                    nNodes = self.NODES_PER_ELEM.get(elemType, len(r) - 2)
+                    byType.setdefault(elemType, []).append([int(v) for v in r[1:1 + nNodes]])
+                for elemType, conn in byType.items():
+                    elements[elemType] = np.array(conn, dtype=np.int64)
+                i += count + 1
+            elif key == 'NPOIN':
+                count = int(value.split()[0])
+                points = np.array([[float(v) for v in l.split()[:2]] for l in lines[i + 1:i + 1 + count]])
+                i += count + 1
+            elif key == 'MARKER_TAG':
+                tag = value
+                count = int(lines[i + 1].partition('=')[2])
+                edges = [[int(v) for v in l.split()[1:3]] for l in lines[i + 2:i + 2 + count]]
+                markers.append((tag, edges))
+                i += count + 2
+            else:
+                i += 1
+        self.set_mesh(points, elements, markers)
+
+    @staticmethod
+    def signed_areas(points, conn):
+        # shoelace formula over all cells at once, positive for counter-clockwise cells
+        x = points[conn, 0]
+        y = points[conn, 1]
+        xNext = np.roll(x, -1, axis=1)
+        yNext = np.roll(y, -1, axis=1)
+        return 0.5 * np.sum(x * yNext - xNext * y, axis=1)
+
+    def fix_orientation(self):
+        self.flippedCount = 0
+        self.degeneratedCount = 0
+        for elemType, conn in self.elements.items():
+            areas = self.signed_areas(self.points, conn)
+            inverted = areas < 0.
+            if np.any(inverted):
+                # keep the first node, reverse the remaining ones
+                conn[inverted, 1:] = conn[inverted, 1:][:, ::-1]
+                self.flippedCount += int(np.count_nonzero(inverted))
+            self.degeneratedCount += int(np.count_nonzero(np.abs(areas) <= self.minCellArea))
+        if self.flippedCount > 0:
+            print('flipped ' + str(self.flippedCount) + ' inverted cells')
+        if self.degeneratedCount > 0:
+            print('ERROR: mesh contains ' + str(self.degeneratedCount) + ' degenerated cells')
+            self.errorFlag = True
+
+    def remove_unused_points(self):
+        used = np.zeros(len(self.points), dtype=bool)
+        for conn in self.elements.values():
+            used[conn.ravel()] = True
+        self.removedPointCount = int(len(self.points) - np.count_nonzero(used))
+        if self.removedPointCount == 0:
+            return
+        newIndex = np.cumsum(used) - 1
+        self.points = self.points[used]
+        for elemType in self.elements:
+            self.elements[elemType] = newIndex[self.elements[elemType]]
+        for tag in self.markers:
+            self.markers[tag] = newIndex[self.markers[tag]]
+        print('removed ' + str(self.removedPointCount) + ' unused points')
+
+    def check_marker_closure(self):
+        # a closed marker loop touches every one of its nodes exactly twice
+        self.openMarkers = []
+        for tag in self.markerOrder:
+            edges = self.markers[tag]
+            if len(edges) == 0:
+                self.openMarkers.append(tag)
+                continue
+            nodes, counts = np.unique(edges.ravel(), return_counts=True)
+            if np.any(counts != 2) or np.any(edges[:, 0] == edges[:, 1]):
+                self.openMarkers.append(tag)
+        if len(self.openMarkers) > 0:
+            print('ERROR: marker(s) not closed: ' + ', '.join(self.openMarkers))
+            self.errorFlag = True
+
+    def fix(self):
+        self.errorFlag = False
+        self.fix_orientation()
+        self.remove_unused_points()
+        self.check_marker_closure()
+        return self.errorFlag
+
+    def get_point_count(self):
+        return len(self.points)
+
+    def get_element_count(self):
+        return int(sum(len(conn) for conn in self.elements.values()))
+
+    def write_su2_file(self, file_path):
+        su2File = open(file_path, 'w')
+        su2File.write('NDIME=2\n')
+        su2File.write('NELEM=%s\n' % self.get_element_count())
+        elemID = 0
+        for elemType in sorted(self.elements.keys()):
+            conn = self.elements[elemType]
+            ids = np.arange(elemID, elemID + len(conn)).reshape(-1, 1)
+            types = np.full((len(conn), 1), elemType, dtype=np.int64)
+            np.savetxt(su2File, np.hstack((types, conn, ids)), fmt='%d', delimiter=' \t ')
+            elemID += len(conn)
+
+        su2File.write('NPOIN=%s\n' % len(self.points))
+        ids = np.arange(len(self.points), dtype=float).reshape(-1, 1)
+        np.savetxt(su2File, np.hstack((self.points, ids)), fmt=['%.15g', '%.15g', '%d'], delimiter=' \t ')
+
+        su2File.write('NMARK=%s\n' % len(self.markerOrder))
+        for tag in self.markerOrder:
+            edges = self.markers[tag]
+            su2File.write('MARKER_TAG= %s\n' % tag)
+            su2File.write('MARKER_ELEMS=%s\n' % len(edges))
+            types = np.full((len(edges), 1), self.LINE, dtype=np.int64)
+            np.savetxt(su2File, np.hstack((types, edges)), fmt='%d', delimiter=' \t ')
+        su2File.close()
@@ -0,0 +1,160 @@
+__author__ = "Juri Bieler"
+__version__ = "0.0.1"
+__status__ = "Development"
+
+# ==============================================================================
+# description     :vectorized mesh quality metrics, used as a gate before a
+#                  mesh is handed to SU2_CFD
+# date            :2018-08-03
+# notes           :
+# python_version  :3.6
+# ==============================================================================
+
+import math
+import numpy as np
+
+
+class MeshQuality:
+
+    def __init__(self):
+        self.errorFlag = False
+        # limits the metrics are checked against
+        self.thresholds = dict()
+        self.thresholds['minJacobian'] = 0.
+        self.thresholds['maxSkewness'] = 0.98
+        self.thresholds['maxAspectRatio'] = 1e6
+        self.thresholds['maxGrowthRatio'] = 20.
+        self.thresholds['maxYPlus'] = 5.
+        # violations of these thresholds reject the mesh, all others are only flagged
+        self.rejectOn = ['minJacobian', 'maxSkewness']
+
+        self.metrics = dict()
+        self.violations = dict()
+        self.rejected = False
+
+    @staticmethod
+    def _corner_vectors(points, conn):
+        x = points[conn, 0]
+        y = points[conn, 1]
+        # edge from each corner to the next one and to the previous one
+        nextX = np.roll(x, -1, axis=1) - x
+        nextY = np.roll(y, -1, axis=1) - y
+        prevX = np.roll(x, 1, axis=1) - x
+        prevY = np.roll(y, 1, axis=1) - y
+        return nextX, nextY, prevX, prevY
+
+    def compute_cell_metrics(self, points, conn):
+        nextX, nextY, prevX, prevY = self._corner_vectors(points, conn)
+        edgeLen = np.sqrt(nextX ** 2 + nextY ** 2)
+        prevLen = np.sqrt(prevX ** 2 + prevY ** 2)
+
+        # corner jacobian (cross product at every corner), negative means inverted or concave cell
+        jacobian = nextX * prevY - nextY * prevX
+        area = 0.5 * np.sum(points[conn, 0] * np.roll(points[conn, 1], -1, axis=1)
+                            - np.roll(points[conn, 0], -1, axis=1) * points[conn, 1], axis=1)
+
+        # equiangle skewness
+        with np.errstate(invalid='ignore', divide='ignore'):
+            cosAngle = (nextX * prevX + nextY * prevY) / (edgeLen * prevLen)
+            angle = np.degrees(np.arccos(np.clip(cosAngle, -1., 1.)))
+            equiAngle = 180. * (conn.shape[1] - 2) / conn.shape[1]
+            skewness = np.maximum((angle.max(axis=1) - equiAngle) / (180. - equiAngle),
+                                  (equiAngle - angle.min(axis=1)) / equiAngle)
+            aspectRatio = edgeLen.max(axis=1) / edgeLen.min(axis=1)
+        return area, jacobian.min(axis=1), skewness, aspectRatio
+
+    @staticmethod
+    def _edge_keys(edges, nPoints):
+        low = np.minimum(edges[:, 0], edges[:, 1])
+        high = np.maximum(edges[:, 0], edges[:, 1])
+        return low * nPoints + high
+
+    def compute_growth_ratio(self, points, conn, area):
+        # neighbouring cells share an edge, after sorting the edge keys they are adjacent
+        nCells, nCorner = conn.shape
+        edges = np.stack((conn, np.roll(conn, -1, axis=1)), axis=-1).reshape(-1, 2)
+        keys = self._edge_keys(edges, len(points))
+        cellIDs = np.repeat(np.arange(nCells), nCorner)
+        order = np.argsort(keys, kind='mergesort')
+        keys = keys[order]
+        cellIDs = cellIDs[order]
+        shared = np.nonzero(keys[1:] == keys[:-1])[0]
+        cellA = cellIDs[shared]
+        cellB = cellIDs[shared + 1]
+        absArea = np.abs(area)
+        with np.errstate(invalid='ignore', divide='ignore'):
+            ratio = np.maximum(absArea[cellA], absArea[cellB]) / np.minimum(absArea[cellA], absArea[cellB])
+        growth = np.ones(nCells)
+        np.maximum.at(growth, cellA, ratio)
+        np.maximum.at(growth, cellB, ratio)
+        return growth, keys, cellIDs
+
+    def compute_y_plus(self, points, wall_edges, area, edge_keys, edge_cells, reynolds, ref_length):
+        # first cell height from cell area over wall edge length, skin friction from the flat plate estimate
+        if wall_edges is None or len(wall_edges) == 0 or reynolds is None or reynolds <= 0.:
+            return np.zeros(0)
+        wallKeys = self._edge_keys(wall_edges, len(points))
+        pos = np.clip(np.searchsorted(edge_keys, wallKeys), 0, len(edge_keys) - 1)
+        found = edge_keys[pos] == wallKeys
+        cells = edge_cells[pos[found]]
+        wall = wall_edges[found]
+        wallLen = np.sqrt(np.sum((points[wall[:, 0]] - points[wall[:, 1]]) ** 2, axis=1))
+        height = np.abs(area[cells]) / wallLen
+        cf = 0.026 / math.pow(reynolds, 1. / 7.)
+        return height / ref_length * reynolds * math.sqrt(cf / 2.)
+
+    def evaluate(self, points, elements, wall_edges=None, reynolds=None, ref_length=1.):
+        areas = []
+        jacobians = []
+        skews = []
+        aspects = []
+        growths = []
+        yPlus = []
+        for elemType in sorted(elements.keys()):
+            conn = elements[elemType]
+            area, jacobian, skewness, aspectRatio = self.compute_cell_metrics(points, conn)
+            growth, keys, cells = self.compute_growth_ratio(points, conn, area)
+            yPlus.append(self.compute_y_plus(points, wall_edges, area, keys, cells, reynolds, ref_length))
+            areas.append(area)
+            jacobians.append(jacobian)
+            skews.append(skewness)
+            aspects.append(aspectRatio)
+            growths.append(growth)
+        self.metrics = dict()
+        self.metrics['area'] = np.concatenate(areas)
+        self.metrics['jacobian'] = np.concatenate(jacobians)
+        self.metrics['skewness'] = np.concatenate(skews)
+        self.metrics['aspectRatio'] = np.concatenate(aspects)
+        self.metrics['growthRatio'] = np.concatenate(growths)
+        self.metrics['yPlus'] = np.concatenate(yPlus)
+        return self.metrics
+
+    def check(self, points, elements, wall_edges=None, reynolds=None, ref_length=1.):
+        self.evaluate(points, elements, wall_edges=wall_edges, reynolds=reynolds, ref_length=ref_length)
+        self.violations = dict()
+        self.violations['minJacobian'] = int(np.count_nonzero(~(self.metrics['jacobian'] > self.thresholds['minJacobian'])))
+        self.violations['maxSkewness'] = int(np.count_nonzero(~(self.metrics['skewness'] <= self.thresholds['maxSkewness'])))
+        self.violations['maxAspectRatio'] = int(np.count_nonzero(~(self.metrics['aspectRatio'] <= self.thresholds['maxAspectRatio'])))
+        self.violations['maxGrowthRatio'] = int(np.count_nonzero(~(self.metrics['growthRatio'] <= self.thresholds['maxGrowthRatio'])))
+        self.violations['maxYPlus'] = int(np.count_nonzero(self.metrics['yPlus'] > self.thresholds['maxYPlus']))
+
+        self.rejected = False
+        for key, count in self.violations.items():
+            if count > 0:
+                if key in self.rejectOn:
+                    print('ERROR: mesh quality, ' + str(count) + ' cells violate ' + key + '= ' + str(self.thresholds[key]))
+                    self.rejected = True
+                else:
+                    print('WARNING: mesh quality, ' + str(count) + ' cells violate ' + key + '= ' + str(self.thresholds[key]))
+        self.errorFlag = self.rejected
+        return not self.rejected
+
+    def get_summary(self):
+        summary = dict()
+        for key, values in self.metrics.items():
+            if len(values) > 0:
+                summary[key + 'Min'] = float(np.nanmin(values))
+                summary[key + 'Max'] = float(np.nanmax(values))
+        for key, count in self.violations.items():
+            summary[key + 'Violations'] = count
+        return summary
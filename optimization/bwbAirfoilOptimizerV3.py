@@ -9,6 +9,7 @@ import math
 from meshing.Gmsh import Gmsh
 from airfoil.Airfoil import Airfoil
 from cfd.SU2 import SU2
+from cfd.SU2Config import SU2Config
 from airfoil.BPAirfoil import BPAirfoil
 from cfd.CFDrun import CFDrun
 from constants import *
@@ -43,40 +44,40 @@ REF_AREA = REF_LENGTH  # cd, cl get smaller
 SCALE = REF_LENGTH  # cd, cl get bigger
 
 ### default config for SU2 run ###
-config = dict()
+config = SU2Config()
 
 speedOfSound = 307.828 # for altitude 10363 m
 kinViscosity = 5.99537e-5 # for altitude 10363 m
 REYNOLD = speedOfSound * REF_LENGTH * MACH_NR / kinViscosity
 print('Reynolds-Number: ' + str(REYNOLD))
-config['REF_LENGTH'] = str(REF_LENGTH)
-config['REF_AREA'] = str(REF_AREA)
-config['REYNOLDS_NUMBER'] = str(REYNOLD)
+config['REF_LENGTH'] = REF_LENGTH
+config['REF_AREA'] = REF_AREA
+config['REYNOLDS_NUMBER'] = REYNOLD
 
-config['FIXED_CL_MODE'] = 'NO'
+config['FIXED_CL_MODE'] = False
 #config['TARGET_CL'] = 0.15
 
-config['MACH_NUMBER'] = str(MACH_NR)
-config['FREESTREAM_PRESSURE'] = str(24999.8) #for altitude 10363 m
-config['FREESTREAM_TEMPERATURE'] = str(220.79) #for altitude 10363 m
-#config['GAS_CONSTANT'] = str(287.87)
-#config['REF_LENGTH'] = str(1.0)
-#config['REF_AREA'] = str(1.0)
-config['EXT_ITER'] = str(5000)
+config['MACH_NUMBER'] = MACH_NR
+config['FREESTREAM_PRESSURE'] = 24999.8 #for altitude 10363 m
+config['FREESTREAM_TEMPERATURE'] = 220.79 #for altitude 10363 m
+#config['GAS_CONSTANT'] = 287.87
+#config['REF_LENGTH'] = 1.0
+#config['REF_AREA'] = 1.0
+config['EXT_ITER'] = 5000
 config['OUTPUT_FORMAT'] = 'PARAVIEW'
 
-config['MGLEVEL'] = str(3)
+config['MGLEVEL'] = 3
 config['MGCYCLE'] = 'V_CYCLE'
-config['MG_DAMP_RESTRICTION'] = str(.45)
-config['MG_DAMP_PROLONGATION'] = str(.45)
+config['MG_DAMP_RESTRICTION'] = .45
+config['MG_DAMP_PROLONGATION'] = .45
 
 #config['CFL_ADAPT'] = 'YES'
 #config['CFL_ADAPT_PARAM'] = '( 1.5, 0.5, 1.0, 50.0 )'
 
 config['TIME_DISCRE_FLOW'] = 'EULER_IMPLICIT'
 config['CONV_NUM_METHOD_FLOW'] = 'JST'
-config['RELAXATION_FACTOR_FLOW'] = str(1.)
-config['RELAXATION_FACTOR_TURB'] = str(1.)
+config['RELAXATION_FACTOR_FLOW'] = 1.
+config['RELAXATION_FACTOR_TURB'] = 1.
 
 cabinLength = 0.55
 cabinHeigth = 0.14
@@ -4,13 +4,22 @@ __status__ = "Development"
 
 import os
 import sys
+import shutil
 import math
+import numpy as np
 
 from meshing.Gmsh import Gmsh
 from airfoil.Airfoil import Airfoil
 from cfd.SU2 import SU2
+from cfd.SU2Config import SU2Config
 from airfoil.BPAirfoil import BPAirfoil
 from cfd.CFDrun import CFDrun
+from cfd.ConvergenceMonitor import ConvergenceMonitor, SolverFailure
+from cfd.WarmStart import WarmStart
+from cfd.EvaluationCache import EvaluationCache
+from cfd.RunArchive import RunArchive
+from cfd.BatchEvaluation import evaluate_batch
+from cfd.AdjointGradient import AdjointGradient
 from constants import *
 
 sys.path.insert(0, './OpenMDAO')
@@ -41,51 +50,102 @@ REF_AREA = REF_LENGTH  # cd, cl get smaller
 SCALE = REF_LENGTH  # cd, cl get bigger
 
 ### default config for SU2 run ###
-config = dict()
+config = SU2Config()
 
 speedOfSound = 307.828 # for altitude 10363 m
 kinViscosity = 5.99537e-5 # for altitude 10363 m
 REYNOLD = speedOfSound * REF_LENGTH * MACH_NR / kinViscosity
 print('Reynolds-Number: ' + str(REYNOLD))
-config['REF_LENGTH'] = str(REF_LENGTH)
-config['REF_AREA'] = str(REF_AREA)
-config['REYNOLDS_NUMBER'] = str(REYNOLD)
+config['REF_LENGTH'] = REF_LENGTH
+config['REF_AREA'] = REF_AREA
+config['REYNOLDS_NUMBER'] = REYNOLD
 
-config['FIXED_CL_MODE'] = 'NO'
+config['FIXED_CL_MODE'] = False
 #config['TARGET_CL'] = 0.15
 
-config['MACH_NUMBER'] = str(MACH_NR)
-config['FREESTREAM_PRESSURE'] = str(24999.8) #for altitude 10363 m
-config['FREESTREAM_TEMPERATURE'] = str(220.79) #for altitude 10363 m
-#config['GAS_CONSTANT'] = str(287.87)
-#config['REF_LENGTH'] = str(1.0)
-#config['REF_AREA'] = str(1.0)
-config['EXT_ITER'] = str(5000)
+config['MACH_NUMBER'] = MACH_NR
+config['FREESTREAM_PRESSURE'] = 24999.8 #for altitude 10363 m
+config['FREESTREAM_TEMPERATURE'] = 220.79 #for altitude 10363 m
+#config['GAS_CONSTANT'] = 287.87
+#config['REF_LENGTH'] = 1.0
+#config['REF_AREA'] = 1.0
+config['EXT_ITER'] = 5000
 config['OUTPUT_FORMAT'] = 'PARAVIEW'
 
-config['MGLEVEL'] = str(3)
+config['MGLEVEL'] = 3
 config['MGCYCLE'] = 'V_CYCLE'
-config['MG_DAMP_RESTRICTION'] = str(.45)
-config['MG_DAMP_PROLONGATION'] = str(.45)
+config['MG_DAMP_RESTRICTION'] = .45
+config['MG_DAMP_PROLONGATION'] = .45
 
 #config['CFL_ADAPT'] = 'YES'
 #config['CFL_ADAPT_PARAM'] = '( 1.5, 0.5, 1.0, 50.0 )'
 
 config['TIME_DISCRE_FLOW'] = 'EULER_IMPLICIT'
 config['CONV_NUM_METHOD_FLOW'] = 'JST'
-config['RELAXATION_FACTOR_FLOW'] = str(1.)
-config['RELAXATION_FACTOR_TURB'] = str(1.)
+config['RELAXATION_FACTOR_FLOW'] = 1.
+config['RELAXATION_FACTOR_TURB'] = 1.
 
 cabinLength = 0.55
 cabinHeigth = 0.14
 
+# constraint bounds, used by the driver and to pick the best feasible design
+CL_LOWER = 0.145
+CL_UPPER = .155
+CM_LOWER = -0.05
+CM_UPPER = 99.
+# cabin height bounds as factors of cabinHeigth
+CABIN_HEIGHT_LOWER = 0.99
+CABIN_HEIGHT_UPPER = 1.05
+
+# design inputs of AirfoilCFD, in the order of the jacobian columns
+BP_INPUT_NAMES = ['r_le', 'beta_te', 'x_t', 'gamma_le', 'x_c', 'y_c', 'alpha_te', 'b_8', 'b_15', 'b_0', 'b_2', 'b_17']
+OUTPUT_NAMES = ['c_d', 'c_l', 'c_m', 'y_t', 'cabin_height', 'angle', 'offsetFront']
+# cfd outputs and the history column they come from
+CFD_OUTPUT_COLUMNS = [('c_d', 'CD'), ('c_l', 'CL'), ('c_m', 'CMz')]
+
+
+def as_scalar(value):
+    # openmdao values are 1 element arrays, numpy does not take them as python floats any more
+    return float(np.asarray(value).ravel()[0])
+
+
 class AirfoilCFD(ExplicitComponent):
 
+    def initialize(self):
+        # 'adjoint': cd, cl, cm gradients from discrete adjoints of the last solved design,
+        # falls back to finite differences if that is not possible, 'fd': finite differences only,
+        # 'none': gradient free drivers (e.g. COBYLA) never ask for one, nothing is prepared
+        self.options.declare('gradient_mode', default='adjoint', values=['adjoint', 'fd', 'none'])
+
     def setup(self):
         ######################
         ### needed Objects ###
         self.bzFoil = BPAirfoil()
         self.air = Airfoil(None)
+        # all c-grids share the same topology, so each design restarts from the last converged one
+        self.warmStart = WarmStart(WORKING_DIR + '/' + PROJECT_NAME_PREFIX + '_warmStart.dat')
+        # drag of the best feasible design so far, only its run gets full field output
+        self.bestCD = float('inf')
+        # results of all designs solved so far, also from earlier optimization runs
+        self.evalCache = EvaluationCache(WORKING_DIR + '/' + PROJECT_NAME_PREFIX + '_evalCache.sqlite')
+        # finished project dirs are packed into zip volumes, see RunArchiveReader to get files back
+        self.archive = RunArchive(WORKING_DIR + '/' + PROJECT_NAME_PREFIX + '_archive')
+        # construct2d settings of every design
+        self.meshSettings = {'pointsInNormalDir': 80, 'pointNrAirfoilSurface': 200, 'reynoldsNum': REYNOLD}
+        # forward difference step of compute_partials, absolute, large enough to rise above the solver noise
+        self.fdStep = 1e-4
+        # the perturbed designs of one gradient run side by side on fdCores cores
+        self.fdCores = SU2_USED_CORES
+        self.fdCoresPerCase = 1
+        self.gradientCounter = 0
+        # (input values, outputs, error) of the last compute, the baseline of the next gradient
+        self._lastEvaluation = None
+        self.gradientMode = self.options['gradient_mode']
+        # flow solution and mesh of the last solved design, the adjoints restart from it
+        self.adjointBaseDir = WORKING_DIR + '/' + PROJECT_NAME_PREFIX + '_adjointBase'
+        self.adjointBaseReady = False
+        # input values of the design in adjointBaseDir
+        self._adjointBaseInputs = None
 
 
         #####################
@@ -119,9 +179,124 @@ class AirfoilCFD(ExplicitComponent):
         self.add_output('angle', val=0.)
         self.add_output('offsetFront', val=.1)
 
-        self.declare_partials('*', '*', method='fd')
+        # adjoints or forward differences in compute_partials, see gradient_mode
+        self.declare_partials('*', '*')
         self.executionCounter = 0
 
+    def is_best_design(self, results, outputs):
+        # feasible within the constraint bounds of runOpenMdao
+        if not CFDrun.results_valid(results):
+            return False
+        cd = as_scalar(results['CD'])
+        feasible = CL_LOWER <= as_scalar(results['CL']) <= CL_UPPER \
+                   and CM_LOWER <= as_scalar(results['CMz']) <= CM_UPPER \
+                   and cabinHeigth * CABIN_HEIGHT_LOWER <= as_scalar(outputs['cabin_height']) <= cabinHeigth * CABIN_HEIGHT_UPPER
+        if not feasible or cd >= self.bestCD:
+            return False
+        self.bestCD = cd
+        return True
+
+    def get_bp_parameters(self):
+        # the geometry part of the cache key, y_t is the one found by the cabin fit
+        params = dict()
+        for name in ['r_le', 'beta_te', 'x_t', 'y_t', 'gamma_le', 'x_c', 'y_c', 'alpha_te', 'z_te',
+                     'b_8', 'b_15', 'b_0', 'b_2', 'b_17']:
+            params[name] = getattr(self.bzFoil, name)
+        return params
+
+    def get_mesh_settings(self):
+        settings = dict(self.meshSettings)
+        settings['mesher'] = 'construct2d'
+        settings['scale'] = SCALE
+        return settings
+
+    def set_bp_inputs(self, values):
+        for name in BP_INPUT_NAMES:
+            # openmdao hands in 1 element arrays, the airfoil math wants scalars
+            setattr(self.bzFoil, name, as_scalar(values[name]))
+        self.bzFoil.dz_te = 0.
+        self.bzFoil.z_te = 0.
+
+    def fit_cabin_design(self):
+        # uses cabin fit optimization to find y_t, returns y_t, height, angle, offsetFront
+        cabinFit.cabinHeigth = cabinHeigth
+        cabinFit.cabinLength = cabinLength
+        cabinFit.bzFoil = self.bzFoil
+        y_t, height, angle, offsetFront = cabinFit.run_cabin_opti(show_plot=False)
+        self.bzFoil.y_t = y_t
+        return y_t, height, angle, offsetFront
+
+    def solve_design(self, cfd, outputs, cache_key):
+        # meshes and solves the design, returns the parsed results or None if it failed
+        # stop the solver once CL, CD and CMz settled
+        cfd.su2.monitor = ConvergenceMonitor()
+        if self.gradientMode == 'adjoint':
+            # the adjoint needs the residual converged flow solution, SU2 ends the run on its own criterion
+            cfd.su2.monitor.stopWhenConverged = False
+        cfd.outputProfile = 'lean'
+        cfd.construct2d_generate_mesh(scale=SCALE, plot=False)
+        cfd.su2_fix_mesh()
+        solverFailure = None
+        try:
+            cfd.su2_solve(config)
+        except SolverFailure as e:
+            solverFailure = e
+        if cfd.meshRejected:
+            print('ERROR: AirfoilCFD, mesh rejected by quality gate')
+            cfd.clean_up()
+            self.evalCache.put(cache_key, dict(), config, run_dir=self.archive.get_reference(os.path.basename(cfd.persistentDir)), status='failed')
+            return None
+        if solverFailure is not None:
+            #raise AnalysisError('AirfoilCFD: ' + str(solverFailure))
+            print('ERROR: AirfoilCFD, ' + type(solverFailure).__name__ + ': ' + str(solverFailure))
+            cfd.clean_up()
+            # not cached, a diverged or stalled run may work out with another warm start or solver setting
+            return None
+        results = cfd.su2_parse_iteration_result()
+        # field output only for designs that improve on the best feasible one so far
+        if self.is_best_design(results, outputs):
+            cfd.promote_full_output(config)
+        if self.gradientMode == 'adjoint' and CFDrun.results_valid(results):
+            self.adjointBaseReady = self.primal_converged(cfd) and self.store_adjoint_base(cfd)
+        cfd.clean_up()
+        if CFDrun.results_valid(results):
+            self.evalCache.put(cache_key, results, config, run_dir=self.archive.get_reference(os.path.basename(cfd.persistentDir)))
+        return results
+
+    def primal_converged(self, cfd):
+        # the residual criterion of the config was met, a run that hit EXT_ITER is no adjoint base
+        residual = cfd.su2.monitor.get_column(cfd.su2.monitor.residualField)
+        if residual is None:
+            print('WARNING: AirfoilCFD, no residual history, no adjoint gradient')
+            return False
+        if residual.max() - residual[-1] >= float(config.get_run_value('RESIDUAL_REDUCTION')) \
+                or residual[-1] <= float(config.get_run_value('RESIDUAL_MINVAL')):
+            return True
+        print('WARNING: AirfoilCFD, flow residual not converged (' + str(residual[-1]) + '), no adjoint gradient')
+        return False
+
+    def store_adjoint_base(self, cfd):
+        # keeps flow solution and mesh of the design for the adjoints of the next gradient
+        if os.path.isdir(self.adjointBaseDir):
+            shutil.rmtree(self.adjointBaseDir)
+        os.makedirs(self.adjointBaseDir)
+        for name in ['restart_flow.dat', cfd.meshFileName]:
+            if not os.path.isfile(cfd.projectDir + '/' + name):
+                print('WARNING: AirfoilCFD, no ' + name + ' in ' + cfd.projectDir + ', no adjoint gradient')
+                return False
+            shutil.copyfile(cfd.projectDir + '/' + name, self.adjointBaseDir + '/' + os.path.basename(name))
+        return True
+
+    def archive_design(self, project_name, cfd, outputs, error):
+        metadata = dict()
+        metadata['parameters'] = self.get_bp_parameters()
+        metadata['outputs'] = dict((name, outputs[name]) for name in ['c_d', 'c_l', 'c_m', 'y_t', 'cabin_height',
+                                                                      'angle', 'offsetFront'])
+        metadata['error'] = error
+        # the warm start keeps its own copy of the restart file
+        self.archive.add_case(project_name, cfd.persistentDir, metadata=metadata, remove_source=True,
+                              skip_patterns=['restart_flow.dat'])
+
     """
     def fit_cabin(self, xFront, angle):
         top, buttom = self.bzFoil.get_cooridnates_top_buttom(500)
@@ -139,25 +314,11 @@ class AirfoilCFD(ExplicitComponent):
 
     def compute(self, inputs, outputs):
         error = False
-        self.bzFoil.r_le = inputs['r_le']
-        self.bzFoil.beta_te = inputs['beta_te']
-        self.bzFoil.dz_te = 0.
-        self.bzFoil.x_t = inputs['x_t']
-
-        self.bzFoil.gamma_le = inputs['gamma_le']
-        self.bzFoil.x_c = inputs['x_c']
-        self.bzFoil.y_c = inputs['y_c']
-        self.bzFoil.alpha_te = inputs['alpha_te']
-        self.bzFoil.z_te = 0.
-
-        self.bzFoil.b_8 = inputs['b_8']
-        self.bzFoil.b_15 = inputs['b_15']
-        self.bzFoil.b_0 = inputs['b_0']
-        self.bzFoil.b_2 = inputs['b_2']
-        self.bzFoil.b_17 = inputs['b_17']
+        self.adjointBaseReady = False
+        self.set_bp_inputs(inputs)
 
         projectName = PROJECT_NAME_PREFIX + '_%09d' % self.executionCounter
-        cfd = CFDrun(projectName)
+        cfd = CFDrun(projectName, warm_start=self.warmStart)
 
         airFoilCoords = self.bzFoil.generate_airfoil(500,
                                                      show_plot=False,
@@ -167,11 +328,7 @@ class AirfoilCFD(ExplicitComponent):
         # check if bz is valid
         if self.bzFoil.valid:
             ### use cabin fit optimization to find y_t
-            cabinFit.cabinHeigth = cabinHeigth
-            cabinFit.cabinLength = cabinLength
-            cabinFit.bzFoil = self.bzFoil
-            y_t, height, angle, offsetFront = cabinFit.run_cabin_opti(show_plot=False)
-            self.bzFoil.y_t = y_t
+            y_t, height, angle, offsetFront = self.fit_cabin_design()
 
             outputs['cabin_height'] = height
             outputs['y_t'] = y_t
@@ -185,13 +342,14 @@ class AirfoilCFD(ExplicitComponent):
             print('ERROR: AirfoilCFD, invalid BPAirfoil')
             self.bzFoil.save_parameters_to_file(
                 WORKING_DIR + '/bz_error_' + datetime.now().strftime('%Y-%m-%d_%H_%M_%S') + '.txt')
+            cfd.clean_up()
             error = True
         else:
 
-            self.bzFoil.plot_airfoil_with_cabin(outputs['offsetFront'],
+            self.bzFoil.plot_airfoil_with_cabin(offsetFront,
                                                 cabinLength,
-                                                outputs['cabin_height'],
-                                                outputs['angle'],
+                                                height,
+                                                angle,
                                                 show_plot=False,
                                                 save_plot_path=WORKING_DIR + '/' + projectName + '/airfoil_cabin.png')
 
@@ -199,60 +357,220 @@ class AirfoilCFD(ExplicitComponent):
             top, buttom = self.bzFoil.get_cooridnates_top_buttom(500)
             cfd.set_airfoul_coords(top, buttom)
 
-            cfd.c2d.pointsInNormalDir = 80
-            cfd.c2d.pointNrAirfoilSurface = 200
-            cfd.c2d.reynoldsNum = REYNOLD
-            cfd.construct2d_generate_mesh(scale=SCALE, plot=False)
-            cfd.su2_fix_mesh()
-            cfd.su2_solve(config)
-            results = cfd.su2_parse_iteration_result()
-            cfd.clean_up()
-
-            if float(results['CD']) <= 0. or float(results['CD']) > 100.:
-                #raise AnalysisError('AirfoilCFD: c_d is out of range (cfd failed)')
-                print('ERROR: AirfoilCFD, c_d is out of range (cfd failed)')
-                error = True
-
-            outputs['c_d'] = results['CD']
-            outputs['c_l'] = results['CL']
-            outputs['c_m'] = results['CMz']
-            print('c_l= ' + str(outputs['c_l']))
-            print('c_d= ' + str(outputs['c_d']))
-            print('c_m= ' + str(outputs['c_m']))
-            print('c_l/c_d= ' + str(results['CL/CD']))
-            print('cfdIterations= ' + str(results['Iteration']))
-            write_to_log(str(self.executionCounter) + ','
-                         + datetime.now().strftime('%H:%M:%S') + ','
-                         + str(outputs['c_l']) + ','
-                         + str(outputs['c_d']) + ','
-                         + str(outputs['c_m']) + ','
-                         + str(results['CL/CD']) + ','
-                         + str(results['Iteration']) + ','
-                         + str(outputs['cabin_height']) + ','
-                         + str(outputs['offsetFront']) + ','
-                         + str(outputs['angle']) + ','
-                         + str(inputs['r_le']) + ','
-                         + str(inputs['beta_te']) + ','
-                         + str(inputs['x_t']) + ','
-                         + str(outputs['y_t']) + ','
-                         + str(inputs['gamma_le']) + ','
-                         + str(inputs['x_c']) + ','
-                         + str(inputs['y_c']) + ','
-                         + str(inputs['alpha_te']) + ','
-                         + str(self.bzFoil.z_te) + ','#+ str(inputs['z_te']) + ','
-                         + str(inputs['b_8']) + ','
-                         + str(inputs['b_15']) + ','
-                         + str(inputs['b_0']) + ','
-                         + str(inputs['b_17']) + ','
-                         + str(inputs['b_2']))
+            for key, value in self.meshSettings.items():
+                setattr(cfd.c2d, key, value)
+
+            # optimizers revisit designs, those are taken from the cache instead of solving them again
+            cacheKey = self.evalCache.make_key(self.get_bp_parameters(), config, self.get_mesh_settings())
+            cached = self.evalCache.get(cacheKey)
+            if cached is not None:
+                print('cache hit, design was solved before in ' + cached['runDir'])
+                cfd.clean_up()
+                results = None
+                if cached['status'] != 'ok':
+                    print('ERROR: AirfoilCFD, cached design failed before')
+                    error = True
+                else:
+                    results = cached
+                    results['CL/CD'] = cached['CL'] / cached['CD']
+            else:
+                results = self.solve_design(cfd, outputs, cacheKey)
+                if results is None:
+                    error = True
+
+            if results is not None:
+                if as_scalar(results['CD']) <= 0. or as_scalar(results['CD']) > 100.:
+                    #raise AnalysisError('AirfoilCFD: c_d is out of range (cfd failed)')
+                    print('ERROR: AirfoilCFD, c_d is out of range (cfd failed)')
+                    error = True
+
+                outputs['c_d'] = results['CD']
+                outputs['c_l'] = results['CL']
+                outputs['c_m'] = results['CMz']
+                print('c_l= ' + str(outputs['c_l']))
+                print('c_d= ' + str(outputs['c_d']))
+                print('c_m= ' + str(outputs['c_m']))
+                print('c_l/c_d= ' + str(results['CL/CD']))
+                print('cfdIterations= ' + str(results['Iteration']))
+                write_to_log(str(self.executionCounter) + ','
+                             + datetime.now().strftime('%H:%M:%S') + ','
+                             + str(outputs['c_l']) + ','
+                             + str(outputs['c_d']) + ','
+                             + str(outputs['c_m']) + ','
+                             + str(results['CL/CD']) + ','
+                             + str(results['Iteration']) + ','
+                             + str(outputs['cabin_height']) + ','
+                             + str(outputs['offsetFront']) + ','
+                             + str(outputs['angle']) + ','
+                             + str(inputs['r_le']) + ','
+                             + str(inputs['beta_te']) + ','
+                             + str(inputs['x_t']) + ','
+                             + str(outputs['y_t']) + ','
+                             + str(inputs['gamma_le']) + ','
+                             + str(inputs['x_c']) + ','
+                             + str(inputs['y_c']) + ','
+                             + str(inputs['alpha_te']) + ','
+                             + str(self.bzFoil.z_te) + ','#+ str(inputs['z_te']) + ','
+                             + str(inputs['b_8']) + ','
+                             + str(inputs['b_15']) + ','
+                             + str(inputs['b_0']) + ','
+                             + str(inputs['b_17']) + ','
+                             + str(inputs['b_2']))
 
         #workaround since raising an error seems to crash the optimization
         if error:
             outputs['c_d'] = 999.
             outputs['c_l'] = 0.
             outputs['c_m'] = 0.
+        self.archive_design(projectName, cfd, outputs, error)
+        self._lastEvaluation = (self._input_values(inputs), dict((n, outputs[n]) for n in OUTPUT_NAMES), error)
+        self._adjointBaseInputs = self._input_values(inputs) if self.adjointBaseReady and not error else None
         self.executionCounter += 1
 
+    def _input_values(self, inputs):
+        return tuple(as_scalar(inputs[name]) for name in BP_INPUT_NAMES)
+
+    def _get_baseline(self, inputs):
+        # the optimizer asks for the gradient at the point it just evaluated, so that run is reused
+        if self._lastEvaluation is not None and self._lastEvaluation[0] == self._input_values(inputs):
+            return self._lastEvaluation[1], self._lastEvaluation[2]
+        outputs = dict((n, 0.) for n in OUTPUT_NAMES)
+        self.compute(inputs, outputs)
+        return self._lastEvaluation[1], self._lastEvaluation[2]
+
+    def perturb_design(self, base_values, baseline, name, h):
+        # moves one input by h and runs the cabin fit, returns (outputs, top, buttom) or None if the
+        # perturbed design is invalid
+        values = dict(base_values)
+        values[name] += h
+        self.set_bp_inputs(values)
+        self.bzFoil.y_t = as_scalar(baseline['y_t'])
+        self.bzFoil.generate_airfoil(500, show_plot=False)
+        if not self.bzFoil.valid:
+            return None
+        y_t, height, angle, offsetFront = self.fit_cabin_design()
+        top, buttom = self.bzFoil.get_cooridnates_top_buttom(500)
+        if not self.bzFoil.valid:
+            return None
+        outputs = {'y_t': y_t, 'cabin_height': height, 'angle': angle, 'offsetFront': offsetFront}
+        return outputs, top, buttom
+
+    def compute_partials(self, inputs, partials):
+        baseline, baselineError = self._get_baseline(inputs)
+        if baselineError:
+            print('WARNING: AirfoilCFD, the design itself failed, zero gradient')
+            for out in OUTPUT_NAMES:
+                for name in BP_INPUT_NAMES:
+                    partials[out, name] = 0.
+            return
+        self.gradientCounter += 1
+        baseValues = dict(zip(BP_INPUT_NAMES, self._input_values(inputs)))
+        try:
+            if self.gradientMode == 'adjoint':
+                if self.adjoint_partials(baseValues, baseline, partials):
+                    return
+                print('WARNING: AirfoilCFD, no adjoint gradient, fall back to finite differences')
+            self.fd_partials(baseValues, baseline, partials)
+        finally:
+            # compute leaves the component at the evaluated design
+            self.set_bp_inputs(baseValues)
+            self.bzFoil.y_t = as_scalar(baseline['y_t'])
+
+    def adjoint_partials(self, base_values, baseline, partials):
+        # one discrete adjoint per coefficient on the stored flow solution, chained with the shape change
+        # of every input, the cabin outputs are geometric differences, returns False if not possible
+        if self._adjointBaseInputs != tuple(base_values[name] for name in BP_INPUT_NAMES):
+            # e.g. the design came from the evaluation cache
+            return False
+        h = self.fdStep
+        projectName = PROJECT_NAME_PREFIX + '_adj_%06d' % self.gradientCounter
+        cfd = CFDrun(projectName, used_cores=self.fdCores)
+        for name in ['restart_flow.dat', 'airfoilMeshFixed.su2']:
+            shutil.copyfile(self.adjointBaseDir + '/' + name, cfd.projectDir + '/' + name)
+        cfd.meshFileName = 'airfoilMeshFixed.su2'
+        sensitivities = cfd.su2_solve_adjoint(config, columns=[column for out, column in CFD_OUTPUT_COLUMNS])
+        cfd.clean_up()
+        self.archive.add_case(projectName, cfd.persistentDir, metadata={'adjoints': sorted(sensitivities.keys())},
+                              remove_source=True, skip_patterns=['restart_flow.dat', 'airfoilMeshFixed.su2'])
+        if len(sensitivities) < len(CFD_OUTPUT_COLUMNS):
+            return False
+
+        self.set_bp_inputs(base_values)
+        self.bzFoil.y_t = as_scalar(baseline['y_t'])
+        top, buttom = self.bzFoil.get_cooridnates_top_buttom(500)
+        gradients = dict()
+        for out, column in CFD_OUTPUT_COLUMNS:
+            gradients[column] = AdjointGradient(sensitivities[column], top, buttom, scale=SCALE)
+        print('gradient ' + str(self.gradientCounter) + ': adjoint, surface points off the contour by up to '
+              + '%.2e' % max(g.maxDistance for g in gradients.values()))
+        for name in BP_INPUT_NAMES:
+            perturbedDesign = self.perturb_design(base_values, baseline, name, h)
+            if perturbedDesign is None:
+                print('WARNING: AirfoilCFD, no gradient for ' + name + ', the perturbed design is invalid')
+                for out in OUTPUT_NAMES:
+                    partials[out, name] = 0.
+                continue
+            outputs, top, buttom = perturbedDesign
+            for out in ['y_t', 'cabin_height', 'angle', 'offsetFront']:
+                partials[out, name] = (outputs[out] - as_scalar(baseline[out])) / h
+            for out, column in CFD_OUTPUT_COLUMNS:
+                partials[out, name] = gradients[column].get_derivative(top, buttom, h)
+        return True
+
+    def fd_partials(self, base_values, baseline, partials):
+        # forward differences, the cabin fit of the perturbed designs runs here, their cfd runs
+        # side by side in one batch, designs from the evaluation cache are not solved again
+        h = self.fdStep
+        # input name -> perturbed outputs, None if the perturbed design is invalid
+        perturbed = dict()
+        designs = []
+        for name in BP_INPUT_NAMES:
+            perturbed[name] = None
+            perturbedDesign = self.perturb_design(base_values, baseline, name, h)
+            if perturbedDesign is None:
+                continue
+            outputs, top, buttom = perturbedDesign
+            outputs['cacheKey'] = self.evalCache.make_key(self.get_bp_parameters(), config, self.get_mesh_settings())
+            outputs['results'] = self.evalCache.get(outputs['cacheKey'])
+            if outputs['results'] is None:
+                designs.append({'name': name, 'top': top, 'buttom': buttom, 'c2d': dict(self.meshSettings)})
+            elif outputs['results']['status'] != 'ok':
+                outputs['results'] = None
+            perturbed[name] = outputs
+
+        if len(designs) > 0:
+            print('gradient ' + str(self.gradientCounter) + ': ' + str(len(designs)) + ' perturbed design(s) to solve, '
+                  + str(len(BP_INPUT_NAMES) - len(designs)) + ' from cache or invalid')
+            batchName = PROJECT_NAME_PREFIX + '_fd_%06d' % self.gradientCounter
+            for result in evaluate_batch(designs, [config], batch_name=batchName, total_cores=self.fdCores,
+                                         cores_per_case=self.fdCoresPerCase, scale=SCALE):
+                outputs = perturbed[designs[result['design']]['name']]
+                caseName = os.path.basename(os.path.normpath(result['projectDir']))
+                valid = result['error'] == '' and CFDrun.results_valid(result['results'])
+                if valid:
+                    self.evalCache.put(outputs['cacheKey'], result['results'], config,
+                                       run_dir=self.archive.get_reference(caseName))
+                elif result['error'] == 'mesh rejected by quality gate':
+                    # only the deterministic failures, timeouts and dead workers are tried again next time
+                    self.evalCache.put(outputs['cacheKey'], result['results'], config,
+                                       run_dir=self.archive.get_reference(caseName), status='failed')
+                outputs['results'] = result['results'] if valid else None
+                if os.path.isdir(result['projectDir']):
+                    self.archive.add_case(caseName, result['projectDir'], metadata={'error': result['error']},
+                                          remove_source=True, skip_patterns=['restart_flow.dat'])
+
+        for name in BP_INPUT_NAMES:
+            outputs = perturbed[name]
+            if outputs is None:
+                print('WARNING: AirfoilCFD, no gradient for ' + name + ', the perturbed design is invalid')
+            for out in ['y_t', 'cabin_height', 'angle', 'offsetFront']:
+                partials[out, name] = 0. if outputs is None else (outputs[out] - as_scalar(baseline[out])) / h
+            for out, column in CFD_OUTPUT_COLUMNS:
+                if outputs is None or outputs['results'] is None:
+                    partials[out, name] = 0.
+                else:
+                    partials[out, name] = (as_scalar(outputs['results'][column]) - as_scalar(baseline[out])) / h
+
 
 def write_to_log(outStr):
     outStr = outStr.replace('[', '')
@@ -262,7 +580,9 @@ def write_to_log(outStr):
     outputF.close()
 
 
-def runOpenMdao():
+def runOpenMdao(optimizer='SLSQP'):
+    # optimizer of the ScipyOptimizeDriver, the gradient based ones get adjoint gradients,
+    # COBYLA never asks for a jacobian
 
     prob = Problem()
 
@@ -290,7 +610,8 @@ def runOpenMdao():
     indeps.add_output('b_2', bp.b_2)
     indeps.add_output('b_17', bp.b_17)
 
-    prob.model.add_subsystem('airfoil_cfd', AirfoilCFD())
+    gradientFree = optimizer in ['COBYLA', 'Nelder-Mead', 'Powell']
+    prob.model.add_subsystem('airfoil_cfd', AirfoilCFD(gradient_mode='none' if gradientFree else 'adjoint'))
 
     prob.model.connect('r_le', 'airfoil_cfd.r_le')
     prob.model.connect('beta_te', 'airfoil_cfd.beta_te')
@@ -311,7 +632,7 @@ def runOpenMdao():
     # setup the optimization
     prob.driver = ScipyOptimizeDriver()
     #'Nelder-Mead', 'Powell', 'CG', 'BFGS', 'Newton-CG', 'L-BFGS-B', 'TNC', 'COBYLA', 'SLSQP']
-    prob.driver.options['optimizer'] = 'COBYLA'
+    prob.driver.options['optimizer'] = optimizer
     prob.driver.options['tol'] = 1e-6
     prob.driver.options['maxiter'] = 100000
 
@@ -346,18 +667,20 @@ def runOpenMdao():
 
     prob.model.add_objective('airfoil_cfd.c_d', scaler=1)
 
-    prob.model.add_constraint('airfoil_cfd.cabin_height', lower=cabinHeigth * 0.99, upper=cabinHeigth*1.05)
-    prob.model.add_constraint('airfoil_cfd.c_l', lower=0.145, upper=.155)
-    prob.model.add_constraint('airfoil_cfd.c_m', lower=-0.05, upper=99.)
+    prob.model.add_constraint('airfoil_cfd.cabin_height', lower=cabinHeigth * CABIN_HEIGHT_LOWER, upper=cabinHeigth * CABIN_HEIGHT_UPPER)
+    prob.model.add_constraint('airfoil_cfd.c_l', lower=CL_LOWER, upper=CL_UPPER)
+    prob.model.add_constraint('airfoil_cfd.c_m', lower=CM_LOWER, upper=CM_UPPER)
 
     write_to_log('iterations,time,c_l,c_d,c_m,CL/CD,cfdIterations,cabin_height,offsetFront,angle,r_le,beta_te,x_t,y_t,gamma_le,x_c,y_c,alpha_te,z_te,b_8,b_15,b_0,b_17,b_2]))')
 
     prob.setup()
     prob.set_solver_print(level=0)
-    prob.model.approx_totals()
+    # no approx_totals, AirfoilCFD computes its own jacobian from adjoints or a parallel batch of perturbed designs
     prob.run_driver()
 
     print('done')
+    cacheStats = prob.model.airfoil_cfd.evalCache.get_stats()
+    print('evaluation cache hits: ' + str(cacheStats['hits']) + ', misses: ' + str(cacheStats['misses']))
     print('cabin frontOffset: ' + str(prob['airfoil_cfd.offsetFront']))
     print('cabin angle: ' + str(-1. * prob['airfoil_cfd.angle']) + ' deg')
 
@@ -0,0 +1,49 @@
+__author__ = "Juri Bieler"
+__version__ = "0.0.1"
+__status__ = "Development"
+
+# ==============================================================================
+# description     :shared fixtures of the tests, they run the solver stand-in
+#                  (cfd/su2Standin.py) instead of SU2
+# date            :2018-08-24
+# notes           :run from the repository root: python -m pytest -q
+# python_version  :3.6
+# ==============================================================================
+
+import os
+import sys
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+STANDIN_COMMAND = [sys.executable, os.path.join(ROOT, 'cfd', 'su2Standin.py')]
+
+
+@pytest.fixture
+def work_dir(tmp_path, monkeypatch):
+    # the config template and the mesher binaries are found relative to the repository root
+    monkeypatch.chdir(ROOT)
+    for name in ['SU2_STANDIN_DELAY', 'SU2_STANDIN_FAIL']:
+        monkeypatch.delenv(name, raising=False)
+    return str(tmp_path)
+
+
+def write_su2_mesh(file_path, points, marker_edges):
+    # mesh without elements, enough for the stand-in: points and the airfoil marker
+    f = open(file_path, 'w')
+    f.write('NDIME= 2\nNELEM= 0\nNPOIN= %d\n' % len(points))
+    for i, p in enumerate(points):
+        f.write('%.15g \t %.15g \t %d\n' % (p[0], p[1], i))
+    f.write('NMARK= 1\nMARKER_TAG= airfoil\nMARKER_ELEMS= %d\n' % len(marker_edges))
+    for a, b in marker_edges:
+        f.write('3 \t %d \t %d\n' % (a, b))
+    f.close()
+
+
+def write_script(file_path, source):
+    # executable python script, stands in for a binary the code starts by path
+    f = open(file_path, 'w')
+    f.write('#!' + sys.executable + '\n' + source)
+    f.close()
+    os.chmod(file_path, 0o755)
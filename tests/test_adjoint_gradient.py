@@ -0,0 +1,107 @@
+__author__ = "Juri Bieler"
+__version__ = "0.0.1"
+__status__ = "Development"
+
+# ==============================================================================
+# description     :surface sensitivities of the stand-in adjoint (SU2 6.x
+#                  format) through CFDrun.su2_solve_adjoint and AdjointGradient,
+#                  checked against finite differences of the made up objective
+# date            :2018-08-24
+# notes           :the stand-in objective is a factor times the airfoil area
+#                  weighted with 1 + x / xmax, in mesh units
+# python_version  :3.6
+# ==============================================================================
+
+import numpy as np
+import pytest
+
+import cfd.su2Standin as su2Standin
+from cfd.CFDrun import CFDrun
+from cfd.AdjointGradient import AdjointGradient, dual_lengths
+
+from conftest import STANDIN_COMMAND, write_su2_mesh
+
+SCALE = 2.
+
+
+def get_airfoil(thickness, aft_thickness, camber=0.02, point_count=200):
+    # closed naca like section, top from leading to trailing edge, buttom back
+    x = (1. - np.cos(np.linspace(0., np.pi, point_count))) / 2.
+    yt = 5. * thickness * (0.2969 * np.sqrt(x) - 0.126 * x - 0.3516 * x ** 2 + 0.2843 * x ** 3 - 0.1036 * x ** 4) \
+         + aft_thickness * x ** 2 * (1. - x)
+    yc = 4. * camber * x * (1. - x)
+    return np.column_stack((x, yc + yt)), np.column_stack((x[::-1], (yc - yt)[::-1]))
+
+
+def write_airfoil_mesh(file_path, top, buttom, point_count=101):
+    # coarser surface points than the contour, like a real mesh
+    s = (1. - np.cos(np.linspace(0., np.pi, point_count))) / 2.
+    surfaceTop = np.column_stack((s, np.interp(s, top[:, 0], top[:, 1])))
+    surfaceButtom = np.column_stack((s[::-1], np.interp(s[::-1], buttom[::-1, 0], buttom[::-1, 1])))[1:-1]
+    points = np.vstack((surfaceTop, surfaceButtom)) * SCALE
+    edges = [(i, (i + 1) % len(points)) for i in range(0, len(points))]
+    write_su2_mesh(file_path, points, edges)
+
+
+def weighted_area(top, buttom):
+    # objective of the stand-in in mesh units, xmax is the trailing edge at x = 1
+    contour = np.vstack((top, buttom)) * SCALE
+    x, y = contour[:, 0], contour[:, 1]
+    xNext, yNext = np.roll(x, -1), np.roll(y, -1)
+    cross = x * yNext - xNext * y
+    area = 0.5 * np.sum(cross)
+    moment = np.sum((x + xNext) * cross) / 6.
+    return abs(area + moment / SCALE)
+
+
+@pytest.fixture
+def sensitivities(work_dir, monkeypatch):
+    monkeypatch.setattr('cfd.CFDrun.WORKING_DIR', work_dir)
+    top, buttom = get_airfoil(0.12, 0.)
+    cfd = CFDrun('adjoint', used_cores=1, scratch_dir=None)
+    cfd.su2.adjointCommand = STANDIN_COMMAND
+    write_airfoil_mesh(cfd.projectDir + '/' + cfd.meshFileName, top, buttom)
+    open(cfd.projectDir + '/restart_flow.dat', 'w').close()
+    return cfd.su2_solve_adjoint({'EXT_ITER': 20}), top, buttom
+
+
+def test_surface_adjoint_is_su2_6_density(sensitivities):
+    sens, top, buttom = sensitivities
+    assert sorted(sens.keys()) == ['CD', 'CL', 'CMz']
+    drag = sens['CD']
+    assert 'sensX' not in drag
+    assert len(drag['point']) == 2 * 101 - 2
+    # the dual lengths of a closed marker add up to its perimeter
+    perimeter = np.sum(np.linalg.norm(np.diff(np.column_stack((drag['x'], drag['y']))[np.argsort(drag['point'])],
+                                              axis=0, append=[[drag['x'][0], drag['y'][0]]]), axis=1))
+    assert np.sum(drag['length']) == pytest.approx(perimeter, rel=1e-9)
+    # density along the inward normal, a positive factor gives negative values
+    assert np.all(drag['sens'] < 0.)
+
+
+@pytest.mark.parametrize('column', ['CD', 'CL', 'CMz'])
+def test_adjoint_gradient_matches_finite_differences(sensitivities, column):
+    sens, top, buttom = sensitivities
+    factor = su2Standin.ADJOINT_AREA_FACTORS[{'CD': 'DRAG', 'CL': 'LIFT', 'CMz': 'MOMENT_Z'}[column]]
+    gradient = AdjointGradient(sens[column], top, buttom, scale=SCALE)
+    assert gradient.maxDistance < 1e-2
+    h = 1e-4
+    for thickness, aftThickness in [(0.12 + h, 0.), (0.12, h)]:
+        perturbedTop, perturbedButtom = get_airfoil(thickness, aftThickness)
+        adjoint = gradient.get_derivative(perturbedTop, perturbedButtom, h)
+        finiteDifference = factor * (weighted_area(perturbedTop, perturbedButtom) - weighted_area(top, buttom)) / h
+        assert adjoint == pytest.approx(finiteDifference, rel=1e-2)
+
+
+def test_density_needs_dual_lengths(sensitivities):
+    sens, top, buttom = sensitivities
+    drag = dict(sens['CD'])
+    del drag['length']
+    with pytest.raises(ValueError):
+        AdjointGradient(drag, top, buttom, scale=SCALE)
+
+
+def test_dual_lengths_of_a_square():
+    points = [(0., 0.), (2., 0.), (2., 2.), (0., 2.), (5., 5.)]
+    lengths = dual_lengths(points, [(0, 1), (1, 2), (2, 3), (3, 0)])
+    assert np.allclose(lengths, [2., 2., 2., 2., 0.])
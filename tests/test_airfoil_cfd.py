@@ -0,0 +1,156 @@
+__author__ = "Juri Bieler"
+__version__ = "0.0.1"
+__status__ = "Development"
+
+# ==============================================================================
+# description     :AirfoilCFD of bwbAirfoilOptimizerV4 in adjoint mode, compute
+#                  and compute_partials run the whole chain on stand-ins for
+#                  construct2d, mpiexec, SU2_CFD and SU2_CFD_AD
+# date            :2018-08-25
+# python_version  :3.6
+# ==============================================================================
+
+import os
+import numpy as np
+import pytest
+
+pytest.importorskip('openmdao')
+from openmdao.api import Problem
+
+import optimization.bwbAirfoilOptimizerV4 as optimizer
+
+from conftest import ROOT, write_script
+
+# construct2d stand-in, answers every menu step and writes an algebraic c-grid of the airfoil.dat
+FAKE_CONSTRUCT2D = r'''import sys
+import math
+
+def write_grid(dat_file, farfield_radius, wake_points=20, layers=30):
+    # algebraic c-grid: wake, airfoil contour and wake again on the first grid line, straight
+    # lines with growing spacing out to a c shaped farfield
+    f = open(dat_file, 'r')
+    surface = [tuple(float(v) for v in line.split()) for line in f.read().splitlines()[1:] if len(line.split()) == 2]
+    f.close()
+    xTe, yTe = surface[0]
+    wake = [(xTe + farfield_radius * (k / wake_points) ** 1.5, yTe) for k in range(1, wake_points + 1)]
+    inner = wake[::-1] + surface + wake
+    leading = min(range(0, len(surface)), key=lambda k: surface[k][0])
+    # the contour may start on either side
+    first = 1. if sum(p[1] for p in surface[:leading]) / leading > sum(p[1] for p in surface[leading:]) / (len(surface) - leading) else -1.
+    outer = [(x, first * farfield_radius) for x, y in wake[::-1]]
+    for k, (xs, ys) in enumerate(surface):
+        side = first if k <= leading else -first
+        if xs >= 0.1:
+            outer.append((xs, side * farfield_radius))
+        else:
+            # half circle around the front, rays from its center do not cross
+            angle = math.atan2(ys, xs - 0.1) % (2. * math.pi)
+            outer.append((0.1 + farfield_radius * math.cos(angle), farfield_radius * math.sin(angle)))
+    outer += [(x, -first * farfield_radius) for x, y in wake]
+    x = []
+    y = []
+    for j in range(0, layers):
+        s = (math.exp(6. * j / (layers - 1)) - 1.) / (math.exp(6.) - 1.)
+        x += [a[0] + s * (b[0] - a[0]) for a, b in zip(inner, outer)]
+        y += [a[1] + s * (b[1] - a[1]) for a, b in zip(inner, outer)]
+    f = open(dat_file.replace('.dat', '.p3d'), 'w')
+    f.write('%d %d\n' % (len(inner), layers))
+    f.write('\n'.join('%.12e' % v for v in x + y) + '\n')
+    f.close()
+
+
+datFile = None
+radius = 15.
+previous = ''
+smoothed = False
+print('construct2d stand-in, QUIT', flush=True)
+for line in sys.stdin:
+    answer = line.strip()
+    if datFile is None:
+        datFile = answer
+    elif previous == 'RADI':
+        radius = float(answer)
+    elif answer == 'GRID':
+        write_grid(datFile, radius)
+    elif answer == 'SMTH':
+        smoothed = True
+    elif answer == 'QUIT' and smoothed:
+        break
+    previous = answer
+    print('Current Sharp QUIT', flush=True)
+'''
+
+# mpiexec stand-in, runs the command once, the solver stand-in is rank 0
+FAKE_MPIEXEC = '''import os
+import sys
+args = sys.argv[1:]
+while args[0].startswith('-'):
+    args = args[2:]
+os.execv(args[0], args)
+'''
+
+FAKE_SU2 = '''import sys
+import runpy
+sys.argv = [%r] + sys.argv[1:]
+runpy.run_path(%r, run_name='__main__')
+'''
+
+
+@pytest.fixture
+def component(work_dir, monkeypatch):
+    outDir = work_dir + '/out/'
+    binDir = work_dir + '/bin'
+    os.makedirs(outDir)
+    os.makedirs(binDir)
+    standinPath = os.path.join(ROOT, 'cfd', 'su2Standin.py')
+    write_script(binDir + '/construct2d', FAKE_CONSTRUCT2D)
+    write_script(binDir + '/mpiexec', FAKE_MPIEXEC)
+    for name in ['SU2_CFD', 'SU2_CFD_AD']:
+        write_script(binDir + '/' + name, FAKE_SU2 % (standinPath, standinPath))
+    monkeypatch.setattr('cfd.CFDrun.WORKING_DIR', outDir)
+    monkeypatch.setattr('cfd.CFDrun.SU2_BIN_PATH', binDir)
+    monkeypatch.setattr('cfd.CFDrun.CONSTRUCT2D_EXE_PATH', binDir + '/construct2d')
+    monkeypatch.setattr('cfd.CFDrun.OS_MPI_COMMAND', binDir + '/mpiexec')
+    # keep the reports of openmdao out of the repo
+    monkeypatch.setenv('OPENMDAO_REPORTS', '0')
+    monkeypatch.setenv('OPENMDAO_WORKDIR', work_dir)
+    monkeypatch.setattr(optimizer, 'WORKING_DIR', outDir)
+    monkeypatch.setattr(optimizer, 'LOG_FILE_PATH', outDir + '/om_iterations.csv')
+    # long enough for the stand-in to meet the residual criterion of dataIn/default.cfg from a cold start
+    monkeypatch.setitem(optimizer.config, 'EXT_ITER', 8000)
+    assert 'RESIDUAL_REDUCTION' not in optimizer.config
+
+    def no_finite_differences(*args, **kwargs):
+        raise AssertionError('finite differences instead of adjoints')
+    monkeypatch.setattr(optimizer, 'evaluate_batch', no_finite_differences)
+
+    prob = Problem()
+    prob.model.add_subsystem('airfoil_cfd', optimizer.AirfoilCFD(gradient_mode='adjoint'), promotes=['*'])
+    prob.setup()
+    prob.set_solver_print(level=0)
+    return prob
+
+
+def test_adjoint_mode_compute_and_partials(component):
+    prob = component
+    prob.run_model()
+    airfoilCFD = prob.model.airfoil_cfd
+    assert 0. < prob['c_d'][0] < 100.
+    # the run ended on the residual criterion of the template, so it is the adjoint base
+    assert airfoilCFD.adjointBaseReady
+    assert os.path.isfile(airfoilCFD.adjointBaseDir + '/restart_flow.dat')
+
+    totals = prob.compute_totals(of=['c_d', 'c_l', 'c_m'], wrt=['r_le', 'x_t'])
+    assert airfoilCFD.gradientCounter == 1
+    for value in totals.values():
+        assert np.all(np.isfinite(value))
+    assert np.any([np.any(value != 0.) for value in totals.values()])
+
+
+def test_adjoint_mode_unconverged_primal_is_no_base(component, monkeypatch):
+    # the run stops at EXT_ITER before the residual dropped by RESIDUAL_REDUCTION orders
+    monkeypatch.setitem(optimizer.config, 'EXT_ITER', 2000)
+    prob = component
+    prob.run_model()
+    assert 0. < prob['c_d'][0] < 100.
+    assert not prob.model.airfoil_cfd.adjointBaseReady
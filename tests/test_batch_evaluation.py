@@ -0,0 +1,71 @@
+__author__ = "Juri Bieler"
+__version__ = "0.0.1"
+__status__ = "Development"
+
+# ==============================================================================
+# description     :BatchEvaluator core budget with a worker that dies hard and
+#                  a case that is retried, on a fake case function
+# date            :2018-08-25
+# notes           :the pools are forked, so the patched evaluate_case reaches
+#                  the workers
+# python_version  :3.6
+# ==============================================================================
+
+import os
+import time
+import threading
+
+import cfd.BatchEvaluation as batchEvaluation
+from cfd.BatchEvaluation import BatchEvaluator, failed_result
+
+
+def fake_evaluate_case(case):
+    time.sleep(0.2)
+    design = case['designDef']
+    if design.get('crash', False) and case['attempt'] == 0:
+        # takes the pool down like a segfaulting solver
+        os._exit(1)
+    if design.get('flaky', False) and case['attempt'] == 0:
+        result = failed_result(case, 'invalid results (cd out of range)')
+        result['final'] = False
+        return result
+    return failed_result(case, '')
+
+
+class CountingExecutor(batchEvaluation.ProcessPoolExecutor):
+    # counts the cases submitted to any pool that have no result yet
+    lock = threading.Lock()
+    outstanding = 0
+    peak = 0
+
+    def submit(self, fn, *args, **kwargs):
+        with CountingExecutor.lock:
+            CountingExecutor.outstanding += 1
+            CountingExecutor.peak = max(CountingExecutor.peak, CountingExecutor.outstanding)
+        future = super().submit(fn, *args, **kwargs)
+        future.add_done_callback(CountingExecutor.case_done)
+        return future
+
+    @staticmethod
+    def case_done(future):
+        with CountingExecutor.lock:
+            CountingExecutor.outstanding -= 1
+
+
+def test_isolated_and_shared_cases_share_the_core_budget(work_dir, monkeypatch):
+    monkeypatch.setattr(batchEvaluation, 'WORKING_DIR', work_dir)
+    monkeypatch.setattr(batchEvaluation, 'evaluate_case', fake_evaluate_case)
+    monkeypatch.setattr(batchEvaluation, 'ProcessPoolExecutor', CountingExecutor)
+    designs = [{'name': 'crash', 'crash': True}, {'name': 'flaky', 'flaky': True}] \
+              + [{'name': 'plain%d' % i} for i in range(0, 6)]
+    evaluator = BatchEvaluator('budget', total_cores=3, cores_per_case=1)
+    results = list(evaluator.evaluate(designs, [dict()]))
+
+    assert sorted(r['design'] for r in results) == list(range(0, len(designs)))
+    assert all(r['error'] == '' for r in results)
+    attempts = dict((designs[r['design']]['name'], r['attempt']) for r in results)
+    assert attempts['crash'] == 1
+    assert attempts['flaky'] == 1
+    # suspects of the broken pool, retries and fresh cases never ran on more than the 3 workers
+    assert CountingExecutor.peak <= evaluator.get_worker_count()
+    assert CountingExecutor.outstanding == 0
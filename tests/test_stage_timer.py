@@ -0,0 +1,46 @@
+__author__ = "Juri Bieler"
+__version__ = "0.0.1"
+__status__ = "Development"
+
+# ==============================================================================
+# description     :StageTimer flags stages that ran at the same time as another
+#                  one, their process wide cpu and memory figures are shared
+# date            :2018-08-25
+# python_version  :3.6
+# ==============================================================================
+
+import json
+import threading
+
+from cfd.StageTimer import StageTimer, load_stage_csv
+
+
+def test_concurrent_stages_are_flagged_overlapping(work_dir):
+    csvPath = work_dir + '/stage_times.csv'
+    first = StageTimer('first', manifest_path=work_dir + '/first.json', csv_path=csvPath)
+    second = StageTimer('second', csv_path=csvPath)
+    entered = threading.Event()
+    release = threading.Event()
+
+    def run_second():
+        with second.stage('su2_cfd'):
+            entered.set()
+            release.wait(10.)
+
+    with first.stage('construct2d'):
+        pass
+    with first.stage('su2_fix_mesh'):
+        thread = threading.Thread(target=run_second)
+        thread.start()
+        entered.wait(10.)
+    release.set()
+    thread.join()
+    with first.stage('parse'):
+        pass
+
+    rows = dict((r['run'] + '/' + r['stage'], r['overlapping']) for r in load_stage_csv(csvPath))
+    assert rows == {'first/construct2d': False, 'first/su2_fix_mesh': True,
+                    'second/su2_cfd': True, 'first/parse': False}
+    manifest = json.load(open(work_dir + '/first.json', 'r'))
+    assert [s['overlapping'] for s in manifest['stages']] == [False, True, False]
+    assert manifest['totals']['overlapping']
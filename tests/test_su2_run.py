@@ -0,0 +1,92 @@
+__author__ = "Juri Bieler"
+__version__ = "0.0.1"
+__status__ = "Development"
+
+# ==============================================================================
+# description     :SU2.run_cfd on the stand-in solver with the convergence
+#                  monitor stopping or killing it, SolverScheduler core plan
+# date            :2018-08-24
+# python_version  :3.6
+# ==============================================================================
+
+from cfd.SU2 import SU2
+from cfd.ConvergenceMonitor import ConvergenceMonitor, SolverDivergedError
+from cfd.SolverScheduler import SolverScheduler
+
+from conftest import STANDIN_COMMAND, write_su2_mesh
+
+
+def make_su2(work_dir, monitor):
+    write_su2_mesh(work_dir + '/mesh.su2', [(0., 0.), (1., 0.), (0., 1.)], [(0, 1), (1, 2), (2, 0)])
+    # the restart starts close to the converged state, so the coefficients settle within a few hundred iterations
+    open(work_dir + '/solution_flow.dat', 'w').close()
+    su2 = SU2('.', used_cores=1)
+    su2.cfdCommand = STANDIN_COMMAND
+    su2.outputProfile = 'lean'
+    su2.monitor = monitor
+    return su2
+
+
+def make_monitor():
+    monitor = ConvergenceMonitor()
+    monitor.minIterations = 100
+    monitor.cauchyWindow = 50
+    monitor.cauchyEps = 1e-4
+    monitor.pollInterval = 0.05
+    return monitor
+
+
+def read_restart_iterations(file_path):
+    f = open(file_path, 'r')
+    lines = f.read().splitlines()
+    f.close()
+    return int(lines[-1].split('=')[1])
+
+
+def test_monitor_stops_converged_run(work_dir, monkeypatch):
+    monkeypatch.setenv('SU2_STANDIN_DELAY', '0.002')
+    monitor = make_monitor()
+    su2 = make_su2(work_dir, monitor)
+    stopReason = su2.run_cfd('mesh.su2', {'EXT_ITER': 3000, 'RESTART_SOL': True}, working_dir=work_dir)
+    assert stopReason.startswith('cauchy converged')
+    assert su2.lastResult.status == 'converged'
+    assert su2.failure is None
+    assert 100 <= monitor.stopIteration < 1000
+    assert su2.lastResult.iterations < 3000
+
+
+def test_converged_run_ends_on_residual_criterion(work_dir, monkeypatch):
+    monkeypatch.setenv('SU2_STANDIN_DELAY', '0.001')
+    monitor = make_monitor()
+    monitor.stopWhenConverged = False
+    su2 = make_su2(work_dir, monitor)
+    su2.run_cfd('mesh.su2', {'EXT_ITER': 3000, 'RESTART_SOL': True}, working_dir=work_dir)
+    assert su2.lastResult.status == 'finished'
+    residual = monitor.get_column(monitor.residualField)
+    assert residual.max() - residual[-1] >= 9.
+    # the restart file is the one of the last iteration
+    assert read_restart_iterations(work_dir + '/restart_flow.dat') == len(residual)
+    assert len(residual) < 3000
+
+
+def test_monitor_kills_diverged_run(work_dir, monkeypatch):
+    monkeypatch.setenv('SU2_STANDIN_DELAY', '0.002')
+    monkeypatch.setenv('SU2_STANDIN_FAIL', 'diverge')
+    monitor = make_monitor()
+    su2 = make_su2(work_dir, monitor)
+    su2.run_cfd('mesh.su2', {'EXT_ITER': 3000, 'RESTART_SOL': True}, working_dir=work_dir)
+    assert su2.lastResult.status == 'diverged'
+    assert isinstance(su2.failure, SolverDivergedError)
+    assert monitor.stopIteration < 1000
+
+
+def test_scheduler_plan_stays_within_core_budget():
+    scheduler = SolverScheduler(total_cores=6, min_points_per_core=1000)
+    # a 4 and a 1 core job leave one spare core, it goes to the wider one
+    assert scheduler.plan([4000, 1000]) == [5, 1]
+    assert scheduler.plan([1000, 1000, 1000, 1000]) == [2, 2, 1, 1]
+    assert scheduler.plan([500]) == [6]
+    # more jobs than fit side by side keep their own widths
+    assert scheduler.plan([6000, 3000]) == [6, 3]
+    for pointCounts in [[4000, 1000], [2000, 1000, 1000], [1000] * 5, [3000, 3000]]:
+        assert sum(scheduler.plan(pointCounts)) == 6
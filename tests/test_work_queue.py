@@ -0,0 +1,167 @@
+__author__ = "Juri Bieler"
+__version__ = "0.0.1"
+__status__ = "Development"
+
+# ==============================================================================
+# description     :WorkQueue lease expiry and requeue with in process workers
+#                  on the solver stand-in and a fake gmsh
+# date            :2018-08-24
+# notes           :the case processes are forked, so the patched WORKING_DIR
+#                  reaches them
+# python_version  :3.6
+# ==============================================================================
+
+import os
+import sys
+import time
+import threading
+
+import pytest
+
+from cfd.WorkQueue import WorkQueue, QueueWorker
+
+from conftest import STANDIN_COMMAND
+
+# gmsh stand-in, writes the same two triangle mesh for every geometry
+FAKE_GMSH = '''#!%s
+import sys
+out = sys.argv[sys.argv.index('-o') + 1]
+open(out, 'w').write("""NDIME= 2
+NELEM= 2
+5 0 1 2 0
+5 0 2 3 1
+NPOIN= 4
+0 0 0
+1 0 1
+1 1 2
+0 1 3
+NMARK= 2
+MARKER_TAG= airfoil
+MARKER_ELEMS= 3
+3 0 1
+3 1 2
+3 2 0
+MARKER_TAG= farfield
+MARKER_ELEMS= 3
+3 2 3
+3 3 0
+3 0 2
+""")
+'''
+
+
+@pytest.fixture
+def queue(work_dir, monkeypatch):
+    outDir = work_dir + '/out/'
+    os.makedirs(outDir)
+    monkeypatch.setattr('cfd.BatchEvaluation.WORKING_DIR', outDir)
+    monkeypatch.setattr('cfd.CFDrun.WORKING_DIR', outDir)
+    gmshPath = work_dir + '/gmsh'
+    f = open(gmshPath, 'w')
+    f.write(FAKE_GMSH % sys.executable)
+    f.close()
+    os.chmod(gmshPath, 0o755)
+    queue = WorkQueue(work_dir + '/queue')
+    queue.leaseTimeout = 0.3
+    queue.pollInterval = 0.1
+    design = {'file': 'dataIn/naca641-212.csv', 'name': 'n0', 'gmsh': {'gmshPath': gmshPath}}
+    queue.jobIds = queue.submit_batch([design], [{'EXT_ITER': 2000}], batch_name='wq', mesher='gmsh',
+                                      meshQualityGate='off', solverCommand=STANDIN_COMMAND)
+    return queue
+
+
+def make_worker(queue, worker_id):
+    worker = QueueWorker(queue.queueDir, worker_id=worker_id)
+    worker.heartbeatInterval = 0.1
+    worker.queue.pollInterval = 0.1
+    return worker
+
+
+def expire_leases(queue):
+    # the first scan only records the heartbeats
+    assert queue.requeue_expired() == 0
+    time.sleep(queue.leaseTimeout + 0.1)
+    return queue.requeue_expired()
+
+
+def test_lost_worker_job_is_requeued(queue):
+    job, runningPath = make_worker(queue, 'dead').claim()
+    assert expire_leases(queue) == 1
+    assert not os.path.isfile(runningPath)
+    assert queue.get_status()['pending'] == 1
+    worker = make_worker(queue, 'live')
+    worker.run(max_jobs=1)
+    results = list(queue.collect(queue.jobIds, timeout=10))
+    assert len(results) == 1
+    result = results[0]
+    assert result['error'] == ''
+    assert float(result['results']['CD']) > 0.
+    assert result['worker'] == 'live'
+    assert result['queueAttempt'] == 1
+    # the retry does not share the project dir of the lost attempt
+    assert result['projectDir'].endswith('_attempt1')
+    assert queue.get_status() == {'pending': 0, 'running': 0, 'done': 1, 'workers': []}
+
+
+def test_job_given_up_after_max_attempts(queue):
+    queue.maxAttempts = 1
+    make_worker(queue, 'dead').claim()
+    assert expire_leases(queue) == 1
+    result = queue.get_result(queue.jobIds[0])
+    assert result['error'].startswith('worker lost')
+    assert result['worker'] == 'dead'
+    assert queue.get_status()['pending'] == 0
+
+
+def test_worker_stops_case_when_lease_is_lost(queue, monkeypatch):
+    monkeypatch.setenv('SU2_STANDIN_DELAY', '0.01')
+    worker = make_worker(queue, 'slow')
+    job, runningPath = worker.claim()
+    historyPath = queue.queueDir + '/../out/wq_n0_c00/history.vtk'
+
+    def requeue_while_running():
+        # a broker that wrongly took the lease as expired, e.g. a stalled file system
+        startTime = time.time()
+        while not os.path.isfile(historyPath) and time.time() - startTime < 30.:
+            time.sleep(0.05)
+        queue._requeue(runningPath)
+
+    broker = threading.Thread(target=requeue_while_running)
+    broker.start()
+    assert worker.run_job(job, runningPath) is None
+    broker.join()
+    # the solver of the killed case does not write anymore
+    size = os.path.getsize(historyPath)
+    time.sleep(0.3)
+    assert os.path.getsize(historyPath) == size
+    assert queue.get_result(job['id']) is None
+    assert queue.get_status()['pending'] == 1
+
+    monkeypatch.setenv('SU2_STANDIN_DELAY', '0')
+    make_worker(queue, 'fast').run(max_jobs=1)
+    result = queue.get_result(job['id'])
+    assert result['worker'] == 'fast'
+    assert result['error'] == ''
+    assert result['queueAttempt'] == 1
+
+
+def test_dotted_job_id_keeps_its_worker(queue):
+    design = {'file': 'dataIn/naca641-212.csv', 'name': 'naca641.212'}
+    dottedId = queue.submit_batch([design], [{'EXT_ITER': 2000}], batch_name='wq.v2')[0]
+    assert dottedId == 'wq.v2_naca641.212_c00'
+    queue.maxAttempts = 1
+    worker = make_worker(queue, 'dead-1')
+    claimed = [worker.claim(), worker.claim()]
+    assert sorted(job['id'] for job, runningPath in claimed) == sorted(queue.jobIds + [dottedId])
+    assert queue.get_status()['workers'] == ['dead-1']
+    assert expire_leases(queue) == 2
+    result = queue.get_result(dottedId)
+    assert result['error'] == 'worker lost (last: dead-1)'
+    assert result['worker'] == 'dead-1'
+
+
+def test_file_name_unsafe_ids_are_rejected(queue):
+    with pytest.raises(ValueError):
+        queue.submit({'projectName': '../escape'})
+    with pytest.raises(ValueError):
+        QueueWorker(queue.queueDir, worker_id='node.1')